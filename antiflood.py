@@ -0,0 +1,87 @@
+# antiflood.py - Límite de updates por usuario antes de despachar los handlers
+import logging
+import time
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop
+
+from envios import Cubeta, CubetasRecientes
+from metricas import Metricas
+
+logger = logging.getLogger(__name__)
+
+class _CubetaUsuario(Cubeta):
+    """Cubeta de un usuario con el momento de su último aviso"""
+
+    __slots__ = ("avisado",)
+
+    def __init__(self, tasa, capacidad):
+        super().__init__(tasa, capacidad)
+        self.avisado = float("-inf")
+
+# =====================================================
+# LIMITADOR DE UPDATES
+# =====================================================
+class LimitadorUpdates:
+    """Descarta los updates de quien escribe o pulsa botones demasiado rápido.
+
+    Va en un grupo de handlers anterior a todos los demás: cada update
+    necesita un token de la cubeta de su usuario (`por_seg` con ráfagas de
+    `rafaga`) y otro de la cubeta global (`global_por_seg`). Si falta
+    alguno, el update no llega a ningún handler. Las cubetas de usuario
+    viven en un LRU de `max_usuarios` entradas, así la memoria no crece con
+    cada visitante; la que se descarta es la del usuario más inactivo, que
+    ya estaría llena.
+
+    Al primer descarte de cada `aviso_cada` segundos se llama a
+    `avisar(bot, update)` si se indicó; el resto se descartan en silencio.
+    Los usuarios de `exentos` no tienen límite.
+    """
+
+    def __init__(self, por_seg, rafaga, global_por_seg, max_usuarios=10000,
+                 aviso_cada=30, avisar=None, exentos=(), metricas=None):
+        self.por_seg = por_seg
+        self.rafaga = rafaga
+        self.max_usuarios = max_usuarios
+        self.aviso_cada = aviso_cada
+        self.avisar = avisar
+        self.exentos = set(exentos)
+
+        self._global = Cubeta(global_por_seg, global_por_seg)
+        self._usuarios = CubetasRecientes(self._nueva_cubeta_usuario, max_usuarios)
+
+        metricas = metricas or Metricas()
+        self._descartados = metricas.contador(
+            "gamedin_updates_descartados_total", "Updates descartados por exceder el límite", ("motivo",)
+        )
+        metricas.funcion(
+            "gamedin_limitador_usuarios", "Usuarios con cubeta en el limitador", lambda: len(self._usuarios)
+        )
+
+    def _nueva_cubeta_usuario(self, user_id):
+        return _CubetaUsuario(self.por_seg, self.rafaga)
+
+    async def filtrar(self, update: Update, context):
+        """Handler del primer grupo: deja pasar el update o corta su despacho"""
+        usuario = update.effective_user
+        if usuario is None or usuario.id in self.exentos:
+            return
+
+        ahora = time.monotonic()
+        cubeta = self._usuarios.obtener(usuario.id)
+        if cubeta.espera(ahora) > 0:
+            motivo = "usuario"
+        elif self._global.espera(ahora) > 0:
+            motivo = "global"
+        else:
+            cubeta.consumir()
+            self._global.consumir()
+            return
+
+        self._descartados.sumar(motivo)
+        if ahora - cubeta.avisado >= self.aviso_cada:
+            cubeta.avisado = ahora
+            logger.warning(f"Updates del usuario {usuario.id} descartados por límite ({motivo})")
+            if self.avisar is not None:
+                self.avisar(context.bot, update)
+        raise ApplicationHandlerStop
@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks de las rutas calientes del bot, sin Telegram.
+
+Mide el armado de textos y teclados de los handlers del checkout, la
+memoria y la persistencia de las sesiones y las operaciones de
+DatabaseManager que usan el flujo de compra y los comandos de
+administración, estas sobre tablas sintéticas de varios tamaños. Los
+resultados se guardan en JSON y se comparan con una línea base: termina
+con código 1 si alguna medición empeora más que la tolerancia.
+
+Las tablas se generan una vez (deterministas, mismas filas en cada
+máquina) y se reutilizan entre ejecuciones desde --datos.
+
+Uso:
+    python benchmarks.py --salida base.json
+    python benchmarks.py --base base.json --tolerancia 0.25
+    python benchmarks.py --filas 10000 --solo db.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import pickle
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+
+FILAS_POR_DEFECTO = (10_000, 1_000_000, 10_000_000)
+
+# Periodo que cubren las fechas sintéticas: el año anterior al 2025-01-01 UTC
+INICIO_DATOS_MS = 1_704_067_200_000
+FIN_DATOS_MS = 1_735_689_600_000
+
+# Tablas que guardar_pedido modifica; se restauran después de medirlo
+TABLAS_AGREGADOS = ("ventas_por_producto", "ventas_por_hora", "ventas_por_dia")
+
+# =====================================================
+# MEDICIÓN
+# =====================================================
+def medir(funcion, repeticiones=7, minimo=0.2):
+    """Mide una función síncrona con timeit.
+
+    Se calibra cuántas llamadas ocupan al menos `minimo` segundos y se
+    repite esa tanda `repeticiones` veces. Se guardan la mediana y el
+    mínimo por llamada.
+    """
+    temporizador = timeit.Timer(funcion)
+    numero, _ = temporizador.autorange()
+    numero = max(1, int(numero * minimo / 0.2))
+    tandas = [duracion / numero for duracion in temporizador.repeat(repeticiones, numero)]
+    return _resultado(tandas, numero * repeticiones)
+
+async def medir_async(funcion, repeticiones=7, minimo=0.2):
+    """Como `medir` pero para una corrutina: cada llamada se espera antes de la siguiente"""
+    async def tanda(numero):
+        inicio = time.perf_counter()
+        for _ in range(numero):
+            await funcion()
+        return time.perf_counter() - inicio
+
+    numero = 1
+    while (duracion := await tanda(numero)) < minimo / 10:
+        numero *= 10
+    numero = max(1, int(numero * minimo / duracion))
+    tandas = [await tanda(numero) / numero for _ in range(repeticiones)]
+    return _resultado(tandas, numero * repeticiones)
+
+async def medir_concurrencia(funcion, concurrencia, repeticiones=7, minimo=0.2):
+    """Como `medir_async` con `concurrencia` llamadores a la vez, cada uno
+    esperando su llamada antes de la siguiente; el tiempo es por llamada"""
+    async def llamador(numero):
+        for _ in range(numero):
+            await funcion()
+
+    async def tanda(numero):
+        inicio = time.perf_counter()
+        await asyncio.gather(*(llamador(numero) for _ in range(concurrencia)))
+        return time.perf_counter() - inicio
+
+    numero = 1
+    while (duracion := await tanda(numero)) < minimo / 10:
+        numero *= 10
+    numero = max(1, int(numero * minimo / duracion))
+    tandas = [await tanda(numero) / (numero * concurrencia) for _ in range(repeticiones)]
+    return _resultado(tandas, numero * concurrencia * repeticiones)
+
+def medir_memoria(crear, cuantos):
+    """Bytes que retienen `cuantos` objetos creados con `crear(i)`, según tracemalloc.
+
+    No cuenta la lista que los guarda ni nada creado antes de empezar.
+    """
+    objetos = [None] * cuantos
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.get_traced_memory()[0]
+        for i in range(cuantos):
+            objetos[i] = crear(i)
+        total = tracemalloc.get_traced_memory()[0] - antes
+    finally:
+        tracemalloc.stop()
+    return {"bytes": total, "bytes_por_objeto": round(total / cuantos, 1), "iteraciones": cuantos}
+
+def _resultado(tandas, iteraciones):
+    return {
+        "mediana_us": round(statistics.median(tandas) * 1e6, 3),
+        "min_us": round(min(tandas) * 1e6, 3),
+        "iteraciones": iteraciones,
+    }
+
+# =====================================================
+# TABLAS SINTÉTICAS
+# =====================================================
+def _sql_generar(skus):
+    """INSERT que genera `:filas` pedidos sin azar: el mismo número da las mismas filas"""
+    def texto(valor):
+        return "'" + str(valor).replace("'", "''") + "'"
+
+    valores = ", ".join(
+        f"({i}, {texto(producto)}, {texto(cantidad)}, {int(precio)})"
+        for i, (producto, cantidad, precio) in enumerate(skus)
+    )
+    return f'''
+        INSERT INTO pedidos (user_id, username, producto, cantidad, id_juego,
+                             nombre_cliente, contacto_cliente, precio, fecha, estado)
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :filas),
+        skus(k, producto, cantidad, precio) AS (VALUES {valores})
+        SELECT
+            1 + (i * 48271) % (:filas / 10 + 1),
+            'cliente' || (1 + (i * 48271) % (:filas / 10 + 1)),
+            skus.producto, skus.cantidad,
+            CAST(10000000 + (i * 7919) % 90000000 AS TEXT),
+            'Cliente ' || i, '+52 55 ' || printf('%08d', i), skus.precio,
+            {INICIO_DATOS_MS} + (i - 1) * ({FIN_DATOS_MS - INICIO_DATOS_MS} / :filas),
+            CASE (i * 31) % 20
+                WHEN 0 THEN 'cancelado' WHEN 1 THEN 'cancelado'
+                WHEN 2 THEN 'pendiente' WHEN 3 THEN 'pendiente' WHEN 4 THEN 'pendiente'
+                WHEN 5 THEN 'pendiente' WHEN 6 THEN 'pendiente'
+                WHEN 7 THEN 'pagado' WHEN 8 THEN 'pagado' WHEN 9 THEN 'pagado'
+                WHEN 10 THEN 'pagado' WHEN 11 THEN 'pagado'
+                ELSE 'entregado'
+            END
+        FROM n JOIN skus ON skus.k = (i * 7919) % {len(skus)}
+    '''
+
+async def preparar_datos(directorio, filas, skus):
+    """Devuelve la ruta de una base con `filas` pedidos, generándola si no existe"""
+    from database import DatabaseManager
+
+    ruta = os.path.join(directorio, f"pedidos_{filas}.db")
+    if os.path.exists(ruta):
+        return ruta
+
+    temporal = ruta + ".generando"
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(temporal + sufijo):
+            os.remove(temporal + sufijo)
+
+    print(f"Generando {filas:,} pedidos en {ruta}...", flush=True)
+    inicio = time.perf_counter()
+    # El esquema y sus migraciones los crea el propio DatabaseManager
+    db = DatabaseManager(temporal)
+    await db.cerrar()
+
+    conn = sqlite3.connect(temporal, isolation_level=None)
+    indices = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'pedidos' AND sql IS NOT NULL"
+    ).fetchall()
+    # Crear los índices al final es mucho más rápido que mantenerlos fila a fila
+    conn.execute("BEGIN")
+    for nombre, _ in indices:
+        conn.execute(f"DROP INDEX {nombre}")
+    conn.execute(_sql_generar(skus), {"filas": filas})
+    for _, sql in indices:
+        conn.execute(sql)
+    conn.execute("COMMIT")
+    conn.close()
+
+    # Los agregados se rellenan con las mismas reconstrucciones que usa el bot
+    registro = logging.getLogger("database")
+    nivel = registro.level
+    registro.setLevel(logging.ERROR)
+    try:
+        db = DatabaseManager(temporal)
+        await db.reconstruir_agregados()
+        await db.reconstruir_ventas_por_tiempo()
+        await db.cerrar()
+    finally:
+        registro.setLevel(nivel)
+
+    conn = sqlite3.connect(temporal)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("ANALYZE")
+    conn.close()
+    os.replace(temporal, ruta)
+    print(f"  listo en {time.perf_counter() - inicio:.1f}s ({os.path.getsize(ruta) / 1024 / 1024:.0f} MB)", flush=True)
+    return ruta
+
+def _instantanea(ruta):
+    """Estado que guardar_pedido modifica: último id y tablas de agregados"""
+    conn = sqlite3.connect(ruta)
+    try:
+        ultimo_id = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'pedidos'").fetchone()[0]
+        agregados = {tabla: conn.execute(f"SELECT * FROM {tabla}").fetchall() for tabla in TABLAS_AGREGADOS}
+    finally:
+        conn.close()
+    return ultimo_id, agregados
+
+def _restaurar(ruta, instantanea):
+    """Deshace los pedidos insertados al medir: la base vuelve a ser la generada"""
+    ultimo_id, agregados = instantanea
+    conn = sqlite3.connect(ruta)
+    try:
+        with conn:
+            conn.execute("DELETE FROM pedidos WHERE id > ?", (ultimo_id,))
+            conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'pedidos'", (ultimo_id,))
+            for tabla, filas in agregados.items():
+                conn.execute(f"DELETE FROM {tabla}")
+                if filas:
+                    marcas = ", ".join("?" * len(filas[0]))
+                    conn.executemany(f"INSERT INTO {tabla} VALUES ({marcas})", filas)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+# =====================================================
+# BENCHMARKS
+# =====================================================
+class _Mensaje:
+    """Lo mínimo de telegram.Message que usan los handlers medidos"""
+
+    def __init__(self, texto=""):
+        self.text = texto
+
+    async def reply_text(self, *args, **kwargs):
+        pass
+
+class _Consulta:
+    def __init__(self, data):
+        self.data = data
+        self.message = _Mensaje()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+async def benchmarks_render(main):
+    """Armado de textos y teclados, con el envío a Telegram sustituido por un no-op"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+    from checkout import Checkout, INGRESAR_CONTACTO, SELECCIONAR_PRODUCTO
+
+    catalogo = main.catalogo.actual
+    producto = next(iter(catalogo.productos.values()))
+    sku = producto.skus[0]
+
+    checkout = Checkout()
+    contexto = SimpleNamespace(user_data=checkout)
+    update_producto = SimpleNamespace(callback_query=_Consulta(producto.callback))
+    update_contacto = SimpleNamespace(message=_Mensaje("+52 55 1234 5678"))
+
+    async def seleccionar_producto():
+        checkout.paso = SELECCIONAR_PRODUCTO
+        await main.seleccionar_producto(update_producto, contexto)
+
+    async def ingresar_contacto():
+        checkout.paso, checkout.sku = INGRESAR_CONTACTO, sku
+        checkout.id_juego, checkout.nombre = "12345678", "Cliente de prueba"
+        await main.ingresar_contacto(update_contacto, contexto)
+
+    # Una pantalla tomada de PANTALLAS frente a la misma pantalla armada en
+    # cada petición, como se hacía antes de precalcularlas
+    def bienvenida_precalculada():
+        pantalla = main.PANTALLAS["bienvenida"]
+        return pantalla.texto.format(nombre="Cliente"), pantalla.teclado
+
+    def bienvenida_reconstruida():
+        teclado = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🛒 Comprar Ahora", callback_data="hacer_pedido")],
+            [InlineKeyboardButton("📋 Ver Productos", callback_data="ver_productos")],
+            [InlineKeyboardButton("📞 Contacto", callback_data="contacto")],
+            [InlineKeyboardButton("❓ Ayuda", callback_data="ayuda")]
+        ])
+        return main.PLANTILLA_BIENVENIDA.format(nombre="Cliente"), teclado
+
+    def cantidades_reconstruida():
+        teclado = [
+            [InlineKeyboardButton(f"{sku.cantidad} - ${sku.precio} MXN", callback_data=sku.callback)]
+            for sku in producto.skus
+        ]
+        teclado.append([InlineKeyboardButton("⬅️ Cambiar Producto", callback_data="hacer_pedido")])
+        teclado.append([InlineKeyboardButton("❌ Cancelar", callback_data="cancelar_compra")])
+        texto = main.TEXTO_SELECCION_CANTIDAD.format(nombre=producto.nombre, descripcion=producto.descripcion)
+        return texto, InlineKeyboardMarkup(teclado)
+
+    return {
+        "render.pantalla_bienvenida_precalculada": medir(bienvenida_precalculada),
+        "render.pantalla_bienvenida_reconstruida": medir(bienvenida_reconstruida),
+        "render.pantalla_cantidades_precalculada": medir(lambda: main.PANTALLAS[producto.callback]),
+        "render.pantalla_cantidades_reconstruida": medir(cantidades_reconstruida),
+        "render.seleccionar_producto": await medir_async(seleccionar_producto),
+        "render.ingresar_contacto": await medir_async(ingresar_contacto),
+        "render.renderizar_catalogo": medir(lambda: main.renderizar_catalogo(catalogo)),
+        "render.construir_pantallas": medir(lambda: main.construir_pantallas(catalogo)),
+    }
+
+async def benchmarks_db(ruta, filas, skus):
+    """Operaciones de DatabaseManager sobre una base de `filas` pedidos"""
+    from checkout import nueva_clave
+    from database import (
+        DatabaseManager, SQL_AGREGADOS_DESDE_PEDIDOS, SQL_INSERTAR_PEDIDO, SQL_ULTIMOS_PEDIDOS, ahora_ms
+    )
+
+    resultados = {}
+    db = DatabaseManager(ruta)
+    producto, cantidad, precio = skus[0]
+
+    def pedido():
+        return (1, "cliente1", producto, cantidad, "12345678", "Cliente", "+52 55 0", precio, ahora_ms(), nueva_clave())
+
+    def agregados_desde_pedidos():
+        return db._conexion().execute(SQL_AGREGADOS_DESDE_PEDIDOS).fetchall()
+
+    # La misma consulta y la misma inserción abriendo una conexión en cada
+    # llamada, como antes del pool, o con la conexión persistente del hilo
+    def leer_conectando():
+        conn = sqlite3.connect(ruta)
+        try:
+            return conn.execute(SQL_ULTIMOS_PEDIDOS, (10,)).fetchall()
+        finally:
+            conn.close()
+
+    def escribir_conectando():
+        conn = sqlite3.connect(ruta)
+        try:
+            with conn:
+                conn.execute(SQL_INSERTAR_PEDIDO, pedido())
+        finally:
+            conn.close()
+
+    def escribir_persistente():
+        conn = db._conexion()
+        with conn:
+            conn.execute(SQL_INSERTAR_PEDIDO, pedido())
+
+    instantanea = _instantanea(ruta)
+    try:
+        resultados["db.obtener_pedidos"] = await medir_async(lambda: db.obtener_pedidos(10))
+        resultados["db.obtener_pagina_pedidos_estado"] = await medir_async(
+            lambda: db.obtener_pagina_pedidos({"estado": "pendiente"})
+        )
+        resultados["db.leer_conexion_por_llamada"] = medir(leer_conectando)
+        resultados["db.leer_conexion_persistente"] = medir(
+            lambda: db._conexion().execute(SQL_ULTIMOS_PEDIDOS, (10,)).fetchall()
+        )
+        resultados["db.escribir_conexion_por_llamada"] = medir(escribir_conectando)
+        resultados["db.escribir_conexion_persistente"] = medir(escribir_persistente)
+        resultados["db.obtener_cola_pedidos"] = await medir_async(lambda: db.obtener_cola_pedidos("pendiente"))
+        # /admin_stats: totales y producto más vendido desde los agregados
+        resultados["db.obtener_estadisticas"] = await medir_async(db.obtener_estadisticas)
+        # Lo mismo recorriendo pedidos, como hace /admin_reconstruir_stats
+        resultados["db.agregados_desde_pedidos"] = await medir_async(
+            lambda: db._leer(agregados_desde_pedidos), repeticiones=3, minimo=0.05
+        )
+        # Un commit por pedido y, con 100 pedidos a la vez, un commit agrupado
+        resultados["db.guardar_pedido"] = await medir_async(lambda: db.guardar_pedido(pedido()))
+        resultados["db.guardar_pedido_x100"] = await medir_async(
+            lambda: asyncio.gather(*(db.guardar_pedido(pedido()) for _ in range(100)))
+        )
+        # Clientes confirmando a la vez, cada uno pedido tras pedido: con uno
+        # solo no hay nada que agrupar y el commit no debe esperar a nadie
+        for concurrencia in (1, 10, 100):
+            resultados[f"db.guardar_pedido_concurrencia_{concurrencia}"] = await medir_concurrencia(
+                lambda: db.guardar_pedido(pedido()), concurrencia
+            )
+    finally:
+        await db.cerrar()
+        _restaurar(ruta, instantanea)
+
+    return {f"{nombre}[{filas}]": valor for nombre, valor in resultados.items()}
+
+async def benchmarks_persistencia(main, directorio):
+    """Coste de PersistenciaSQLite: anotar un user_data y vaciar los pendientes"""
+    from checkout import Checkout
+    from database import DatabaseManager
+    from persistencia import PersistenciaSQLite
+
+    ruta = os.path.join(directorio, "persistencia.db")
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+
+    db = DatabaseManager(ruta)
+    persistencia = PersistenciaSQLite(db, tipo_user_data=Checkout)
+    sesiones = []
+    for user_id in range(100):
+        checkout = Checkout()
+        checkout.iniciar()
+        checkout.elegir_producto()
+        checkout.elegir_sku(next(iter(main.catalogo.actual.productos.values())).skus[0])
+        sesiones.append((user_id, checkout))
+
+    async def vaciar(cuantas):
+        for user_id, checkout in sesiones[:cuantas]:
+            await persistencia.update_user_data(user_id, checkout)
+        await persistencia.flush()
+
+    async def guardar_inmediato():
+        # Lo que costaría escribir cada cambio en cuanto ocurre
+        user_id, checkout = sesiones[0]
+        await db.guardar_sesiones([(user_id, pickle.dumps(checkout, pickle.HIGHEST_PROTOCOL))], [], [], [])
+
+    registro = logging.getLogger("persistencia")
+    nivel = registro.level
+    registro.setLevel(logging.WARNING)
+    try:
+        # Lo que espera el handler: solo se anota en memoria
+        resultados = {
+            "persistencia.update_user_data": await medir_async(lambda: persistencia.update_user_data(*sesiones[0])),
+            "persistencia.flush_1": await medir_async(lambda: vaciar(1)),
+            "persistencia.flush_100": await medir_async(lambda: vaciar(100)),
+            "persistencia.guardar_inmediato": await medir_async(guardar_inmediato),
+        }
+    finally:
+        registro.setLevel(nivel)
+        await persistencia.flush()
+        await db.cerrar()
+    return resultados
+
+def benchmarks_memoria(main, sesiones=100_000):
+    """Memoria de `sesiones` compras a medio confirmar: dict de antes frente a Checkout"""
+    from checkout import Checkout
+
+    sku = next(iter(main.catalogo.actual.productos.values())).skus[0]
+    # Los textos del cliente ocupan lo mismo en los dos casos: se crean antes
+    datos = [(str(10_000_000 + i), f"Cliente {i}", f"+52 55 {i:08d}") for i in range(sesiones)]
+
+    def sesion_dict(i):
+        id_juego, nombre, contacto = datos[i]
+        return {"sku": sku, "id_juego": id_juego, "nombre": nombre, "contacto": contacto}
+
+    def sesion_checkout(i):
+        id_juego, nombre, contacto = datos[i]
+        checkout = Checkout()
+        checkout.iniciar()
+        checkout.elegir_producto()
+        checkout.elegir_sku(sku)
+        checkout.ingresar_id(id_juego)
+        checkout.ingresar_nombre(nombre)
+        checkout.ingresar_contacto(contacto)
+        return checkout
+
+    return {
+        f"memoria.sesiones_dict[{sesiones}]": medir_memoria(sesion_dict, sesiones),
+        f"memoria.sesiones_checkout[{sesiones}]": medir_memoria(sesion_checkout, sesiones),
+    }
+
+# =====================================================
+# COMPARACIÓN CON LA LÍNEA BASE
+# =====================================================
+def comparar(base, actual, tolerancia):
+    """Imprime la comparación y devuelve los nombres que empeoraron.
+
+    Se compara el mínimo de las tandas: el ruido de la máquina solo puede
+    sumar tiempo, así que es la cifra más estable entre ejecuciones. Las
+    mediciones de memoria se comparan en bytes.
+    """
+    regresiones = []
+    print(f"\n{'benchmark':50} {'base':>12} {'actual':>12} {'cambio':>8}")
+    for nombre, resultado in actual.items():
+        medida = "bytes" if "bytes" in resultado else "min_us"
+        anterior = base.get(nombre)
+        if anterior is None:
+            print(f"{nombre:50} {'-':>12} {resultado[medida]:>12.2f}   (nuevo)")
+            continue
+        cambio = resultado[medida] / anterior[medida] - 1
+        marca = ""
+        if cambio > tolerancia:
+            regresiones.append(nombre)
+            marca = "  ← regresión"
+        print(f"{nombre:50} {anterior[medida]:>12.2f} {resultado[medida]:>12.2f} {cambio:>+8.1%}{marca}")
+    return regresiones
+
+async def ejecutar(filas, directorio, solo=None):
+    """Corre los benchmarks; con `solo` se saltan los grupos que no coinciden"""
+    def incluye(prefijo):
+        return not solo or solo.startswith(prefijo) or prefijo.startswith(solo)
+
+    # La configuración se lee al importar main: su base de datos es una temporal
+    os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="gamedin-bench-"), "main.db")
+    import main
+
+    skus = [
+        (sku.producto, sku.cantidad, sku.precio)
+        for producto in main.catalogo.actual.productos.values() for sku in producto.skus
+    ]
+    resultados = {}
+    if incluye("render."):
+        resultados.update(await benchmarks_render(main))
+    await main.db.cerrar()
+
+    if incluye("memoria."):
+        resultados.update(benchmarks_memoria(main))
+
+    if incluye("persistencia."):
+        os.makedirs(directorio, exist_ok=True)
+        resultados.update(await benchmarks_persistencia(main, directorio))
+
+    if incluye("db."):
+        os.makedirs(directorio, exist_ok=True)
+        for numero in filas:
+            ruta = await preparar_datos(directorio, numero, skus)
+            resultados.update(await benchmarks_db(ruta, numero, skus))
+
+    return {nombre: valor for nombre, valor in resultados.items() if not solo or nombre.startswith(solo)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmarks del bot sin Telegram")
+    parser.add_argument("--filas", default=",".join(map(str, FILAS_POR_DEFECTO)),
+                        help="tamaños de las tablas sintéticas, separados por comas")
+    parser.add_argument("--datos", default=os.path.join(tempfile.gettempdir(), "gamedin-benchmarks"),
+                        help="directorio donde se generan y reutilizan las tablas")
+    parser.add_argument("--solo", help="medir solo los benchmarks cuyo nombre empieza así")
+    parser.add_argument("--salida", help="guardar los resultados en este JSON")
+    parser.add_argument("--base", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="empeoramiento admitido sobre la base (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    filas = [int(valor) for valor in args.filas.split(",") if valor]
+    resultados = asyncio.run(ejecutar(filas, args.datos, args.solo))
+
+    for nombre, resultado in resultados.items():
+        if "bytes" in resultado:
+            print(f"{nombre:50} {resultado['bytes'] / 1024 / 1024:>12.2f} MB  ({resultado['bytes_por_objeto']:.1f} B c/u)")
+        else:
+            print(f"{nombre:50} {resultado['mediana_us']:>12.2f} us  (mín {resultado['min_us']:.2f}, n={resultado['iteraciones']})")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump({
+                "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "maquina": platform.node(),
+                "resultados": resultados,
+            }, archivo, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.salida}")
+
+    if args.base:
+        with open(args.base, encoding="utf-8") as archivo:
+            base = json.load(archivo)["resultados"]
+        regresiones = comparar(base, resultados, args.tolerancia)
+        if regresiones:
+            print(f"\n{len(regresiones)} regresiones por encima del {args.tolerancia:.0%}")
+            sys.exit(1)
+        print("\nSin regresiones")
@@ -0,0 +1,187 @@
+# catalogo.py - Catálogo de productos indexado con recarga en caliente
+import asyncio
+import json
+import logging
+import os
+from collections import namedtuple
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# Registros inmutables del catálogo. El callback es el callback_data del botón
+# que los selecciona, así los handlers resuelven la selección con un solo acceso.
+Producto = namedtuple("Producto", ["callback", "clave", "nombre", "descripcion", "skus"])
+class SKU(namedtuple("SKU", ["callback", "producto", "clave", "nombre", "cantidad", "precio"])):
+    __slots__ = ()
+
+    def __deepcopy__(self, memo):
+        # Inmutable: la persistencia copia user_data en cada guardado y no
+        # hace falta reconstruir el SKU que guarda cada checkout
+        return self
+
+# Límite de Telegram para el callback_data de un botón, en bytes
+MAX_CALLBACK_DATA = 64
+
+def _validar_callback(callback):
+    if len(callback.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data demasiado largo: {callback}")
+
+def _validar_estructura(datos):
+    """Comprueba la forma del JSON antes de construir nada.
+
+    Cualquier error sale como ValueError: un archivo con otra estructura (una
+    lista, un precio sin número) se rechaza igual que un JSON mal escrito.
+    """
+    if not isinstance(datos, dict):
+        raise ValueError("el catálogo debe ser un objeto con un producto por clave")
+    for clave, producto_data in datos.items():
+        if not isinstance(producto_data, dict):
+            raise ValueError(f"producto {clave}: debe ser un objeto")
+        for campo in ("nombre", "descripcion"):
+            if not isinstance(producto_data.get(campo), str):
+                raise ValueError(f"producto {clave}: falta el texto '{campo}'")
+        cantidades = producto_data.get("cantidades")
+        if not isinstance(cantidades, dict) or not cantidades:
+            raise ValueError(f"producto {clave}: 'cantidades' debe ser un objeto no vacío")
+        for cant_key, cant_data in cantidades.items():
+            if not isinstance(cant_data, dict) or not isinstance(cant_data.get("cantidad"), str):
+                raise ValueError(f"producto {clave}, cantidad {cant_key}: falta el texto 'cantidad'")
+            try:
+                int(cant_data.get("precio"))
+            except (TypeError, ValueError):
+                raise ValueError(f"producto {clave}, cantidad {cant_key}: precio inválido") from None
+
+# =====================================================
+# CATÁLOGO
+# =====================================================
+class Catalogo:
+    """Instantánea inmutable del catálogo con índices por callback_data"""
+
+    __slots__ = ("productos", "_productos_por_callback", "_skus_por_callback")
+
+    def __init__(self, datos):
+        _validar_estructura(datos)
+        productos = {}
+        productos_por_callback = {}
+        skus_por_callback = {}
+
+        for clave, producto_data in datos.items():
+            skus = tuple(
+                SKU(
+                    f"cantidad_{clave}_{cant_key}",
+                    clave,
+                    cant_key,
+                    producto_data['nombre'],
+                    cant_data['cantidad'],
+                    int(cant_data['precio'])
+                )
+                for cant_key, cant_data in producto_data['cantidades'].items()
+            )
+            producto = Producto(
+                f"producto_{clave}",
+                clave,
+                producto_data['nombre'],
+                producto_data['descripcion'],
+                skus
+            )
+
+            _validar_callback(producto.callback)
+            productos[clave] = producto
+            productos_por_callback[producto.callback] = producto
+            for sku in skus:
+                _validar_callback(sku.callback)
+                skus_por_callback[sku.callback] = sku
+
+        self.productos = MappingProxyType(productos)
+        self._productos_por_callback = MappingProxyType(productos_por_callback)
+        self._skus_por_callback = MappingProxyType(skus_por_callback)
+
+    def producto(self, callback_data):
+        """Devuelve el Producto de un botón 'producto_...' o None"""
+        return self._productos_por_callback.get(callback_data)
+
+    def sku(self, callback_data):
+        """Devuelve el SKU de un botón 'cantidad_...' o None"""
+        return self._skus_por_callback.get(callback_data)
+
+    def nombre_producto(self, clave):
+        """Nombre visible de un producto, o la clave si ya no existe"""
+        producto = self.productos.get(clave)
+        return producto.nombre if producto else clave
+
+def cargar_catalogo(ruta):
+    """Lee y valida el catálogo desde un archivo JSON"""
+    with open(ruta, encoding="utf-8") as archivo:
+        return Catalogo(json.load(archivo))
+
+# =====================================================
+# RECARGA EN CALIENTE
+# =====================================================
+class CatalogoRecargable:
+    """Mantiene el catálogo vigente y lo recarga cuando cambia el archivo.
+
+    El catálogo nuevo se construye completo y luego se publica con una sola
+    asignación, así un handler que ya tomó `actual` nunca ve un índice a medias.
+    Si el archivo nuevo es inválido se conserva el catálogo anterior.
+    """
+
+    def __init__(self, ruta, intervalo=5):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self._mtime = os.stat(ruta).st_mtime_ns
+        self.actual = cargar_catalogo(ruta)
+        self._suscriptores = []
+        self._tarea = None
+
+    def suscribir(self, callback):
+        """Registra una función que recibe cada catálogo nuevo"""
+        self._suscriptores.append(callback)
+
+    def recargar_si_cambio(self):
+        """Recarga el catálogo si el archivo cambió; devuelve True si lo hizo"""
+        try:
+            mtime = os.stat(self.ruta).st_mtime_ns
+        except OSError as e:
+            logger.error(f"No se pudo leer el catálogo {self.ruta}: {e}")
+            return False
+
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        try:
+            nuevo = cargar_catalogo(self.ruta)
+        except (OSError, ValueError) as e:
+            logger.error(f"Catálogo inválido en {self.ruta}, se mantiene el anterior: {e}")
+            return False
+
+        self.actual = nuevo
+        for callback in self._suscriptores:
+            callback(nuevo)
+        logger.info(f"Catálogo recargado: {len(nuevo.productos)} productos")
+        return True
+
+    async def _vigilar(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            # Un fallo inesperado (en un suscriptor, por ejemplo) no puede
+            # detener la vigilancia
+            try:
+                self.recargar_si_cambio()
+            except Exception:
+                logger.exception(f"Error recargando el catálogo {self.ruta}")
+
+    def iniciar(self):
+        """Empieza a vigilar el archivo del catálogo"""
+        if self._tarea is None:
+            self._tarea = asyncio.get_running_loop().create_task(self._vigilar())
+
+    async def detener(self):
+        """Deja de vigilar el archivo del catálogo"""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
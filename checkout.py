@@ -0,0 +1,126 @@
+# checkout.py - Estado de la compra en curso de cada usuario
+import secrets
+import time
+
+# Pasos del checkout; son también los estados del ConversationHandler
+SELECCIONAR_PRODUCTO, SELECCIONAR_CANTIDAD, INGRESAR_ID, INGRESAR_NOMBRE, INGRESAR_CONTACTO, CONFIRMAR_PEDIDO = range(6)
+
+# Nombre de cada paso en logs y métricas
+NOMBRES_PASO = {
+    SELECCIONAR_PRODUCTO: "seleccionar_producto",
+    SELECCIONAR_CANTIDAD: "seleccionar_cantidad",
+    INGRESAR_ID: "ingresar_id",
+    INGRESAR_NOMBRE: "ingresar_nombre",
+    INGRESAR_CONTACTO: "ingresar_contacto",
+    CONFIRMAR_PEDIDO: "confirmar_pedido",
+}
+
+# Origen de las claves de idempotencia: 2024-01-01 en milisegundos UTC
+_EPOCH_CLAVES_MS = 1_704_067_200_000
+
+def nueva_clave():
+    """Clave de idempotencia: milisegundos desde 2024 y 22 bits al azar.
+
+    Las claves crecen con el tiempo, así cada pedido nuevo entra al final del
+    índice único en lugar de en una página al azar. Caben en el INTEGER con
+    signo de SQLite hasta 2093.
+    """
+    return (time.time_ns() // 1_000_000 - _EPOCH_CLAVES_MS) << 22 | secrets.randbits(22)
+
+# =====================================================
+# CHECKOUT
+# =====================================================
+class Checkout:
+    """Compra en curso de un usuario; se usa como su context.user_data.
+
+    Un registro con __slots__ en lugar de un dict por sesión: cada paso se
+    alcanza con un método que valida desde dónde se llega y devuelve el
+    estado siguiente de la conversación. Fuera de una compra `paso` es None
+    y el registro es falso, así la persistencia y la caducidad lo tratan
+    como un user_data vacío.
+
+    Cada compra lleva una `clave` aleatoria que acompaña al pedido hasta la
+    base de datos: confirmarla dos veces guarda un solo pedido.
+    """
+
+    __slots__ = ("paso", "sku", "id_juego", "nombre", "contacto", "clave")
+
+    def __init__(self):
+        self.reiniciar()
+
+    def __bool__(self):
+        return self.paso is not None
+
+    # Estado como tupla: el pickle que guarda la persistencia no repite
+    # los nombres de los campos en cada sesión
+    def __getstate__(self):
+        return (self.paso, self.sku, self.id_juego, self.nombre, self.contacto, self.clave)
+
+    def __setstate__(self, estado):
+        if len(estado) == 5:
+            # Sesión guardada antes de existir la clave
+            estado += (nueva_clave() if estado[0] is not None else None,)
+        self.paso, self.sku, self.id_juego, self.nombre, self.contacto, self.clave = estado
+
+    def __repr__(self):
+        return f"Checkout(paso={self.paso}, sku={self.sku and self.sku.callback})"
+
+    def _pasar(self, origenes, destino):
+        # Repetir un paso ya dado se admite: sobrescribe el dato, como un
+        # reintento tras una respuesta que no llegó
+        if self.paso not in origenes and self.paso != destino:
+            raise ValueError(f"Transición de checkout inválida: {self.paso} → {destino}")
+        self.paso = destino
+        return destino
+
+    # -------------------------------------------------
+    # Transiciones
+    # -------------------------------------------------
+    def reiniciar(self):
+        """Termina la compra (confirmada, cancelada o expirada)"""
+        self.paso = None
+        self.sku = None
+        self.id_juego = None
+        self.nombre = None
+        self.contacto = None
+        self.clave = None
+
+    def iniciar(self):
+        """Empieza una compra nueva desde cualquier punto"""
+        self.reiniciar()
+        self.paso = SELECCIONAR_PRODUCTO
+        self.clave = nueva_clave()
+        return self.paso
+
+    def modificar(self):
+        """Vuelve a elegir producto conservando los datos del cliente"""
+        if self.paso is None:
+            return self.iniciar()
+        self.sku = None
+        self.id_juego = None
+        self.paso = SELECCIONAR_PRODUCTO
+        return self.paso
+
+    def elegir_producto(self):
+        return self._pasar((SELECCIONAR_PRODUCTO, SELECCIONAR_CANTIDAD), SELECCIONAR_CANTIDAD)
+
+    def elegir_sku(self, sku):
+        # El SKU es inmutable: una recarga del catálogo no cambia este pedido
+        destino = self._pasar((SELECCIONAR_PRODUCTO, SELECCIONAR_CANTIDAD), INGRESAR_ID)
+        self.sku = sku
+        return destino
+
+    def ingresar_id(self, id_juego):
+        destino = self._pasar((INGRESAR_ID,), INGRESAR_NOMBRE)
+        self.id_juego = id_juego
+        return destino
+
+    def ingresar_nombre(self, nombre):
+        destino = self._pasar((INGRESAR_NOMBRE,), INGRESAR_CONTACTO)
+        self.nombre = nombre
+        return destino
+
+    def ingresar_contacto(self, contacto):
+        destino = self._pasar((INGRESAR_CONTACTO,), CONFIRMAR_PEDIDO)
+        self.contacto = contacto
+        return destino
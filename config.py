@@ -9,8 +9,77 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN', '7589496460:AAFR4tKNT3cSAX4pc55x6uaqEdMA2oc1hFI')
 GRUPO_PEDIDOS_ID = os.getenv('GRUPO_PEDIDOS_ID', '-1002541246940')
 ADMIN_ID = os.getenv('ADMIN_ID', '5979848389')
+BOT_API_URL = os.getenv('BOT_API_URL', 'https://api.telegram.org/bot')
+
+# Modo de recepción de updates: 'polling' o 'webhook'
+MODO_BOT = os.getenv('MODO_BOT', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # URL pública, ej. https://gamedin.up.railway.app
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # vacío = se genera uno al arrancar
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('PORT', '8443'))
+
+# Base de datos SQLite
+DB_NAME = os.getenv('DB_NAME', 'gamedin_pedidos.db')
+DB_LECTORES = int(os.getenv('DB_LECTORES', '4'))
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', '-16000'))  # negativo = KiB
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', '67108864'))
+DB_VENTANA_LOTE_MS = float(os.getenv('DB_VENTANA_LOTE_MS', '0'))  # espera para agrupar inserciones
+DB_MAX_LOTE = int(os.getenv('DB_MAX_LOTE', '100'))
+PERSISTENCIA_INTERVALO = float(os.getenv('PERSISTENCIA_INTERVALO', '5'))  # segundos entre guardados de sesiones
+
+# Procesamiento concurrente de updates
+UPDATES_CONCURRENTES = int(os.getenv('UPDATES_CONCURRENTES', '64'))
+SHARDS_POR_USUARIO = int(os.getenv('SHARDS_POR_USUARIO', '256'))
+
+# Límites de envío hacia Telegram
+ENVIOS_GLOBAL_POR_SEG = float(os.getenv('ENVIOS_GLOBAL_POR_SEG', '30'))
+ENVIOS_CHAT_POR_SEG = float(os.getenv('ENVIOS_CHAT_POR_SEG', '1'))
+ENVIOS_GRUPO_POR_MIN = float(os.getenv('ENVIOS_GRUPO_POR_MIN', '20'))
+ENVIOS_MAX_REINTENTOS = int(os.getenv('ENVIOS_MAX_REINTENTOS', '5'))
+
+# Límite de updates por usuario: el exceso se descarta antes de los handlers
+FLOOD_POR_SEG = float(os.getenv('FLOOD_POR_SEG', '1'))  # 0 = sin límite
+FLOOD_RAFAGA = float(os.getenv('FLOOD_RAFAGA', '10'))  # updates seguidos antes de limitar
+FLOOD_GLOBAL_POR_SEG = float(os.getenv('FLOOD_GLOBAL_POR_SEG', '500'))
+FLOOD_MAX_USUARIOS = int(os.getenv('FLOOD_MAX_USUARIOS', '10000'))  # cubetas en memoria
+FLOOD_AVISO_SEG = float(os.getenv('FLOOD_AVISO_SEG', '30'))  # como mucho un aviso por periodo
+
+# Checkouts abandonados: se cancelan tras este tiempo sin actividad
+CHECKOUT_TTL_MIN = float(os.getenv('CHECKOUT_TTL_MIN', '30'))  # 0 = nunca caducan
+CHECKOUT_AVISO_EXPIRADO = os.getenv('CHECKOUT_AVISO_EXPIRADO', '1') == '1'  # avisar al cliente
+
+# Notificaciones de pedidos al grupo: con ventana > 0 los pedidos se agrupan
+# en un resumen por ventana en lugar de un mensaje por pedido. El resumen no
+# lleva botones de estado: en ese modo los pedidos se gestionan con /admin_cola
+NOTIF_RESUMEN_SEG = float(os.getenv('NOTIF_RESUMEN_SEG', '0'))  # 0 = un mensaje por pedido
+NOTIF_RESUMEN_MAX_PEDIDOS = int(os.getenv('NOTIF_RESUMEN_MAX_PEDIDOS', '50'))  # líneas por mensaje
+NOTIF_RESUMEN_MAX_CARACTERES = int(os.getenv('NOTIF_RESUMEN_MAX_CARACTERES', '4096'))
+
+# Métricas en formato Prometheus, servidas en http://METRICAS_LISTEN:METRICAS_PUERTO/metrics
+METRICAS_PUERTO = int(os.getenv('METRICAS_PUERTO', '0'))  # 0 = sin endpoint
+METRICAS_LISTEN = os.getenv('METRICAS_LISTEN', '0.0.0.0')
+
+# Trazas por update: fracción de updates trazados, escritos en TRAZAS_PATH
+TRAZAS_MUESTREO = float(os.getenv('TRAZAS_MUESTREO', '0'))  # 0 = sin trazas, 1 = todos
+TRAZAS_PATH = os.getenv('TRAZAS_PATH', 'trazas.jsonl')
+TRAZAS_MAX_MB = float(os.getenv('TRAZAS_MAX_MB', '10'))  # tamaño de cada archivo antes de rotar
+TRAZAS_COPIAS = int(os.getenv('TRAZAS_COPIAS', '3'))
+
+# Perfilador de /admin_profile
+PERFIL_HZ = float(os.getenv('PERFIL_HZ', '100'))  # muestras por segundo
+PERFIL_MAX_SEG = int(os.getenv('PERFIL_MAX_SEG', '300'))
+
+# Catálogo de productos
+# Por defecto el productos.json junto a este archivo, se arranque desde donde se arranque
+CATALOGO_PATH = os.getenv('CATALOGO_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'productos.json'))
+CATALOGO_INTERVALO_RECARGA = float(os.getenv('CATALOGO_INTERVALO_RECARGA', '5'))  # segundos
 
 # Para desarrollo local (opcional)
 if BOT_TOKEN == 'TU_TOKEN_AQUI':
     print("⚠️ CONFIGURAR VARIABLES DE ENTORNO EN RAILWAY")
     print("BOT_TOKEN, GRUPO_PEDIDOS_ID, ADMIN_ID")
+
+if MODO_BOT == 'webhook' and not WEBHOOK_URL:
+    print("⚠️ MODO_BOT=webhook requiere WEBHOOK_URL (URL pública del servicio)")
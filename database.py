@@ -0,0 +1,988 @@
+# database.py - Gestor de base de datos SQLite para Gamedin
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from metricas import Metricas
+from trazas import tramo
+
+logger = logging.getLogger(__name__)
+
+# Valores aceptados por PRAGMA synchronous
+SYNCHRONOUS_VALIDOS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+# Sentencias reutilizadas: al ser siempre el mismo texto, cada conexión
+# las toma de su caché de sentencias preparadas en vez de recompilarlas.
+SQL_INSERTAR_PEDIDO = '''
+    INSERT INTO pedidos (user_id, username, producto, cantidad, id_juego,
+                       nombre_cliente, contacto_cliente, precio, fecha, clave_idempotencia, notificado)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+    ON CONFLICT (clave_idempotencia, user_id) WHERE clave_idempotencia IS NOT NULL DO NOTHING
+'''
+SQL_PEDIDO_POR_CLAVE = "SELECT id FROM pedidos WHERE clave_idempotencia = ? AND user_id = ?"
+SQL_PEDIDOS_SIN_NOTIFICAR = '''
+    SELECT id, user_id, username, producto, cantidad, id_juego, nombre_cliente, contacto_cliente, precio, fecha
+    FROM pedidos WHERE notificado = 0 ORDER BY id
+'''
+SQL_SUMAR_VENTAS_PRODUCTO = '''
+    INSERT INTO ventas_por_producto (producto, pedidos, ingresos)
+    VALUES (?, ?, ?)
+    ON CONFLICT(producto) DO UPDATE SET
+        pedidos = pedidos + excluded.pedidos,
+        ingresos = ingresos + excluded.ingresos
+'''
+SQL_ULTIMOS_PEDIDOS = "SELECT * FROM pedidos ORDER BY fecha DESC LIMIT ?"
+# Posición de un pedido en el orden (fecha, id), para paginar desde él
+SQL_CURSOR_PEDIDO = "(SELECT fecha FROM pedidos WHERE id = ?)"
+SQL_TOTALES = "SELECT COALESCE(SUM(pedidos), 0), COALESCE(SUM(ingresos), 0) FROM ventas_por_producto"
+SQL_PRODUCTO_POPULAR = "SELECT producto, pedidos FROM ventas_por_producto ORDER BY pedidos DESC LIMIT 1"
+SQL_AGREGADOS = "SELECT producto, pedidos, ingresos FROM ventas_por_producto"
+SQL_AGREGADOS_DESDE_PEDIDOS = "SELECT producto, COUNT(*), COALESCE(SUM(precio), 0) FROM pedidos GROUP BY producto"
+
+# Ventas por franja de tiempo en hora local ("2024-06-01 13" para una hora,
+# "2024-06-01" para un día), como franja_hora. Las unidades son la cantidad
+# si es numérica ("1,080") y 1 si es un artículo ("Pase Elite"), como
+# unidades_pedido.
+SQL_UNIDADES = (
+    "CASE WHEN replace(cantidad, ',', '') GLOB '[0-9]*' AND replace(cantidad, ',', '') NOT GLOB '*[^0-9]*' "
+    "THEN CAST(replace(cantidad, ',', '') AS INTEGER) ELSE 1 END"
+)
+SQL_SUMAR_VENTAS_HORA = '''
+    INSERT INTO ventas_por_hora (hora, producto, pedidos, ingresos, unidades)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(hora, producto) DO UPDATE SET
+        pedidos = pedidos + excluded.pedidos,
+        ingresos = ingresos + excluded.ingresos,
+        unidades = unidades + excluded.unidades
+'''
+SQL_SUMAR_VENTAS_DIA = '''
+    INSERT INTO ventas_por_dia (dia, producto, pedidos, ingresos, unidades)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(dia, producto) DO UPDATE SET
+        pedidos = pedidos + excluded.pedidos,
+        ingresos = ingresos + excluded.ingresos,
+        unidades = unidades + excluded.unidades
+'''
+SQL_VENTAS_HORA_DESDE_PEDIDOS = (
+    "SELECT strftime('%Y-%m-%d %H', fecha / 1000, 'unixepoch', 'localtime'), producto, COUNT(*), "
+    f"COALESCE(SUM(precio), 0), SUM({SQL_UNIDADES}) FROM pedidos {{donde}} GROUP BY 1, 2"
+)
+SQL_VENTAS_DIA_DESDE_HORAS = (
+    "SELECT substr(hora, 1, 10), producto, SUM(pedidos), SUM(ingresos), SUM(unidades) "
+    "FROM ventas_por_hora {donde} GROUP BY 1, 2"
+)
+SQL_VENTAS_POR_DIA = '''
+    SELECT dia, producto, pedidos, ingresos, unidades FROM ventas_por_dia
+    WHERE dia >= ? AND dia < ? ORDER BY dia, producto
+'''
+SQL_VENTAS_POR_HORA = '''
+    SELECT hora, producto, pedidos, ingresos, unidades FROM ventas_por_hora
+    WHERE hora >= ? AND hora < ? ORDER BY hora, producto
+'''
+SQL_GUARDAR_SESION = '''
+    INSERT INTO sesiones_usuario (user_id, datos) VALUES (?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET datos = excluded.datos
+'''
+SQL_BORRAR_SESION = "DELETE FROM sesiones_usuario WHERE user_id = ?"
+SQL_GUARDAR_CONVERSACION = '''
+    INSERT INTO conversaciones (nombre, clave, estado) VALUES (?, ?, ?)
+    ON CONFLICT(nombre, clave) DO UPDATE SET estado = excluded.estado
+'''
+SQL_BORRAR_CONVERSACION = "DELETE FROM conversaciones WHERE nombre = ? AND clave = ?"
+SQL_CAMBIAR_ESTADO = "UPDATE pedidos SET estado = ? WHERE id = ? AND estado = ?"
+SQL_MARCAR_NOTIFICADO = "UPDATE pedidos SET notificado = 1 WHERE id = ?"
+SQL_ESTADO_PEDIDO = "SELECT estado FROM pedidos WHERE id = ?"
+# Cuenta la cola solo hasta un tope: con un atasco grande no se recorre entero
+SQL_CONTAR_COLA = "SELECT COUNT(*) FROM (SELECT 1 FROM pedidos WHERE estado = ? LIMIT ?)"
+SQL_ULTIMA_EXPORTACION = "SELECT COALESCE(MAX(ultimo_id), 0) FROM exportaciones"
+SQL_REGISTRAR_EXPORTACION = '''
+    INSERT INTO exportaciones (fecha, formato, filas, ultimo_id) VALUES (?, ?, ?, ?)
+'''
+
+# Filtros aceptados al paginar pedidos y su condición. Cada uno tiene un
+# índice (campo, fecha) que sirve a la vez el filtro y el orden.
+FILTROS_PEDIDOS = {
+    "estado": "estado = ?",
+    "producto": "producto = ?",
+    "user_id": "user_id = ?",
+    "username": "username = ?",
+    "desde": "fecha >= ?",
+    "hasta": "fecha < ?",
+}
+
+# Ciclo de vida de un pedido: estado -> estados a los que puede pasar.
+# 'entregado' y 'cancelado' son finales.
+TRANSICIONES_ESTADO = {
+    "pendiente": ("pagado", "cancelado"),
+    "pagado": ("entregado", "cancelado"),
+    "entregado": (),
+    "cancelado": (),
+}
+
+def _comprobar_fechas_convertidas(conn):
+    """Falla si algún pedido conserva una fecha que no es milisegundos"""
+    ids = [fila[0] for fila in conn.execute(
+        "SELECT id FROM pedidos WHERE typeof(fecha) NOT IN ('integer', 'null') ORDER BY id"
+    )]
+    if ids:
+        listado = ", ".join(f"#{pedido_id}" for pedido_id in ids[:50])
+        if len(ids) > 50:
+            listado += f" y {len(ids) - 50} más"
+        raise ValueError(f"{len(ids)} pedidos con fecha ilegible, corrígela antes de migrar: {listado}")
+
+# Migraciones del esquema: (versión, descripción, sentencias). Se aplican en
+# orden al arrancar y la versión alcanzada se guarda en PRAGMA user_version.
+# Una sentencia también puede ser una función que recibe la conexión.
+# Nunca modificar una migración ya publicada: añadir una nueva al final.
+MIGRACIONES = [
+    (1, "Índices para listados por fecha y ventas por producto", [
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_fecha ON pedidos (fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_producto ON pedidos (producto)",
+    ]),
+    (2, "Índices para filtrar por estado y por cliente", [
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_estado ON pedidos (estado)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_user_id ON pedidos (user_id)",
+    ]),
+    (3, "Agregados de ventas por producto", [
+        '''
+        CREATE TABLE IF NOT EXISTS ventas_por_producto (
+            producto TEXT PRIMARY KEY,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            ingresos INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT INTO ventas_por_producto (producto, pedidos, ingresos) " + SQL_AGREGADOS_DESDE_PEDIDOS,
+    ]),
+    (4, "Sesiones de usuario y estados de conversación persistentes", [
+        '''
+        CREATE TABLE IF NOT EXISTS sesiones_usuario (
+            user_id INTEGER PRIMARY KEY,
+            datos BLOB NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversaciones (
+            nombre TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            estado INTEGER NOT NULL,
+            PRIMARY KEY (nombre, clave)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (5, "Índices (filtro, fecha) para paginar pedidos filtrados", [
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_estado_fecha ON pedidos (estado, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_producto_fecha ON pedidos (producto, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_user_id_fecha ON pedidos (user_id, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_username_fecha ON pedidos (username, fecha)",
+        # Los índices de una sola columna quedan cubiertos por los nuevos
+        "DROP INDEX IF EXISTS idx_pedidos_estado",
+        "DROP INDEX IF EXISTS idx_pedidos_producto",
+        "DROP INDEX IF EXISTS idx_pedidos_user_id",
+    ]),
+    (6, "Registro de exportaciones de pedidos", [
+        '''
+        CREATE TABLE IF NOT EXISTS exportaciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha TEXT NOT NULL,
+            formato TEXT NOT NULL,
+            filas INTEGER NOT NULL,
+            ultimo_id INTEGER NOT NULL
+        )
+        ''',
+    ]),
+    (7, "Ventas por hora y por día", [
+        '''
+        CREATE TABLE IF NOT EXISTS ventas_por_hora (
+            hora TEXT NOT NULL,
+            producto TEXT NOT NULL,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            ingresos INTEGER NOT NULL DEFAULT 0,
+            unidades INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hora, producto)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ventas_por_dia (
+            dia TEXT NOT NULL,
+            producto TEXT NOT NULL,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            ingresos INTEGER NOT NULL DEFAULT 0,
+            unidades INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, producto)
+        ) WITHOUT ROWID
+        ''',
+        # Las fechas aún eran texto: la franja es su prefijo
+        "INSERT INTO ventas_por_hora (hora, producto, pedidos, ingresos, unidades) "
+        f"SELECT substr(fecha, 1, 13), producto, COUNT(*), COALESCE(SUM(precio), 0), SUM({SQL_UNIDADES}) "
+        "FROM pedidos GROUP BY 1, 2",
+        "INSERT INTO ventas_por_dia (dia, producto, pedidos, ingresos, unidades) "
+        + SQL_VENTAS_DIA_DESDE_HORAS.format(donde=""),
+    ]),
+    (8, "Fechas de pedidos como milisegundos UTC", [
+        # Reconstruir los índices con fecha al final cuesta menos que
+        # actualizarlos fila a fila durante el UPDATE
+        "DROP INDEX IF EXISTS idx_pedidos_fecha",
+        "DROP INDEX IF EXISTS idx_pedidos_estado_fecha",
+        "DROP INDEX IF EXISTS idx_pedidos_producto_fecha",
+        "DROP INDEX IF EXISTS idx_pedidos_user_id_fecha",
+        "DROP INDEX IF EXISTS idx_pedidos_username_fecha",
+        # El texto guardado era la hora local: 'utc' la pasa a UTC
+        '''
+        UPDATE pedidos
+        SET fecha = CAST(ROUND((julianday(fecha, 'utc') - 2440587.5) * 86400000) AS INTEGER)
+        WHERE typeof(fecha) = 'text' AND julianday(fecha) IS NOT NULL
+        ''',
+        # Una fecha ilegible no se queda como texto entre los enteros: la
+        # migración se deshace y el bot no arranca hasta corregirla
+        _comprobar_fechas_convertidas,
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_fecha ON pedidos (fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_estado_fecha ON pedidos (estado, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_producto_fecha ON pedidos (producto, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_user_id_fecha ON pedidos (user_id, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_username_fecha ON pedidos (username, fecha)",
+    ]),
+    (9, "Clave de idempotencia de los pedidos", [
+        # Los pedidos anteriores no tienen clave: el índice parcial los deja
+        # fuera y la migración no recorre la tabla. La clave es única por
+        # usuario: dos clientes nunca comparten pedido aunque coincida.
+        "ALTER TABLE pedidos ADD COLUMN clave_idempotencia INTEGER",
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_pedidos_clave_idempotencia
+        ON pedidos (clave_idempotencia, user_id) WHERE clave_idempotencia IS NOT NULL
+        ''',
+    ]),
+    (10, "Marca de notificación al grupo de los pedidos", [
+        # Los pedidos anteriores cuentan como notificados: con un DEFAULT
+        # constante SQLite no reescribe la tabla. Los nuevos entran con 0 y
+        # el índice parcial solo guarda los que aún esperan su aviso.
+        "ALTER TABLE pedidos ADD COLUMN notificado INTEGER NOT NULL DEFAULT 1",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_sin_notificar ON pedidos (id) WHERE notificado = 0",
+    ]),
+]
+
+# Las fechas de los pedidos se guardan como milisegundos UTC desde epoch: un
+# entero se compara y ordena en los índices sin formatos ni zonas horarias, y
+# se pasa a hora local solo al mostrarlo.
+def ahora_ms():
+    """Momento actual en milisegundos UTC"""
+    return time.time_ns() // 1_000_000
+
+def a_epoch_ms(valor):
+    """Milisegundos UTC de un datetime o date en hora local, o de su texto ISO"""
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    if not isinstance(valor, datetime):
+        valor = datetime.combine(valor, datetime.min.time())
+    return round(valor.timestamp() * 1000)
+
+def fechas_locales(valores):
+    """Convierte en bloque milisegundos UTC en datetimes locales, sin parsear texto"""
+    desde_epoch = datetime.fromtimestamp
+    return [desde_epoch(ms / 1000) for ms in valores]
+
+def franja_hora(ms):
+    """Franja 'AAAA-MM-DD HH' en hora local de unos milisegundos UTC"""
+    return datetime.fromtimestamp(ms / 1000).strftime("%Y-%m-%d %H")
+
+def _validar_filtros(filtros):
+    """Devuelve los filtros (un dict vacío si no hay) si todos están en FILTROS_PEDIDOS.
+
+    Se llama antes de pasar a un hilo lector: un filtro desconocido es un
+    error del llamador, no de la base de datos.
+    """
+    filtros = filtros or {}
+    for campo in filtros:
+        if campo not in FILTROS_PEDIDOS:
+            raise ValueError(f"Filtro de pedidos desconocido: {campo}")
+    return filtros
+
+def parametros_filtros(filtros):
+    """Condiciones y parámetros SQL de unos filtros de FILTROS_PEDIDOS.
+
+    'desde' y 'hasta' llegan como días 'AAAA-MM-DD' en hora local.
+    """
+    condiciones = [FILTROS_PEDIDOS[campo] for campo in filtros]
+    params = [
+        a_epoch_ms(valor) if campo in ("desde", "hasta") else valor
+        for campo, valor in filtros.items()
+    ]
+    return condiciones, params
+
+def unidades_pedido(cantidad):
+    """Unidades de un pedido: la cantidad si es numérica ("1,080"), 1 si es un artículo"""
+    digitos = str(cantidad).replace(",", "")
+    return int(digitos) if digitos.isascii() and digitos.isdigit() else 1
+
+# Pedidos que se piden a SQLite de cada vez al exportar
+LOTE_EXPORTACION = 1000
+
+# =====================================================
+# GESTOR DE BASE DE DATOS
+# =====================================================
+class DatabaseManager:
+    """Acceso a SQLite con métodos awaitables.
+
+    Mantiene un pool de conexiones persistentes: un único hilo escritor y
+    varios hilos lectores, cada uno con su propia conexión en modo WAL. Así
+    un fsync lento nunca detiene el event loop y las lecturas no esperan a
+    las escrituras.
+
+    Las inserciones de pedidos se agrupan: las que llegan dentro de la misma
+    ventana, o mientras el lote anterior se está escribiendo, se confirman en
+    una sola transacción y cada llamador recibe su propio pedido_id. Sin
+    ventana, un pedido que no encuentra nada escribiéndose se confirma en el
+    acto, sin el coste del lote.
+
+    Un pedido con clave de idempotencia se guarda una sola vez: repetirlo
+    devuelve el pedido_id original. Las últimas `claves_recientes` claves se
+    recuerdan en memoria y sus repeticiones no llegan a SQLite; las demás
+    las detiene el índice único.
+
+    Los pedidos nuevos se guardan sin notificar hasta que `marcar_notificados`
+    confirma que su aviso llegó al grupo: si el proceso cae entre el commit
+    y el envío, `obtener_pedidos_sin_notificar` los devuelve al arrancar.
+
+    Cada operación se mide en `metricas` desde que se pide hasta que
+    termina, incluida la espera por su hilo.
+    """
+
+    def __init__(self, db_name="gamedin_pedidos.db", lectores=4, synchronous="NORMAL",
+                 cache_size=-16000, mmap_size=64 * 1024 * 1024, ventana_lote_ms=0, max_lote=100,
+                 claves_recientes=1024, metricas=None):
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_VALIDOS:
+            raise ValueError(f"PRAGMA synchronous inválido: {synchronous}")
+
+        self.db_name = db_name
+        self.synchronous = synchronous
+        self.cache_size = int(cache_size)
+        self.mmap_size = int(mmap_size)
+        self.ventana_lote = max(0.0, ventana_lote_ms) / 1000
+        self.max_lote = max(1, max_lote)
+
+        # Cola de escritura agrupada (group commit)
+        self._pendientes = []
+        self._temporizador_lote = None
+        self._lotes_en_curso = set()
+        # (clave de idempotencia, user_id) → futuro con (pedido_id, nuevo), en un LRU
+        self.claves_recientes = claves_recientes
+        self._claves = OrderedDict()
+
+        self._local = threading.local()
+        self._conexiones = []
+        self._conexiones_lock = threading.Lock()
+        self._escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gamedin-db-escritor")
+        self._lectores = ThreadPoolExecutor(max_workers=max(1, lectores), thread_name_prefix="gamedin-db-lector")
+
+        metricas = metricas or Metricas()
+        self._latencia = metricas.histograma(
+            "gamedin_db_segundos", "Duración de las operaciones de base de datos", ("operacion", "hilo")
+        )
+        self._errores = metricas.contador(
+            "gamedin_db_errores_total", "Operaciones de base de datos fallidas", ("operacion", "hilo")
+        )
+        metricas.funcion(
+            "gamedin_db_pedidos_en_espera", "Pedidos esperando el próximo commit agrupado",
+            lambda: len(self._pendientes)
+        )
+        self._repetidos = metricas.contador(
+            "gamedin_db_pedidos_repetidos_total", "Pedidos repetidos resueltos con el pedido original",
+            ("origen",)
+        )
+
+        self._escritor.submit(self.init_database).result()
+
+    # -------------------------------------------------
+    # Pool de conexiones
+    # -------------------------------------------------
+    def _conectar(self):
+        """Abre una conexión nueva con los pragmas configurados"""
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={self.cache_size}")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _conexion(self):
+        """Devuelve la conexión persistente del hilo actual"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._conectar()
+            self._local.conn = conn
+            with self._conexiones_lock:
+                self._conexiones.append(conn)
+        return conn
+
+    async def _ejecutar(self, executor, hilo, funcion, args):
+        operacion = funcion.__name__.lstrip("_")
+        inicio = time.perf_counter()
+        try:
+            with tramo("db", operacion=operacion, hilo=hilo):
+                return await asyncio.get_running_loop().run_in_executor(executor, funcion, *args)
+        except Exception:
+            self._errores.sumar(operacion, hilo)
+            raise
+        finally:
+            self._latencia.observar(time.perf_counter() - inicio, operacion, hilo)
+
+    async def _escribir(self, funcion, *args):
+        """Ejecuta una función en el hilo escritor"""
+        return await self._ejecutar(self._escritor, "escritor", funcion, args)
+
+    async def _leer(self, funcion, *args):
+        """Ejecuta una función en uno de los hilos lectores"""
+        return await self._ejecutar(self._lectores, "lector", funcion, args)
+
+    # -------------------------------------------------
+    # Esquema
+    # -------------------------------------------------
+    def init_database(self):
+        """Inicializa la base de datos"""
+        conn = self._conexion()
+
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS pedidos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    username TEXT,
+                    producto TEXT,
+                    cantidad TEXT,
+                    id_juego TEXT,
+                    nombre_cliente TEXT,
+                    contacto_cliente TEXT,
+                    precio INTEGER,
+                    fecha INTEGER,
+                    estado TEXT DEFAULT 'pendiente'
+                )
+            ''')
+
+        self._aplicar_migraciones(conn)
+        logger.info("Base de datos inicializada correctamente")
+
+    def _aplicar_migraciones(self, conn):
+        """Aplica en orden las migraciones pendientes, cada una en su transacción"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+        for numero, descripcion, sentencias in MIGRACIONES:
+            if numero <= version:
+                continue
+
+            conn.execute("BEGIN")
+            try:
+                for sentencia in sentencias:
+                    if callable(sentencia):
+                        sentencia(conn)
+                    else:
+                        conn.execute(sentencia)
+                conn.execute(f"PRAGMA user_version = {numero}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                logger.error(f"Error aplicando migración {numero}: {descripcion}")
+                raise
+
+            version = numero
+            logger.info(f"Migración {numero} aplicada: {descripcion}")
+
+    # -------------------------------------------------
+    # Pedidos
+    # -------------------------------------------------
+    def _guardar_lote(self, lote):
+        conn = self._conexion()
+
+        with conn:
+            # Una clave ya guardada no inserta nada: se devuelve su pedido
+            resultados = []
+            nuevos = []
+            for pedido_data in lote:
+                cursor = conn.execute(SQL_INSERTAR_PEDIDO, pedido_data)
+                if cursor.rowcount:
+                    resultados.append((cursor.lastrowid, True))
+                    nuevos.append(pedido_data)
+                else:
+                    pedido_id = conn.execute(SQL_PEDIDO_POR_CLAVE, (pedido_data[9], pedido_data[0])).fetchone()[0]
+                    resultados.append((pedido_id, False))
+
+            # Agregados de los pedidos nuevos por producto y por (hora,
+            # producto): una sola actualización por fila de agregados
+            ventas = {}
+            ventas_hora = {}
+            for pedido_data in nuevos:
+                producto, precio = pedido_data[2], pedido_data[7] or 0
+                pedidos, ingresos = ventas.get(producto, (0, 0))
+                ventas[producto] = (pedidos + 1, ingresos + precio)
+
+                clave = (franja_hora(pedido_data[8]), producto)
+                pedidos, ingresos, unidades = ventas_hora.get(clave, (0, 0, 0))
+                ventas_hora[clave] = (pedidos + 1, ingresos + precio, unidades + unidades_pedido(pedido_data[3]))
+
+            ventas_dia = {}
+            for (hora, producto), (pedidos, ingresos, unidades) in ventas_hora.items():
+                clave = (hora[:10], producto)
+                acumulado = ventas_dia.get(clave, (0, 0, 0))
+                ventas_dia[clave] = (acumulado[0] + pedidos, acumulado[1] + ingresos, acumulado[2] + unidades)
+
+            conn.executemany(
+                SQL_SUMAR_VENTAS_PRODUCTO,
+                [(producto, pedidos, ingresos) for producto, (pedidos, ingresos) in ventas.items()]
+            )
+            conn.executemany(SQL_SUMAR_VENTAS_HORA, [clave + valores for clave, valores in ventas_hora.items()])
+            conn.executemany(SQL_SUMAR_VENTAS_DIA, [clave + valores for clave, valores in ventas_dia.items()])
+
+        pedido_ids = [pedido_id for pedido_id, nuevo in resultados if nuevo]
+        if len(pedido_ids) == 1:
+            logger.info(f"Pedido #{pedido_ids[0]} guardado correctamente")
+        elif pedido_ids:
+            logger.info(f"Pedidos #{pedido_ids[0]}-#{pedido_ids[-1]} guardados en un solo commit")
+        if len(pedido_ids) < len(resultados):
+            logger.info(f"{len(resultados) - len(pedido_ids)} pedidos repetidos no se guardaron de nuevo")
+        return resultados
+
+    async def guardar_pedido(self, pedido_data):
+        """Guarda un pedido en la base de datos y devuelve (pedido_id, nuevo).
+
+        La fecha va en milisegundos UTC (ahora_ms) y el último campo es la
+        clave de idempotencia, o None. Si la clave ya se guardó, `nuevo` es
+        False y pedido_id es el del pedido original.
+        """
+        clave = (pedido_data[9], pedido_data[0])
+        if clave[0] is not None:
+            anterior = self._claves.get(clave)
+            # Un intento fallido o cancelado no cuenta: se vuelve a intentar
+            if anterior is not None and not (anterior.done() and (anterior.cancelled() or anterior.exception())):
+                self._claves.move_to_end(clave)
+                self._repetidos.sumar("memoria")
+                pedido_id, _ = await asyncio.shield(anterior)
+                return pedido_id, False
+
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._pendientes.append((pedido_data, futuro))
+        if clave[0] is not None:
+            self._claves[clave] = futuro
+            if len(self._claves) > self.claves_recientes:
+                self._claves.popitem(last=False)
+
+        if len(self._pendientes) >= self.max_lote:
+            self._despachar_lote()
+        elif not self.ventana_lote and not self._lotes_en_curso:
+            # Sin ventana y sin nada escribiéndose no hay con quién agrupar:
+            # se confirma ya, en esta misma tarea y sin temporizador
+            return await self._confirmar_solo()
+        elif self._temporizador_lote is None and not self._lotes_en_curso:
+            # Si ya hay un lote escribiéndose, este pedido sale con el siguiente
+            self._temporizador_lote = loop.call_later(self.ventana_lote, self._despachar_lote)
+
+        return await futuro
+
+    async def _confirmar_solo(self):
+        """Confirma el único pedido pendiente en la tarea del llamador.
+
+        Mientras se escribe cuenta como lote en curso: lo que llegue entre
+        tanto sale en el siguiente lote. Si el llamador se cancela, su pedido
+        queda como intento cancelado y repetirlo lo resuelve el índice único.
+        """
+        lote, self._pendientes = self._pendientes, []
+        futuro = lote[0][1]
+        self._lotes_en_curso.add(futuro)
+        try:
+            await self._confirmar_lote(lote)
+        finally:
+            if not futuro.done():
+                futuro.cancel()
+            self._fin_lote(futuro)
+        return futuro.result()
+
+    def _despachar_lote(self):
+        """Envía al hilo escritor los pedidos acumulados en la ventana"""
+        if self._temporizador_lote is not None:
+            self._temporizador_lote.cancel()
+            self._temporizador_lote = None
+
+        lote, self._pendientes = self._pendientes, []
+        if not lote:
+            return
+
+        tarea = asyncio.ensure_future(self._confirmar_lote(lote))
+        self._lotes_en_curso.add(tarea)
+        tarea.add_done_callback(self._fin_lote)
+
+    async def _confirmar_lote(self, lote):
+        try:
+            resultados = await self._escribir(self._guardar_lote, [pedido_data for pedido_data, _ in lote])
+        except Exception as e:
+            logger.error(f"Error guardando lote de {len(lote)} pedidos: {e}")
+            for pedido_data, futuro in lote:
+                clave = (pedido_data[9], pedido_data[0])
+                if self._claves.get(clave) is futuro:
+                    del self._claves[clave]
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+
+        for (_, futuro), resultado in zip(lote, resultados):
+            if not resultado[1]:
+                self._repetidos.sumar("sqlite")
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+    def _fin_lote(self, tarea):
+        self._lotes_en_curso.discard(tarea)
+        # Lo acumulado mientras se escribía este lote forma el siguiente
+        if self._pendientes and self._temporizador_lote is None and not self._lotes_en_curso:
+            self._despachar_lote()
+
+    def _obtener_pedidos(self, limit):
+        return self._conexion().execute(SQL_ULTIMOS_PEDIDOS, (limit,)).fetchall()
+
+    async def obtener_pedidos(self, limit=10):
+        """Obtiene los últimos pedidos"""
+        return await self._leer(self._obtener_pedidos, limit)
+
+    def _pagina_pedidos(self, filtros, cursor, hacia_recientes, limite):
+        condiciones, params = parametros_filtros(filtros)
+
+        # Keyset: se sigue desde (fecha, id) del último pedido mostrado, así
+        # cualquier página cuesta lo mismo sin importar su profundidad
+        if cursor is not None:
+            operador = ">" if hacia_recientes else "<"
+            condiciones.append(f"(fecha, id) {operador} ({SQL_CURSOR_PEDIDO}, ?)")
+            params += [cursor, cursor]
+
+        orden = "ASC" if hacia_recientes else "DESC"
+        sql = "SELECT * FROM pedidos"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        sql += f" ORDER BY fecha {orden}, id {orden} LIMIT ?"
+
+        filas = self._conexion().execute(sql, params + [limite + 1]).fetchall()
+        hay_mas = len(filas) > limite
+        filas = filas[:limite]
+        if hacia_recientes:
+            filas.reverse()
+        return filas, hay_mas
+
+    async def obtener_pagina_pedidos(self, filtros=None, cursor=None, hacia_recientes=False, limite=10):
+        """Obtiene una página de pedidos, del más reciente al más antiguo.
+
+        `filtros` usa las claves de FILTROS_PEDIDOS. `cursor` es el id del
+        pedido desde el que se continúa: sin él se empieza por los más
+        recientes. Devuelve (pedidos, hay_mas) donde `hay_mas` indica si
+        quedan pedidos en la dirección pedida.
+        """
+        filtros = _validar_filtros(filtros)
+        return await self._leer(self._pagina_pedidos, filtros, cursor, hacia_recientes, limite)
+
+    # -------------------------------------------------
+    # Notificación al grupo
+    # -------------------------------------------------
+    def _marcar_notificados(self, pedido_ids):
+        conn = self._conexion()
+        with conn:
+            conn.executemany(SQL_MARCAR_NOTIFICADO, [(pedido_id,) for pedido_id in pedido_ids])
+
+    async def marcar_notificados(self, pedido_ids):
+        """Marca los pedidos cuyo aviso ya llegó al grupo de administradores"""
+        await self._escribir(self._marcar_notificados, list(pedido_ids))
+
+    def _pedidos_sin_notificar(self):
+        return self._conexion().execute(SQL_PEDIDOS_SIN_NOTIFICAR).fetchall()
+
+    async def obtener_pedidos_sin_notificar(self):
+        """Pedidos guardados cuyo aviso al grupo nunca se confirmó.
+
+        Cada fila es (id, user_id, username, producto, cantidad, id_juego,
+        nombre_cliente, contacto_cliente, precio, fecha).
+        """
+        return await self._leer(self._pedidos_sin_notificar)
+
+    # -------------------------------------------------
+    # Estado de los pedidos
+    # -------------------------------------------------
+    def _cambiar_estado_pedido(self, pedido_id, esperado, nuevo):
+        conn = self._conexion()
+        with conn:
+            if conn.execute(SQL_CAMBIAR_ESTADO, (nuevo, pedido_id, esperado)).rowcount:
+                return True, nuevo
+            fila = conn.execute(SQL_ESTADO_PEDIDO, (pedido_id,)).fetchone()
+        return False, fila[0] if fila else None
+
+    async def cambiar_estado_pedido(self, pedido_id, esperado, nuevo):
+        """Pasa un pedido de `esperado` a `nuevo` solo si sigue en `esperado`.
+
+        Es un compare-and-set: si otro operador ya lo movió, no se toca.
+        Devuelve (cambiado, estado actual); el estado es None si el pedido
+        no existe.
+        """
+        if nuevo not in TRANSICIONES_ESTADO.get(esperado, ()):
+            raise ValueError(f"Transición de estado inválida: {esperado} → {nuevo}")
+        return await self._escribir(self._cambiar_estado_pedido, pedido_id, esperado, nuevo)
+
+    def _obtener_estado_pedido(self, pedido_id):
+        fila = self._conexion().execute(SQL_ESTADO_PEDIDO, (pedido_id,)).fetchone()
+        return fila[0] if fila else None
+
+    async def obtener_estado_pedido(self, pedido_id):
+        """Estado actual de un pedido, o None si no existe"""
+        return await self._leer(self._obtener_estado_pedido, pedido_id)
+
+    def _cola_pedidos(self, estado, cursor, limite, max_conteo):
+        conn = self._conexion()
+        sql = "SELECT * FROM pedidos WHERE estado = ?"
+        params = [estado]
+        if cursor is not None:
+            sql += f" AND (fecha, id) > ({SQL_CURSOR_PEDIDO}, ?)"
+            params += [cursor, cursor]
+        sql += " ORDER BY fecha, id LIMIT ?"
+
+        filas = conn.execute(sql, params + [limite + 1]).fetchall()
+        total = conn.execute(SQL_CONTAR_COLA, (estado, max_conteo)).fetchone()[0]
+        return filas[:limite], len(filas) > limite, total
+
+    async def obtener_cola_pedidos(self, estado="pendiente", cursor=None, limite=10, max_conteo=1000):
+        """Pedidos en `estado`, del más antiguo al más reciente.
+
+        Recorre el índice (estado, fecha) desde `cursor` (id del último
+        pedido mostrado), así cada página cuesta lo mismo con cualquier
+        atasco. Devuelve (pedidos, hay_mas, total) con `total` contado
+        hasta `max_conteo`.
+        """
+        if estado not in TRANSICIONES_ESTADO:
+            raise ValueError(f"Estado de pedido desconocido: {estado}")
+        return await self._leer(self._cola_pedidos, estado, cursor, limite, max_conteo)
+
+    # -------------------------------------------------
+    # Exportación
+    # -------------------------------------------------
+    def _exportar_pedidos(self, escribir, filtros, desde_id):
+        condiciones, params = parametros_filtros(filtros)
+
+        # Incremental: rango de rowid en orden de id. Completa: orden de
+        # fecha por el índice del filtro. En ambos casos el orden sale de un
+        # índice y SQLite no ordena en memoria.
+        if desde_id:
+            condiciones.append("id > ?")
+            params.append(desde_id)
+            orden = "id"
+        else:
+            orden = "fecha, id"
+
+        sql = "SELECT * FROM pedidos"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        sql += f" ORDER BY {orden}"
+
+        cursor = self._conexion().execute(sql, params)
+        columnas = [descripcion[0] for descripcion in cursor.description]
+
+        def filas():
+            while True:
+                lote = cursor.fetchmany(LOTE_EXPORTACION)
+                if not lote:
+                    return
+                yield from lote
+
+        try:
+            return escribir(columnas, filas())
+        finally:
+            cursor.close()
+
+    async def exportar_pedidos(self, escribir, filtros=None, desde_id=0):
+        """Recorre los pedidos por lotes y los entrega a `escribir(columnas, filas)`.
+
+        `filas` es un generador alimentado con fetchmany: nunca hay más de
+        LOTE_EXPORTACION pedidos en memoria. `escribir` corre en un hilo
+        lector y lo que devuelve es el resultado. Con `desde_id` solo se
+        exportan los pedidos posteriores a ese id.
+        """
+        filtros = _validar_filtros(filtros)
+        return await self._leer(self._exportar_pedidos, escribir, filtros, desde_id)
+
+    def _ultimo_id_exportado(self):
+        return self._conexion().execute(SQL_ULTIMA_EXPORTACION).fetchone()[0]
+
+    async def ultimo_id_exportado(self):
+        """Mayor id de pedido incluido en una exportación anterior (0 si no hay)"""
+        return await self._leer(self._ultimo_id_exportado)
+
+    def _registrar_exportacion(self, formato, filas, ultimo_id):
+        conn = self._conexion()
+        with conn:
+            conn.execute(SQL_REGISTRAR_EXPORTACION, (datetime.now().isoformat(), formato, filas, ultimo_id))
+
+    async def registrar_exportacion(self, formato, filas, ultimo_id):
+        """Anota una exportación entregada; la siguiente incremental sigue desde `ultimo_id`"""
+        await self._escribir(self._registrar_exportacion, formato, filas, ultimo_id)
+
+    def _obtener_estadisticas(self):
+        conn = self._conexion()
+
+        # Se leen de ventas_por_producto: el coste depende del número de
+        # productos, no del historial de pedidos
+        total_pedidos, total_ventas = conn.execute(SQL_TOTALES).fetchone()
+        producto_popular = conn.execute(SQL_PRODUCTO_POPULAR).fetchone()
+
+        return total_pedidos, total_ventas, producto_popular
+
+    async def obtener_estadisticas(self):
+        """Obtiene total de pedidos, total de ventas y producto más vendido"""
+        return await self._leer(self._obtener_estadisticas)
+
+    def _reconstruir_agregados(self):
+        conn = self._conexion()
+
+        with conn:
+            anteriores = {fila[0]: fila[1:] for fila in conn.execute(SQL_AGREGADOS)}
+            conn.execute("DELETE FROM ventas_por_producto")
+            conn.execute("INSERT INTO ventas_por_producto (producto, pedidos, ingresos) " + SQL_AGREGADOS_DESDE_PEDIDOS)
+            nuevos = {fila[0]: fila[1:] for fila in conn.execute(SQL_AGREGADOS)}
+
+        diferencias = [
+            (producto, anteriores.get(producto, (0, 0)), nuevos.get(producto, (0, 0)))
+            for producto in sorted(set(anteriores) | set(nuevos))
+            if anteriores.get(producto, (0, 0)) != nuevos.get(producto, (0, 0))
+        ]
+        if diferencias:
+            logger.warning(f"Agregados reconstruidos con {len(diferencias)} diferencias: {diferencias}")
+        else:
+            logger.info("Agregados reconstruidos sin diferencias")
+        return diferencias
+
+    async def reconstruir_agregados(self):
+        """Recalcula ventas_por_producto desde pedidos.
+
+        Devuelve una lista de (producto, (pedidos, ingresos) anteriores,
+        (pedidos, ingresos) recalculados) con los productos que no coincidían.
+        """
+        return await self._escribir(self._reconstruir_agregados)
+
+    # -------------------------------------------------
+    # Ventas por hora y por día
+    # -------------------------------------------------
+    def _obtener_ventas(self, sql, desde, hasta):
+        return self._conexion().execute(sql, (desde, hasta)).fetchall()
+
+    async def obtener_ventas_por_dia(self, desde, hasta):
+        """Filas (dia, producto, pedidos, ingresos, unidades) de los días en [desde, hasta).
+
+        Las fechas son 'AAAA-MM-DD'. Se leen de ventas_por_dia: el coste
+        depende de los días y productos del rango, no de los pedidos.
+        """
+        return await self._leer(self._obtener_ventas, SQL_VENTAS_POR_DIA, desde, hasta)
+
+    async def obtener_ventas_por_hora(self, desde, hasta):
+        """Filas (hora, producto, pedidos, ingresos, unidades) de las horas en [desde, hasta).
+
+        `hora` es 'AAAA-MM-DD HH'; `desde` y `hasta` pueden ser días completos.
+        """
+        return await self._leer(self._obtener_ventas, SQL_VENTAS_POR_HORA, desde, hasta)
+
+    def _rango_fechas_pedidos(self):
+        return self._conexion().execute("SELECT MIN(fecha), MAX(fecha) FROM pedidos").fetchone()
+
+    def _reconstruir_ventas_dia(self, dia, siguiente):
+        conn = self._conexion()
+
+        with conn:
+            anteriores = conn.execute(SQL_VENTAS_POR_HORA, (dia, siguiente)).fetchall()
+            conn.execute("DELETE FROM ventas_por_hora WHERE hora >= ? AND hora < ?", (dia, siguiente))
+            conn.execute("DELETE FROM ventas_por_dia WHERE dia = ?", (dia,))
+            conn.execute(
+                "INSERT INTO ventas_por_hora (hora, producto, pedidos, ingresos, unidades) "
+                + SQL_VENTAS_HORA_DESDE_PEDIDOS.format(donde="WHERE fecha >= ? AND fecha < ?"),
+                (a_epoch_ms(dia), a_epoch_ms(siguiente))
+            )
+            conn.execute(
+                "INSERT INTO ventas_por_dia (dia, producto, pedidos, ingresos, unidades) "
+                + SQL_VENTAS_DIA_DESDE_HORAS.format(donde="WHERE hora >= ? AND hora < ?"),
+                (dia, siguiente)
+            )
+            nuevas = conn.execute(SQL_VENTAS_POR_HORA, (dia, siguiente)).fetchall()
+
+        return anteriores != nuevas
+
+    async def reconstruir_ventas_por_tiempo(self):
+        """Recalcula ventas_por_hora y ventas_por_dia desde pedidos, un día por transacción.
+
+        Entre un día y el siguiente el hilo escritor atiende los pedidos
+        nuevos, así rellenar un historial largo no frena las compras.
+        Devuelve los días ('AAAA-MM-DD') cuyos agregados no coincidían.
+        """
+        primero, ultimo = await self._leer(self._rango_fechas_pedidos)
+        if primero is None:
+            return []
+
+        dia, fin = (fecha.date() for fecha in fechas_locales((primero, ultimo)))
+        diferencias = []
+        while dia <= fin:
+            siguiente = dia + timedelta(days=1)
+            if await self._escribir(self._reconstruir_ventas_dia, dia.isoformat(), siguiente.isoformat()):
+                diferencias.append(dia.isoformat())
+            dia = siguiente
+
+        if diferencias:
+            logger.warning(f"Ventas por tiempo reconstruidas con {len(diferencias)} días distintos: {diferencias[:10]}")
+        else:
+            logger.info("Ventas por tiempo reconstruidas sin diferencias")
+        return diferencias
+
+    # -------------------------------------------------
+    # Sesiones (persistencia de user_data y conversaciones)
+    # -------------------------------------------------
+    def _guardar_sesiones(self, sesiones, sesiones_borradas, conversaciones, conversaciones_borradas):
+        conn = self._conexion()
+
+        with conn:
+            conn.executemany(SQL_GUARDAR_SESION, sesiones)
+            conn.executemany(SQL_BORRAR_SESION, [(user_id,) for user_id in sesiones_borradas])
+            conn.executemany(SQL_GUARDAR_CONVERSACION, conversaciones)
+            conn.executemany(SQL_BORRAR_CONVERSACION, conversaciones_borradas)
+
+    async def guardar_sesiones(self, sesiones, sesiones_borradas, conversaciones, conversaciones_borradas):
+        """Escribe en una sola transacción un lote de sesiones y estados de conversación.
+
+        `sesiones` son pares (user_id, datos serializados), `conversaciones`
+        ternas (nombre, clave, estado) y `conversaciones_borradas` pares
+        (nombre, clave).
+        """
+        await self._escribir(
+            self._guardar_sesiones, sesiones, sesiones_borradas, conversaciones, conversaciones_borradas
+        )
+
+    def _cargar_sesiones(self):
+        return self._conexion().execute("SELECT user_id, datos FROM sesiones_usuario").fetchall()
+
+    async def cargar_sesiones(self):
+        """Devuelve todas las sesiones guardadas como pares (user_id, datos)"""
+        return await self._leer(self._cargar_sesiones)
+
+    def _cargar_conversaciones(self, nombre):
+        return self._conexion().execute(
+            "SELECT clave, estado FROM conversaciones WHERE nombre = ?", (nombre,)
+        ).fetchall()
+
+    async def cargar_conversaciones(self, nombre):
+        """Devuelve los estados guardados de una conversación como pares (clave, estado)"""
+        return await self._leer(self._cargar_conversaciones, nombre)
+
+    async def cerrar(self):
+        """Espera a que terminen las operaciones pendientes y cierra el pool"""
+        self._despachar_lote()
+        if self._lotes_en_curso:
+            await asyncio.gather(*self._lotes_en_curso, return_exceptions=True)
+
+        self._escritor.shutdown(wait=True)
+        self._lectores.shutdown(wait=True)
+        with self._conexiones_lock:
+            for conn in self._conexiones:
+                conn.close()
+            self._conexiones.clear()
+        logger.info("Base de datos cerrada correctamente")
@@ -0,0 +1,274 @@
+# envios.py - Planificador de mensajes salientes hacia la Bot API
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+import httpx
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metricas import Metricas
+from trazas import tramo
+
+logger = logging.getLogger(__name__)
+
+# Carriles de prioridad: los de número menor salen primero
+PRIORIDAD_CLIENTE = 0
+PRIORIDAD_ADMIN = 1
+NOMBRES_PRIORIDAD = ("cliente", "admin")
+
+# Métodos que crean un mensaje nuevo en cada llamada: repetirlos duplica
+METODOS_NO_IDEMPOTENTES = ("send", "forward", "copy")
+# Fallos de httpx en los que la petición nunca salió hacia la Bot API
+ERRORES_SIN_ENVIAR = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+def reintentable(endpoint, error):
+    """Si un error de red permite repetir la llamada sin riesgo.
+
+    Las lecturas, ediciones y respuestas a callbacks se pueden repetir. Un
+    sendMessage solo si no llegó a conectar: tras un ReadTimeout o un corte a
+    mitad Telegram pudo haberlo entregado y repetirlo lo enviaría dos veces.
+    """
+    if not endpoint.lower().startswith(METODOS_NO_IDEMPOTENTES):
+        return True
+    return isinstance(error.__cause__, ERRORES_SIN_ENVIAR)
+
+class Cubeta:
+    """Token bucket: `tasa` tokens por segundo con ráfagas de hasta `capacidad`"""
+
+    __slots__ = ("tasa", "capacidad", "tokens", "ultimo")
+
+    def __init__(self, tasa, capacidad):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.tokens = capacidad
+        self.ultimo = time.monotonic()
+
+    def espera(self, ahora):
+        """Segundos hasta que haya un token disponible"""
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.tasa
+
+    def consumir(self):
+        self.tokens -= 1
+
+    def pausar(self, segundos):
+        """Vacía la cubeta para que no entregue tokens en `segundos`"""
+        self.tokens = min(self.tokens, 1 - segundos * self.tasa)
+
+class CubetasRecientes:
+    """Una cubeta por clave (chat, usuario) en un LRU de `maximo` entradas.
+
+    Así la memoria no crece con cada clave nueva; la que se descarta es la
+    más inactiva, que ya estaría llena. `crear(clave)` hace la cubeta de una
+    clave que no se ha visto.
+    """
+
+    __slots__ = ("crear", "maximo", "_cubetas")
+
+    def __init__(self, crear, maximo):
+        self.crear = crear
+        self.maximo = maximo
+        self._cubetas = OrderedDict()
+
+    def __len__(self):
+        return len(self._cubetas)
+
+    def obtener(self, clave):
+        cubeta = self._cubetas.get(clave)
+        if cubeta is None:
+            cubeta = self._cubetas[clave] = self.crear(clave)
+            if len(self._cubetas) > self.maximo:
+                self._cubetas.popitem(last=False)
+        else:
+            self._cubetas.move_to_end(clave)
+        return cubeta
+
+# =====================================================
+# PLANIFICADOR DE ENVÍOS
+# =====================================================
+class PlanificadorEnvios(BaseRateLimiter):
+    """Limita y ordena todas las peticiones del bot a Telegram.
+
+    Cada envío a un chat necesita un token de la cubeta global y otro de la
+    cubeta de ese chat (los grupos tienen un límite por minuto más bajo). Las
+    peticiones esperan en carriles por prioridad: las respuestas a clientes
+    salen antes que el tráfico hacia administradores. Un 429 pausa el chat
+    durante `retry_after` y se reintenta; los errores de red se reintentan
+    con backoff exponencial solo si repetir la petición no puede duplicar un
+    mensaje (ver `reintentable`).
+
+    En `metricas` se separa la espera por turno del tiempo que tarda la Bot
+    API en responder cada intento.
+    """
+
+    def __init__(self, global_por_seg=30, chat_por_seg=1, grupo_por_min=20,
+                 max_reintentos=5, max_chats=10000, metricas=None):
+        self.chat_por_seg = chat_por_seg
+        self.grupo_por_min = grupo_por_min
+        self.max_reintentos = max_reintentos
+        self.max_chats = max_chats
+
+        self._global = Cubeta(global_por_seg, global_por_seg)
+        self._chats = CubetasRecientes(self._nueva_cubeta_chat, max_chats)
+        self._carriles = (deque(), deque())
+        self._hay_trabajo = asyncio.Event()
+        self._despachador = None
+        self._envios = set()
+
+        metricas = metricas or Metricas()
+        self._latencia = metricas.histograma(
+            "gamedin_api_segundos", "Duración de cada llamada a la Bot API", ("metodo",)
+        )
+        self._espera = metricas.histograma(
+            "gamedin_api_espera_segundos", "Espera por turno antes de llamar a la Bot API", ("prioridad",)
+        )
+        self._errores = metricas.contador(
+            "gamedin_api_errores_total", "Llamadas a la Bot API fallidas", ("metodo", "tipo")
+        )
+        metricas.funcion(
+            "gamedin_api_en_cola", "Peticiones esperando turno", lambda: sum(map(len, self._carriles))
+        )
+        metricas.funcion(
+            "gamedin_envios_en_curso", "Envíos en segundo plano sin entregar", lambda: len(self._envios)
+        )
+
+    async def initialize(self):
+        if self._despachador is None:
+            self._despachador = asyncio.get_running_loop().create_task(self._despachar())
+
+    async def shutdown(self):
+        if self._envios:
+            _, pendientes = await asyncio.wait(self._envios, timeout=10)
+            if pendientes:
+                logger.warning(f"{len(pendientes)} envíos sin entregar al detener el bot")
+        if self._despachador is not None:
+            self._despachador.cancel()
+            try:
+                await self._despachador
+            except asyncio.CancelledError:
+                pass
+            self._despachador = None
+
+    # -------------------------------------------------
+    # Cubetas y turnos
+    # -------------------------------------------------
+    def _nueva_cubeta_chat(self, chat_id):
+        """Los grupos tienen un límite por minuto; los chats privados, por segundo"""
+        if str(chat_id).startswith(("-", "@")):
+            return Cubeta(self.grupo_por_min / 60, 3)
+        return Cubeta(self.chat_por_seg, 3)
+
+    async def _turno(self, chat_id, prioridad):
+        """Espera hasta que el chat y el límite global permitan enviar"""
+        futuro = asyncio.get_running_loop().create_future()
+        self._carriles[prioridad].append((chat_id, futuro))
+        self._hay_trabajo.set()
+        await futuro
+
+    def _conceder(self):
+        """Da turno a todo lo que se pueda; devuelve la espera hasta el siguiente"""
+        ahora = time.monotonic()
+        proxima = None
+
+        for carril in self._carriles:
+            restantes = deque()
+            while carril:
+                chat_id, futuro = carril.popleft()
+                if futuro.done():
+                    continue
+
+                espera_global = self._global.espera(ahora)
+                if espera_global > 0:
+                    restantes.append((chat_id, futuro))
+                    restantes.extend(carril)
+                    carril.clear()
+                    carril.extend(restantes)
+                    return espera_global
+
+                cubeta = self._chats.obtener(chat_id)
+                espera = cubeta.espera(ahora)
+                if espera > 0:
+                    restantes.append((chat_id, futuro))
+                    proxima = espera if proxima is None else min(proxima, espera)
+                    continue
+
+                self._global.consumir()
+                cubeta.consumir()
+                futuro.set_result(None)
+            carril.extend(restantes)
+
+        return proxima
+
+    async def _despachar(self):
+        while True:
+            self._hay_trabajo.clear()
+            espera = self._conceder()
+            try:
+                await asyncio.wait_for(self._hay_trabajo.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+
+    # -------------------------------------------------
+    # Interfaz de BaseRateLimiter
+    # -------------------------------------------------
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        prioridad = (rate_limit_args or {}).get("prioridad", PRIORIDAD_CLIENTE)
+        chat_id = data.get("chat_id")
+        intentos = 0
+
+        while True:
+            if chat_id is not None:
+                inicio = time.perf_counter()
+                with tramo("turno", prioridad=NOMBRES_PRIORIDAD[prioridad]):
+                    await self._turno(chat_id, prioridad)
+                self._espera.observar(time.perf_counter() - inicio, NOMBRES_PRIORIDAD[prioridad])
+
+            inicio = time.perf_counter()
+            try:
+                with tramo("api", metodo=endpoint, intento=intentos):
+                    return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self._errores.sumar(endpoint, "limite")
+                espera = e.retry_after
+                if chat_id is not None:
+                    self._chats.obtener(chat_id).pausar(espera)
+                logger.warning(f"{endpoint} a {chat_id}: límite de Telegram, reintento en {espera}s")
+            except BadRequest:
+                self._errores.sumar(endpoint, "peticion")
+                raise
+            except NetworkError as e:
+                self._errores.sumar(endpoint, "red")
+                if not reintentable(endpoint, e):
+                    raise
+                espera = min(30, 0.5 * 2 ** intentos)
+                logger.warning(f"{endpoint} a {chat_id}: {e}, reintento en {espera:.1f}s")
+            except Exception:
+                self._errores.sumar(endpoint, "otro")
+                raise
+            finally:
+                self._latencia.observar(time.perf_counter() - inicio, endpoint)
+
+            intentos += 1
+            if intentos > self.max_reintentos:
+                raise NetworkError(f"{endpoint} a {chat_id}: sin éxito tras {intentos} intentos")
+            await asyncio.sleep(espera)
+
+    # -------------------------------------------------
+    # Envíos en segundo plano
+    # -------------------------------------------------
+    def encolar(self, coroutine, descripcion):
+        """Envía en segundo plano; el handler sigue sin esperar la entrega"""
+        tarea = asyncio.ensure_future(self._entregar(coroutine, descripcion))
+        self._envios.add(tarea)
+        tarea.add_done_callback(self._envios.discard)
+
+    @staticmethod
+    async def _entregar(coroutine, descripcion):
+        try:
+            await coroutine
+            logger.info(f"{descripcion}: entregado")
+        except Exception as e:
+            logger.error(f"{descripcion}: error de entrega: {e}")
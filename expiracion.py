@@ -0,0 +1,145 @@
+# expiracion.py - Caducidad de checkouts abandonados
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import ConversationHandler
+
+from checkout import NOMBRES_PASO
+from metricas import Metricas
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# EXPIRADOR DE CHECKOUTS
+# =====================================================
+class ExpiradorCheckouts:
+    """Termina las compras que llevan `ttl` segundos sin actividad.
+
+    Con un TTL fijo, el orden de última actividad es el orden de caducidad:
+    los checkouts viven en un OrderedDict y cada update mueve el suyo al
+    final, así renovar y caducar cuestan O(1) y una sola tarea duerme hasta
+    el plazo del primero. Al caducar se borra el estado de la conversación
+    y el user_data del usuario, y se llama a `avisar(bot, chat_id)` si se
+    indicó. Con `ttl` 0 solo se cuentan los checkouts vivos.
+    """
+
+    def __init__(self, ttl, avisar=None, metricas=None):
+        self.ttl = ttl
+        self.avisar = avisar
+        self.conversacion = None
+        self.expirados = 0
+        self._plazos = OrderedDict()
+        self._hay_plazos = asyncio.Event()
+        self._tarea = None
+
+        metricas = metricas or Metricas()
+        self._abandonados = metricas.contador(
+            "gamedin_checkouts_abandonados_total", "Checkouts terminados sin pedido", ("paso", "motivo")
+        )
+        metricas.funcion("gamedin_checkouts_vivos", "Checkouts en curso", lambda: self.vivos)
+        metricas.funcion(
+            "gamedin_checkouts_expirados_total", "Checkouts cancelados por inactividad",
+            lambda: self.expirados, tipo="counter"
+        )
+
+    @property
+    def vivos(self):
+        """Número de checkouts en curso"""
+        return len(self._plazos)
+
+    def vigilar(self, conversacion):
+        """Indica el ConversationHandler cuyos checkouts se vigilan"""
+        self.conversacion = conversacion
+
+    # -------------------------------------------------
+    # Registro de actividad
+    # -------------------------------------------------
+    async def registrar(self, update: Update, context):
+        """Handler de grupo posterior a la conversación: renueva o cierra el plazo"""
+        if not update.effective_user or not update.effective_chat:
+            return
+        clave = (update.effective_chat.id, update.effective_user.id)
+
+        if clave in self.conversacion._conversations:
+            self._plazos[clave] = time.monotonic() + self.ttl
+            self._plazos.move_to_end(clave)
+            self._hay_plazos.set()
+            return
+
+        self._plazos.pop(clave, None)
+        # Fuera de una compra el user_data queda vacío: no se guarda una
+        # entrada por cada visitante
+        user_id = update.effective_user.id
+        if user_id in context.application.user_data and not context.application.user_data[user_id]:
+            context.application.drop_user_data(user_id)
+
+    # -------------------------------------------------
+    # Caducidad
+    # -------------------------------------------------
+    async def _expirar(self, application, clave):
+        user_id = clave[1]
+        # Con el lock del usuario ningún handler suyo está a medias
+        bloqueo = getattr(application.update_processor, "bloqueo", None)
+        if bloqueo is not None:
+            async with bloqueo(user_id):
+                self._terminar(application, clave)
+        else:
+            self._terminar(application, clave)
+
+    def _terminar(self, application, clave):
+        # Pudo renovarse o terminar mientras se esperaba el lock
+        plazo = self._plazos.get(clave)
+        if plazo is None or plazo > time.monotonic():
+            return
+        del self._plazos[clave]
+
+        chat_id, user_id = clave
+        paso = self.conversacion._conversations.get(clave)
+        self._abandonados.sumar(NOMBRES_PASO.get(paso, str(paso)), "expirado")
+        self.conversacion._update_state(ConversationHandler.END, clave)
+        application.drop_user_data(user_id)
+        self.expirados += 1
+        logger.info(f"Checkout del usuario {user_id} expirado tras {self.ttl:.0f}s sin actividad")
+
+        if self.avisar is not None:
+            self.avisar(application.bot, chat_id)
+
+    async def _vigilar(self, application):
+        while True:
+            self._hay_plazos.clear()
+            if not self._plazos:
+                await self._hay_plazos.wait()
+                continue
+
+            clave, plazo = next(iter(self._plazos.items()))
+            espera = plazo - time.monotonic()
+            if espera > 0:
+                # Los plazos nuevos siempre son posteriores al primero
+                await asyncio.sleep(espera)
+                continue
+
+            await self._expirar(application, clave)
+
+    def iniciar(self, application):
+        """Empieza a vigilar; los checkouts restaurados reciben un plazo completo"""
+        ahora = time.monotonic()
+        for clave in list(self.conversacion._conversations):
+            self._plazos[clave] = ahora + self.ttl
+        if self._plazos:
+            logger.info(f"{len(self._plazos)} checkouts restaurados con plazo de {self.ttl:.0f}s")
+
+        if self.ttl > 0 and self._tarea is None:
+            self._tarea = asyncio.get_running_loop().create_task(self._vigilar(application))
+
+    async def detener(self):
+        """Deja de caducar checkouts"""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
@@ -0,0 +1,52 @@
+# exportacion.py - Escritura de pedidos exportados en CSV o JSONL comprimidos
+import csv
+import gzip
+import json
+from datetime import datetime, timezone
+
+FORMATOS = ("csv", "jsonl")
+
+def fecha_iso(ms):
+    """Texto ISO-8601 en hora local y con su desfase UTC de unos milisegundos UTC"""
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).astimezone().isoformat(timespec="milliseconds")
+
+def escritor_gzip(ruta, formato):
+    """Devuelve `escribir(columnas, filas)` que vuelca las filas en `ruta`.
+
+    Las filas se consumen de una en una y se comprimen al vuelo, así la
+    memoria no depende del número de pedidos. La fecha, guardada en
+    milisegundos, se escribe como fecha_iso: "2024-06-01T13:05:00.000-06:00".
+    `escribir` devuelve (filas escritas, mayor id exportado).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportación desconocido: {formato}")
+
+    def escribir(columnas, filas):
+        posicion_id = columnas.index("id")
+        posicion_fecha = columnas.index("fecha")
+        total, ultimo_id = 0, 0
+
+        def legible(fila):
+            fecha = fila[posicion_fecha]
+            if fecha is None:
+                return fila
+            return fila[:posicion_fecha] + (fecha_iso(fecha),) + fila[posicion_fecha + 1:]
+
+        with gzip.open(ruta, "wt", encoding="utf-8", newline="") as archivo:
+            if formato == "csv":
+                escritor = csv.writer(archivo)
+                escritor.writerow(columnas)
+                for fila in filas:
+                    escritor.writerow(legible(fila))
+                    total += 1
+                    ultimo_id = max(ultimo_id, fila[posicion_id])
+            else:
+                for fila in filas:
+                    archivo.write(json.dumps(dict(zip(columnas, legible(fila))), ensure_ascii=False))
+                    archivo.write("\n")
+                    total += 1
+                    ultimo_id = max(ultimo_id, fila[posicion_id])
+
+        return total, ultimo_id
+
+    return escribir
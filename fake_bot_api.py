@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor local que imita la Bot API de Telegram.
+
+Sirve para ejecutar el bot sin conexión: implementa getUpdates, setWebhook,
+sendMessage, answerCallbackQuery y los métodos que usa el bot al arrancar.
+Los updates se inyectan con `enviar_update` y se entregan por getUpdates o
+por POST al webhook registrado, según el modo en que corra el bot.
+
+Uso para comparar la latencia de polling y webhook:
+    python fake_bot_api.py --comparar 200
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict, deque
+
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as TornadoApplication, RequestHandler
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Gamedin", "username": "gamedin_bot"}
+# Secreto con el que arrancar_updater registra el webhook local
+SECRETO_WEBHOOK = "secreto-local"
+
+class _LimiteExcedido(Exception):
+    """Envío que Telegram rechazaría con 429 Too Many Requests"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too Many Requests: retry after {retry_after}")
+        self.retry_after = retry_after
+
+# =====================================================
+# SERVIDOR FALSO
+# =====================================================
+class _MetodoHandler(RequestHandler):
+    """Atiende /bot<token>/<metodo> como lo haría api.telegram.org"""
+
+    def initialize(self, api):
+        self.api = api
+
+    async def post(self, token, metodo):
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(self.request.body or b"{}")
+        else:
+            params = {}
+            for nombre, valores in self.request.body_arguments.items():
+                valor = valores[-1].decode()
+                # Los valores compuestos llegan codificados como JSON
+                try:
+                    params[nombre] = json.loads(valor)
+                except ValueError:
+                    params[nombre] = valor
+            for nombre, archivos in self.request.files.items():
+                params[nombre] = {"filename": archivos[0].filename, "size": len(archivos[0].body)}
+
+        try:
+            resultado = await self.api.ejecutar(metodo, params)
+            self.write({"ok": True, "result": resultado})
+        except _LimiteExcedido as e:
+            self.set_status(429)
+            self.write({
+                "ok": False, "error_code": 429, "description": str(e),
+                "parameters": {"retry_after": e.retry_after},
+            })
+        except KeyError as e:
+            self.set_status(400)
+            self.write({"ok": False, "error_code": 400, "description": f"Bad Request: {e}"})
+
+    get = post
+
+
+class FakeBotAPI:
+    """Bot API en memoria para pruebas y mediciones locales.
+
+    Con `global_por_seg`, `chat_por_seg` o `grupo_por_min` los envíos que
+    superan ese número en la ventana (1 s, o 60 s para grupos) se rechazan
+    con 429 como lo haría Telegram y quedan anotados en `rechazados`.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8081, global_por_seg=None, chat_por_seg=None, grupo_por_min=None):
+        self.host = host
+        self.port = port
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.global_por_seg = global_por_seg
+        self.chat_por_seg = chat_por_seg
+        self.grupo_por_min = grupo_por_min
+        self.enviados = []
+        self.rechazados = []
+        self._ventana_global = deque()
+        self._ventanas_chat = defaultdict(deque)
+        self._pendientes = []
+        self._hay_updates = asyncio.Event()
+        self._esperas = {}
+        self._update_id = 0
+        self._message_id = 0
+        self._servidor = None
+        self._entregas = set()
+
+    @property
+    def base_url(self):
+        """Valor para BOT_API_URL / ApplicationBuilder.base_url"""
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def iniciar(self):
+        app = TornadoApplication([(r"/bot([^/]+)/(\w+)", _MetodoHandler, {"api": self})])
+        self._servidor = HTTPServer(app)
+        self._servidor.listen(self.port, self.host)
+
+    async def detener(self):
+        # Despierta los getUpdates en espera para que respondan antes de cerrar
+        self._hay_updates.set()
+        await asyncio.sleep(0)
+        if self._servidor is not None:
+            self._servidor.stop()
+            await self._servidor.close_all_connections()
+            self._servidor = None
+        if self._entregas:
+            await asyncio.gather(*self._entregas, return_exceptions=True)
+
+    # -------------------------------------------------
+    # Construcción de updates
+    # -------------------------------------------------
+    def _siguiente_update_id(self):
+        self._update_id += 1
+        return self._update_id
+
+    def _siguiente_message_id(self):
+        self._message_id += 1
+        return self._message_id
+
+    @staticmethod
+    def usuario(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"Cliente{user_id}", "username": f"cliente{user_id}"}
+
+    def mensaje(self, user_id, texto):
+        """Update con un mensaje de texto (o comando) de un cliente"""
+        message = {
+            "message_id": self._siguiente_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self.usuario(user_id),
+            "text": texto,
+        }
+        if texto.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(texto.split()[0])}]
+        return {"update_id": self._siguiente_update_id(), "message": message}
+
+    def callback(self, user_id, data):
+        """Update con la pulsación de un botón inline"""
+        update_id = self._siguiente_update_id()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self.usuario(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": self._siguiente_message_id(),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "...",
+                },
+            },
+        }
+
+    # -------------------------------------------------
+    # Entrega de updates y espera de respuestas
+    # -------------------------------------------------
+    async def enviar_update(self, update):
+        """Entrega un update por webhook o lo deja listo para getUpdates"""
+        if self.webhook_url:
+            tarea = asyncio.ensure_future(self._post_webhook(update))
+            self._entregas.add(tarea)
+            tarea.add_done_callback(self._entregas.discard)
+        else:
+            self._pendientes.append(update)
+            self._hay_updates.set()
+
+    async def _post_webhook(self, update):
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.webhook_secret
+        peticion = HTTPRequest(self.webhook_url, method="POST", headers=headers, body=json.dumps(update))
+        await AsyncHTTPClient().fetch(peticion, raise_error=False)
+
+    def esperar_respuesta(self, chat_id, metodo="sendMessage"):
+        """Future que se resuelve con la próxima llamada `metodo` hacia chat_id"""
+        futuro = asyncio.get_running_loop().create_future()
+        self._esperas.setdefault((metodo, chat_id), []).append(futuro)
+        return futuro
+
+    def _notificar(self, metodo, chat_id, params):
+        for futuro in self._esperas.pop((metodo, chat_id), []):
+            if not futuro.done():
+                futuro.set_result(params)
+
+    # -------------------------------------------------
+    # Límites de envío
+    # -------------------------------------------------
+    @staticmethod
+    def _espera(ventana, limite, segundos, ahora):
+        """Segundos hasta que quepa otro envío en la ventana (0 si ya cabe)"""
+        while ventana and ventana[0] <= ahora - segundos:
+            ventana.popleft()
+        if len(ventana) < limite:
+            return 0
+        return max(1, math.ceil(ventana[0] + segundos - ahora))
+
+    def _comprobar_limites(self, chat_id):
+        ahora = time.monotonic()
+        ventanas = []
+        if self.global_por_seg is not None:
+            ventanas.append((self._ventana_global, self.global_por_seg, 1))
+        if chat_id < 0 and self.grupo_por_min is not None:
+            ventanas.append((self._ventanas_chat[chat_id], self.grupo_por_min, 60))
+        elif chat_id > 0 and self.chat_por_seg is not None:
+            ventanas.append((self._ventanas_chat[chat_id], self.chat_por_seg, 1))
+
+        # Un envío rechazado no ocupa sitio en ninguna ventana
+        espera = max([self._espera(ventana, limite, segundos, ahora) for ventana, limite, segundos in ventanas], default=0)
+        if espera:
+            raise _LimiteExcedido(espera)
+        for ventana, _, _ in ventanas:
+            ventana.append(ahora)
+
+    # -------------------------------------------------
+    # Métodos de la Bot API
+    # -------------------------------------------------
+    async def ejecutar(self, metodo, params):
+        metodo = metodo.lower()
+
+        if metodo == "getupdates":
+            return await self._get_updates(params)
+        if metodo == "getme":
+            return BOT_USER
+        if metodo == "setwebhook":
+            self.webhook_url = params["url"]
+            self.webhook_secret = params.get("secret_token")
+            return True
+        if metodo == "deletewebhook":
+            self.webhook_url = None
+            self.webhook_secret = None
+            return True
+        if metodo == "getwebhookinfo":
+            return {"url": self.webhook_url or "", "has_custom_certificate": False, "pending_update_count": len(self._pendientes)}
+
+        if metodo in ("sendmessage", "senddocument", "editmessagetext"):
+            try:
+                self._comprobar_limites(int(params["chat_id"]))
+            except _LimiteExcedido:
+                self.rechazados.append((metodo, params))
+                raise
+
+        self.enviados.append((metodo, params))
+
+        if metodo in ("sendmessage", "senddocument", "editmessagetext"):
+            chat_id = int(params["chat_id"])
+            resultado = {
+                "message_id": self._siguiente_message_id(),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+                "from": BOT_USER,
+            }
+            if "text" in params:
+                resultado["text"] = params["text"]
+            if "document" in params:
+                documento = params["document"]
+                resultado["document"] = {
+                    "file_id": "f" + str(resultado["message_id"]),
+                    "file_unique_id": "u" + str(resultado["message_id"]),
+                    "file_name": documento.get("filename") if isinstance(documento, dict) else None,
+                }
+            nombre = {"sendmessage": "sendMessage", "senddocument": "sendDocument", "editmessagetext": "editMessageText"}[metodo]
+            self._notificar(nombre, chat_id, params)
+            return resultado
+
+        # answerCallbackQuery, close, logOut y demás métodos sin resultado útil
+        return True
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+
+        if offset:
+            self._pendientes = [u for u in self._pendientes if u["update_id"] >= offset]
+
+        if not self._pendientes and timeout:
+            self._hay_updates.clear()
+            try:
+                await asyncio.wait_for(self._hay_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        limite = int(params.get("limit") or 100)
+        return self._pendientes[:limite]
+
+# =====================================================
+# COMPARACIÓN POLLING / WEBHOOK
+# =====================================================
+async def arrancar_updater(application, modo, puerto_webhook=8444):
+    """Arranca la Application ya inicializada recibiendo updates del servidor falso"""
+    await application.start()
+    await iniciar_recepcion(application.updater, modo, puerto_webhook)
+
+async def iniciar_recepcion(updater, modo, puerto_webhook=8444):
+    """Pone a recibir un Updater detenido por polling o por webhook"""
+    import main
+
+    if modo == "webhook":
+        await updater.start_webhook(
+            listen="127.0.0.1",
+            port=puerto_webhook,
+            url_path="webhook",
+            webhook_url=f"http://127.0.0.1:{puerto_webhook}/webhook",
+            secret_token=SECRETO_WEBHOOK,
+            allowed_updates=main.ACTUALIZACIONES_PERMITIDAS
+        )
+    else:
+        await updater.start_polling(
+            poll_interval=0,
+            allowed_updates=main.ACTUALIZACIONES_PERMITIDAS
+        )
+
+async def _medir_modo(modo, n, puerto_api, puerto_webhook):
+    """Latencia desde que Telegram entrega /start hasta que recibe la respuesta"""
+    api = FakeBotAPI(port=puerto_api)
+    await api.iniciar()
+
+    # La configuración se lee al importar main, así que se fija antes
+    os.environ["BOT_API_URL"] = api.base_url
+    os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(), "gamedin_pedidos.db"))
+    import main
+
+    application = main.crear_aplicacion()
+    latencias = []
+
+    async with application:
+        await arrancar_updater(application, modo, puerto_webhook)
+
+        for i in range(n):
+            user_id = 1000 + i
+            respuesta = api.esperar_respuesta(user_id)
+            inicio = time.perf_counter()
+            await api.enviar_update(api.mensaje(user_id, "/start"))
+            await asyncio.wait_for(respuesta, 10)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+        await application.updater.stop()
+        await application.stop()
+
+    await api.detener()
+    return latencias
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+async def comparar_modos(n, puerto_api=8081, puerto_webhook=8444):
+    """Mide n /start en polling y en webhook contra el servidor falso"""
+    for modo in ("polling", "webhook"):
+        latencias = await _medir_modo(modo, n, puerto_api, puerto_webhook)
+        print(
+            f"{modo:8} n={n} media={statistics.mean(latencias):.2f}ms "
+            f"p50={percentil(latencias, 50):.2f}ms p95={percentil(latencias, 95):.2f}ms "
+            f"p99={percentil(latencias, 99):.2f}ms"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bot API falsa de Telegram para pruebas locales")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--comparar", type=int, metavar="N", help="medir N /start en polling y webhook")
+    args = parser.parse_args()
+
+    if args.comparar:
+        asyncio.run(comparar_modos(args.comparar, puerto_api=args.port))
+    else:
+        async def servir():
+            api = FakeBotAPI(args.host, args.port)
+            await api.iniciar()
+            print(f"Bot API falsa en {api.base_url}<token>/")
+            await asyncio.Event().wait()
+
+        asyncio.run(servir())
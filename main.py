@@ -5,11 +5,17 @@ Bot de Telegram para Gamedin - Tienda de Gaming Free Fire
 Demo para Cliente
 """
 
+import asyncio
 import logging
-import sqlite3
-from datetime import datetime
+import os
+import secrets
+import tempfile
+from collections import namedtuple
+from datetime import datetime, timedelta
+from types import MappingProxyType
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from telegram.helpers import escape_markdown
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes, ConversationHandler
 
 # Configuración de logging
 logging.basicConfig(
@@ -18,132 +24,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Estados para el flujo de conversación
-SELECCIONAR_PRODUCTO, SELECCIONAR_CANTIDAD, INGRESAR_ID, INGRESAR_NOMBRE, INGRESAR_CONTACTO, CONFIRMAR_PEDIDO = range(6)
+# Tipos de update que usa el bot: no se pide a Telegram ningún otro
+ACTUALIZACIONES_PERMITIDAS = [Update.MESSAGE, Update.CALLBACK_QUERY]
 
 # =====================================================
 # CONFIGURACIÓN - CAMBIAR ESTOS VALORES
 # =====================================================
 # Importar configuración
-from config import BOT_TOKEN, GRUPO_PEDIDOS_ID, ADMIN_ID
+from config import (
+    BOT_TOKEN, GRUPO_PEDIDOS_ID, ADMIN_ID, BOT_API_URL,
+    MODO_BOT, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT,
+    DB_NAME, DB_LECTORES, DB_SYNCHRONOUS, DB_CACHE_SIZE, DB_MMAP_SIZE,
+    DB_VENTANA_LOTE_MS, DB_MAX_LOTE, PERSISTENCIA_INTERVALO,
+    CATALOGO_PATH, CATALOGO_INTERVALO_RECARGA,
+    UPDATES_CONCURRENTES, SHARDS_POR_USUARIO,
+    ENVIOS_GLOBAL_POR_SEG, ENVIOS_CHAT_POR_SEG, ENVIOS_GRUPO_POR_MIN, ENVIOS_MAX_REINTENTOS,
+    FLOOD_POR_SEG, FLOOD_RAFAGA, FLOOD_GLOBAL_POR_SEG, FLOOD_MAX_USUARIOS, FLOOD_AVISO_SEG,
+    NOTIF_RESUMEN_SEG, NOTIF_RESUMEN_MAX_PEDIDOS, NOTIF_RESUMEN_MAX_CARACTERES,
+    CHECKOUT_TTL_MIN, CHECKOUT_AVISO_EXPIRADO, METRICAS_PUERTO, METRICAS_LISTEN,
+    TRAZAS_MUESTREO, TRAZAS_PATH, TRAZAS_MAX_MB, TRAZAS_COPIAS, PERFIL_HZ, PERFIL_MAX_SEG
+)
+from antiflood import LimitadorUpdates
+from catalogo import CatalogoRecargable
+# Estados para el flujo de conversación: son los pasos del checkout
+from checkout import (
+    Checkout, SELECCIONAR_PRODUCTO, SELECCIONAR_CANTIDAD, INGRESAR_ID,
+    INGRESAR_NOMBRE, INGRESAR_CONTACTO, CONFIRMAR_PEDIDO, NOMBRES_PASO
+)
+from database import DatabaseManager, TRANSICIONES_ESTADO, ahora_ms, fechas_locales
+from envios import PlanificadorEnvios, PRIORIDAD_ADMIN
+from expiracion import ExpiradorCheckouts
+from exportacion import FORMATOS as FORMATOS_EXPORTACION, escritor_gzip
+from metricas import Metricas, ServidorMetricas, medir_handlers
+from notificaciones import ResumenPedidos
+from perfilador import perfilar, pilas_colapsadas
+from persistencia import PersistenciaSQLite
+from procesador import ProcesadorPorUsuario
+from trazas import Trazador
 
 # =====================================================
 # PRODUCTOS DE FREE FIRE
 # =====================================================
-PRODUCTOS = {
-    "diamantes": {
-        "nombre": "💎 Diamantes",
-        "descripcion": "Moneda premium de Free Fire",
-        "cantidades": {
-            "100": {"cantidad": "100", "precio": 50},
-            "310": {"cantidad": "310", "precio": 150},
-            "520": {"cantidad": "520", "precio": 250},
-            "1080": {"cantidad": "1,080", "precio": 500},
-            "2200": {"cantidad": "2,200", "precio": 1000},
-            "5600": {"cantidad": "5,600", "precio": 2500}
-        }
-    },
-    "monedas": {
-        "nombre": "🪙 Monedas",
-        "descripcion": "Moneda básica de Free Fire",
-        "cantidades": {
-            "2000": {"cantidad": "2,000", "precio": 20},
-            "5000": {"cantidad": "5,000", "precio": 45},
-            "10000": {"cantidad": "10,000", "precio": 85},
-            "25000": {"cantidad": "25,000", "precio": 200},
-            "50000": {"cantidad": "50,000", "precio": 380}
-        }
-    },
-    "pases": {
-        "nombre": "🎫 Pases de Batalla",
-        "descripcion": "Pases temporada Free Fire",
-        "cantidades": {
-            "elite": {"cantidad": "Pase Elite", "precio": 400},
-            "elite_plus": {"cantidad": "Pase Elite Plus", "precio": 800},
-            "nivel_bundle": {"cantidad": "Bundle Nivel 50", "precio": 1200}
-        }
-    }
-}
+# El catálogo vive en productos.json y se recarga solo al modificarlo
+catalogo = CatalogoRecargable(CATALOGO_PATH, intervalo=CATALOGO_INTERVALO_RECARGA)
 
 # =====================================================
-# GESTOR DE BASE DE DATOS
+# PANTALLAS PRECALCULADAS
 # =====================================================
-class DatabaseManager:
-    def __init__(self, db_name="gamedin_pedidos.db"):
-        self.db_name = db_name
-        self.init_database()
-    
-    def init_database(self):
-        """Inicializa la base de datos"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS pedidos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                producto TEXT,
-                cantidad TEXT,
-                id_juego TEXT,
-                nombre_cliente TEXT,
-                contacto_cliente TEXT,
-                precio INTEGER,
-                fecha DATETIME,
-                estado TEXT DEFAULT 'pendiente'
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-        logger.info("Base de datos inicializada correctamente")
-    
-    def guardar_pedido(self, pedido_data):
-        """Guarda un pedido en la base de datos"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO pedidos (user_id, username, producto, cantidad, id_juego, 
-                               nombre_cliente, contacto_cliente, precio, fecha)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', pedido_data)
-        
-        pedido_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        logger.info(f"Pedido #{pedido_id} guardado correctamente")
-        return pedido_id
-    
-    def obtener_pedidos(self, limit=10):
-        """Obtiene los últimos pedidos"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM pedidos ORDER BY fecha DESC LIMIT ?
-        ''', (limit,))
-        
-        pedidos = cursor.fetchall()
-        conn.close()
-        return pedidos
-
-# Instancia del gestor de base de datos
-db = DatabaseManager()
+# Textos y teclados que no cambian entre peticiones. Se renderizan una sola
+# vez en PANTALLAS y solo se regeneran cuando se recarga el catálogo.
+Pantalla = namedtuple("Pantalla", ["texto", "teclado"])
 
-# =====================================================
-# FUNCIONES PRINCIPALES
-# =====================================================
-
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Comando /start - Mensaje de bienvenida"""
-    user = update.effective_user
-    logger.info(f"Usuario {user.first_name} ({user.id}) inició el bot")
-    
-    welcome_text = f"""
+PLANTILLA_BIENVENIDA = """
 🎮 **¡Bienvenido a GAMEDIN!** 🎮
 
-Hola {user.first_name}, soy tu asistente para compras de Free Fire.
+Hola {nombre}, soy tu asistente para compras de Free Fire.
 
 **🔥 ¿Qué puedes comprar aquí?**
 • 💎 Diamantes Free Fire
@@ -158,66 +93,23 @@ Hola {user.first_name}, soy tu asistente para compras de Free Fire.
 
 ¡Elige una opción para comenzar!
     """
-    
-    keyboard = [
-        [InlineKeyboardButton("🛒 Comprar Ahora", callback_data="hacer_pedido")],
-        [InlineKeyboardButton("📋 Ver Productos", callback_data="ver_productos")],
-        [InlineKeyboardButton("📞 Contacto", callback_data="contacto")],
-        [InlineKeyboardButton("❓ Ayuda", callback_data="ayuda")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(
-        welcome_text,
-        reply_markup=reply_markup,
-        parse_mode='Markdown'
-    )
 
-async def mostrar_productos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Muestra todos los productos disponibles"""
-    if update.callback_query:
-        await update.callback_query.answer()
-        send_method = update.callback_query.message.reply_text
-    else:
-        send_method = update.message.reply_text
-    
-    catalog_text = "🎮 **CATÁLOGO GAMEDIN - FREE FIRE** 🎮\n\n"
-    
-    for key, producto in PRODUCTOS.items():
-        catalog_text += f"**{producto['nombre']}**\n"
-        catalog_text += f"📝 {producto['descripcion']}\n"
-        catalog_text += "💰 **Precios:**\n"
-        
-        for cant_key, cant_data in producto['cantidades'].items():
-            catalog_text += f"   • {cant_data['cantidad']}: ${cant_data['precio']} MXN\n"
-        catalog_text += "\n"
-    
-    catalog_text += "⚡ **Entrega inmediata tras confirmación de pago**\n"
-    catalog_text += "🎯 Para comprar, usa el botón 'Comprar Ahora'"
-    
-    keyboard = [
-        [InlineKeyboardButton("🛒 Comprar Ahora", callback_data="hacer_pedido")],
-        [InlineKeyboardButton("🏠 Menú Principal", callback_data="menu_principal")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await send_method(
-        catalog_text,
-        reply_markup=reply_markup,
-        parse_mode='Markdown'
-    )
+TEXTO_MENU_PRINCIPAL = """
+🎮 **¡Bienvenido a GAMEDIN!** 🎮
 
-async def contacto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Información de contacto"""
-    if update.callback_query:
-        await update.callback_query.answer()
-        send_method = update.callback_query.message.reply_text
-    else:
-        send_method = update.message.reply_text
-    
-    contact_text = """
+Tu tienda de confianza para Free Fire
+
+**🔥 ¿Qué puedes comprar aquí?**
+• 💎 Diamantes Free Fire
+• 🪙 Monedas Free Fire  
+• 🎫 Pases de Batalla
+
+**⚡ Entrega inmediata • Precios competitivos**
+
+¡Elige una opción para comenzar!
+    """
+
+TEXTO_CONTACTO = """
 📞 **CONTACTO - GAMEDIN**
 
 🎮 **Tienda Gaming Profesional**
@@ -236,28 +128,8 @@ async def contacto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 💬 **¿Dudas?**
 Contáctanos por WhatsApp o Facebook
     """
-    
-    keyboard = [
-        [InlineKeyboardButton("💬 WhatsApp", url="https://wa.me/5547999821527")],
-        [InlineKeyboardButton("🏠 Menú Principal", callback_data="menu_principal")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await send_method(
-        contact_text,
-        reply_markup=reply_markup
-    )
 
-async def ayuda(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Información de ayuda"""
-    if update.callback_query:
-        await update.callback_query.answer()
-        send_method = update.callback_query.message.reply_text
-    else:
-        send_method = update.message.reply_text
-    
-    help_text = """
+TEXTO_AYUDA = """
 ❓ **AYUDA - CÓMO COMPRAR**
 
 **📱 Comandos disponibles:**
@@ -284,16 +156,350 @@ Inmediato tras confirmar pago
 **🔒 ¿Es seguro?**
 100% seguro. Solo necesitamos tu ID, no tu contraseña.
     """
+
+TEXTO_SELECCION_PRODUCTO = """
+🛒 **COMPRAR - PASO 1/6**
+
+🎮 **¿Qué quieres comprar para Free Fire?**
+
+Selecciona el tipo de producto:
+    """
+
+TEXTO_CHECKOUT_EXPIRADO = """
+⌛ **Tu carrito expiró**
+
+Pasó un tiempo sin actividad y cancelamos la compra en curso.
+Puedes empezar una nueva cuando quieras.
+    """
+
+# Respuesta de un botón: texto plano de hasta 200 caracteres
+TEXTO_LIMITE_UPDATES = "⏳ Vas demasiado rápido. Espera unos segundos y vuelve a intentarlo."
+
+TEXTO_SELECCION_CANTIDAD = """
+🛒 **COMPRAR - PASO 2/6**
+
+✅ **Seleccionado:** {nombre}
+📝 {descripcion}
+
+💰 **Selecciona la cantidad:**
+        """
+
+def renderizar_catalogo(catalogo_actual):
+    """Construye el texto del catálogo completo"""
+    lineas = ["🎮 **CATÁLOGO GAMEDIN - FREE FIRE** 🎮\n"]
     
-    keyboard = [
-        [InlineKeyboardButton("🏠 Menú Principal", callback_data="menu_principal")]
+    for producto in catalogo_actual.productos.values():
+        lineas.append(f"**{producto.nombre}**")
+        lineas.append(f"📝 {producto.descripcion}")
+        lineas.append("💰 **Precios:**")
+        
+        for sku in producto.skus:
+            lineas.append(f"   • {sku.cantidad}: ${sku.precio} MXN")
+        lineas.append("")
+    
+    lineas.append("⚡ **Entrega inmediata tras confirmación de pago**")
+    lineas.append("🎯 Para comprar, usa el botón 'Comprar Ahora'")
+    return "\n".join(lineas)
+
+def construir_pantallas(catalogo_actual):
+    """Renderiza las pantallas estáticas y las que dependen del catálogo"""
+    teclado_menu = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🛒 Comprar Ahora", callback_data="hacer_pedido")],
+        [InlineKeyboardButton("📋 Ver Productos", callback_data="ver_productos")],
+        [InlineKeyboardButton("📞 Contacto", callback_data="contacto")],
+        [InlineKeyboardButton("❓ Ayuda", callback_data="ayuda")]
+    ])
+    
+    teclado_seleccion = [
+        [InlineKeyboardButton(producto.nombre, callback_data=producto.callback)]
+        for producto in catalogo_actual.productos.values()
     ]
+    teclado_seleccion.append([InlineKeyboardButton("❌ Cancelar", callback_data="cancelar_compra")])
+    
+    pantallas = {
+        "bienvenida": Pantalla(PLANTILLA_BIENVENIDA, teclado_menu),
+        "menu_principal": Pantalla(TEXTO_MENU_PRINCIPAL, teclado_menu),
+        "productos": Pantalla(renderizar_catalogo(catalogo_actual), InlineKeyboardMarkup([
+            [InlineKeyboardButton("🛒 Comprar Ahora", callback_data="hacer_pedido")],
+            [InlineKeyboardButton("🏠 Menú Principal", callback_data="menu_principal")]
+        ])),
+        "contacto": Pantalla(TEXTO_CONTACTO, InlineKeyboardMarkup([
+            [InlineKeyboardButton("💬 WhatsApp", url="https://wa.me/5547999821527")],
+            [InlineKeyboardButton("🏠 Menú Principal", callback_data="menu_principal")]
+        ])),
+        "ayuda": Pantalla(TEXTO_AYUDA, InlineKeyboardMarkup([
+            [InlineKeyboardButton("🏠 Menú Principal", callback_data="menu_principal")]
+        ])),
+        "seleccion_producto": Pantalla(TEXTO_SELECCION_PRODUCTO, InlineKeyboardMarkup(teclado_seleccion)),
+        "checkout_expirado": Pantalla(TEXTO_CHECKOUT_EXPIRADO, InlineKeyboardMarkup([
+            [InlineKeyboardButton("🛒 Nueva Compra", callback_data="hacer_pedido")],
+            [InlineKeyboardButton("🏠 Menú Principal", callback_data="menu_principal")]
+        ])),
+    }
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Paso 2 de cada producto: selección de cantidad
+    for producto in catalogo_actual.productos.values():
+        teclado_cantidades = [
+            [InlineKeyboardButton(f"{sku.cantidad} - ${sku.precio} MXN", callback_data=sku.callback)]
+            for sku in producto.skus
+        ]
+        teclado_cantidades.append([InlineKeyboardButton("⬅️ Cambiar Producto", callback_data="hacer_pedido")])
+        teclado_cantidades.append([InlineKeyboardButton("❌ Cancelar", callback_data="cancelar_compra")])
+        
+        pantallas[producto.callback] = Pantalla(
+            TEXTO_SELECCION_CANTIDAD.format(nombre=producto.nombre, descripcion=producto.descripcion),
+            InlineKeyboardMarkup(teclado_cantidades)
+        )
+    
+    return MappingProxyType(pantallas)
+
+PANTALLAS = construir_pantallas(catalogo.actual)
+
+def actualizar_pantallas(nuevo_catalogo):
+    """Regenera las pantallas que dependen del catálogo"""
+    global PANTALLAS
+    PANTALLAS = construir_pantallas(nuevo_catalogo)
+
+catalogo.suscribir(actualizar_pantallas)
+
+# =====================================================
+# MÉTRICAS
+# =====================================================
+# Latencias de handlers, base de datos y Bot API; se exponen en /metrics
+metricas = Metricas()
+servidor_metricas = ServidorMetricas(metricas, METRICAS_LISTEN, METRICAS_PUERTO)
+
+# Una fracción de los updates deja su traza (handlers, base de datos y Bot API)
+trazador = Trazador(
+    TRAZAS_PATH,
+    muestreo=TRAZAS_MUESTREO,
+    max_bytes=int(TRAZAS_MAX_MB * 1024 * 1024),
+    copias=TRAZAS_COPIAS
+)
+
+pedidos_confirmados = metricas.contador("gamedin_pedidos_total", "Pedidos confirmados", ("producto",))
+checkouts_abandonados = metricas.contador(
+    "gamedin_checkouts_abandonados_total", "Checkouts terminados sin pedido", ("paso", "motivo")
+)
+
+# =====================================================
+# BASE DE DATOS
+# =====================================================
+# Instancia del gestor de base de datos
+db = DatabaseManager(
+    DB_NAME,
+    lectores=DB_LECTORES,
+    synchronous=DB_SYNCHRONOUS,
+    cache_size=DB_CACHE_SIZE,
+    mmap_size=DB_MMAP_SIZE,
+    ventana_lote_ms=DB_VENTANA_LOTE_MS,
+    max_lote=DB_MAX_LOTE,
+    metricas=metricas
+)
+
+# Conversaciones y user_data sobreviven a un reinicio del proceso
+persistencia = PersistenciaSQLite(db, update_interval=PERSISTENCIA_INTERVALO, tipo_user_data=Checkout)
+
+# =====================================================
+# ENVÍOS A TELEGRAM
+# =====================================================
+# Todas las llamadas a la Bot API pasan por el planificador
+planificador = PlanificadorEnvios(
+    global_por_seg=ENVIOS_GLOBAL_POR_SEG,
+    chat_por_seg=ENVIOS_CHAT_POR_SEG,
+    grupo_por_min=ENVIOS_GRUPO_POR_MIN,
+    max_reintentos=ENVIOS_MAX_REINTENTOS,
+    metricas=metricas
+)
+
+def enviar_a_grupo(bot, texto, descripcion, teclado=None, pedidos=()):
+    """Encola un mensaje para el grupo de pedidos, detrás del tráfico de clientes.
+
+    Los `pedidos` que menciona se marcan como notificados cuando Telegram
+    acepta el mensaje.
+    """
+    envio = bot.send_message(
+        chat_id=GRUPO_PEDIDOS_ID,
+        text=texto,
+        reply_markup=teclado,
+        parse_mode='Markdown',
+        rate_limit_args={"prioridad": PRIORIDAD_ADMIN}
+    )
+    planificador.encolar(_marcar_tras_envio(envio, pedidos) if pedidos else envio, descripcion)
+
+async def _marcar_tras_envio(envio, pedidos):
+    await envio
+    await db.marcar_notificados(pedidos)
+
+def notificar_pedido(bot, pedido):
+    """Avisa al grupo de un pedido guardado, suelto o dentro del resumen.
+
+    `pedido` es una fila como las de db.obtener_pedidos_sin_notificar. Los
+    datos del cliente se escapan: un '_' en un contacto o username haría que
+    Telegram rechazara el Markdown y el aviso con los botones se perdería.
+    """
+    pedido_id, user_id, username, producto, cantidad, id_juego, nombre, contacto, precio, fecha = pedido
+    nombre_producto = escape_markdown(catalogo.actual.nombre_producto(producto))
+    username = escape_markdown(username)
+    
+    if NOTIF_RESUMEN_SEG > 0:
+        # Línea compacta: los datos largos se recortan para que un texto raro
+        # no rompa el Markdown de todo el resumen
+        linea_resumen = (
+            f"**#{pedido_id}** · {nombre_producto} {escape_markdown(cantidad)} · ${precio} · "
+            f"{escape_markdown(nombre[:60])} (@{username}) · "
+            f"{escape_markdown(contacto[:60])} · 🆔 {id_juego[:20]}"
+        )
+        resumen_pedidos.agregar(bot, linea_resumen, precio, pedido_id)
+        return
+    
+    notificacion_admin = f"""
+🚨 **NUEVO PEDIDO - GAMEDIN**
+
+📄 **ID:** #{pedido_id}
+👤 **Cliente:** {escape_markdown(nombre)} (@{username})
+📱 **Contacto:** {escape_markdown(contacto)}
+📞 **Telegram ID:** {user_id}
+
+**🎮 PEDIDO:**
+🛍️ {nombre_producto}
+💎 Cantidad: {escape_markdown(cantidad)}
+🆔 ID Free Fire: {id_juego}
+
+**💰 PAGO:**
+Total: ${precio} MXN
+
+⏰ {datetime.fromtimestamp(fecha / 1000).strftime('%d/%m/%Y %H:%M')}
+
+🔥 **PROCESAR Y CONTACTAR AL CLIENTE**
+    """
+    
+    enviar_a_grupo(
+        bot, notificacion_admin, f"Notificación al grupo del pedido #{pedido_id}",
+        teclado=teclado_estado_pedido(pedido_id, "pendiente"), pedidos=(pedido_id,)
+    )
+
+async def notificar_pendientes(bot):
+    """Reenvía los avisos al grupo que no llegaron antes de un reinicio"""
+    pedidos = await db.obtener_pedidos_sin_notificar()
+    if pedidos:
+        logger.warning(f"Reenviando al grupo {len(pedidos)} pedidos sin notificar")
+    for pedido in pedidos:
+        notificar_pedido(bot, pedido)
+
+def avisar_checkout_expirado(bot, chat_id):
+    """Avisa al cliente de que su compra se canceló por inactividad"""
+    pantalla = PANTALLAS["checkout_expirado"]
+    planificador.encolar(
+        bot.send_message(
+            chat_id=chat_id,
+            text=pantalla.texto,
+            reply_markup=pantalla.teclado,
+            parse_mode='Markdown'
+        ),
+        f"Aviso de carrito expirado a {chat_id}"
+    )
+
+# Resumen de pedidos para el grupo (solo si NOTIF_RESUMEN_SEG > 0)
+resumen_pedidos = ResumenPedidos(
+    enviar_a_grupo,
+    ventana=NOTIF_RESUMEN_SEG,
+    max_pedidos=NOTIF_RESUMEN_MAX_PEDIDOS,
+    max_caracteres=NOTIF_RESUMEN_MAX_CARACTERES
+)
+
+# =====================================================
+# CHECKOUTS ABANDONADOS
+# =====================================================
+expirador = ExpiradorCheckouts(
+    CHECKOUT_TTL_MIN * 60,
+    avisar=avisar_checkout_expirado if CHECKOUT_AVISO_EXPIRADO else None,
+    metricas=metricas
+)
+
+# =====================================================
+# LÍMITE DE UPDATES POR USUARIO
+# =====================================================
+def avisar_limite_updates(bot, update):
+    """Avisa al usuario limitado: en el botón que pulsó o con un mensaje"""
+    if update.callback_query:
+        envio = update.callback_query.answer(TEXTO_LIMITE_UPDATES)
+    else:
+        envio = bot.send_message(chat_id=update.effective_chat.id, text=TEXTO_LIMITE_UPDATES)
+    planificador.encolar(envio, f"Aviso de límite de updates a {update.effective_user.id}")
+
+limitador = LimitadorUpdates(
+    FLOOD_POR_SEG,
+    FLOOD_RAFAGA,
+    FLOOD_GLOBAL_POR_SEG,
+    max_usuarios=FLOOD_MAX_USUARIOS,
+    aviso_cada=FLOOD_AVISO_SEG,
+    avisar=avisar_limite_updates,
+    exentos=[int(ADMIN_ID)],
+    metricas=metricas
+)
+
+# =====================================================
+# FUNCIONES PRINCIPALES
+# =====================================================
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Comando /start - Mensaje de bienvenida"""
+    user = update.effective_user
+    logger.info(f"Usuario {user.first_name} ({user.id}) inició el bot")
+    
+    pantalla = PANTALLAS["bienvenida"]
+    
+    await update.message.reply_text(
+        pantalla.texto.format(nombre=escape_markdown(user.first_name)),
+        reply_markup=pantalla.teclado,
+        parse_mode='Markdown'
+    )
+
+async def mostrar_productos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Muestra todos los productos disponibles"""
+    if update.callback_query:
+        await update.callback_query.answer()
+        send_method = update.callback_query.message.reply_text
+    else:
+        send_method = update.message.reply_text
+    
+    pantalla = PANTALLAS["productos"]
     
     await send_method(
-        help_text,
-        reply_markup=reply_markup,
+        pantalla.texto,
+        reply_markup=pantalla.teclado,
+        parse_mode='Markdown'
+    )
+
+async def contacto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Información de contacto"""
+    if update.callback_query:
+        await update.callback_query.answer()
+        send_method = update.callback_query.message.reply_text
+    else:
+        send_method = update.message.reply_text
+    
+    pantalla = PANTALLAS["contacto"]
+    
+    await send_method(
+        pantalla.texto,
+        reply_markup=pantalla.teclado
+    )
+
+async def ayuda(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Información de ayuda"""
+    if update.callback_query:
+        await update.callback_query.answer()
+        send_method = update.callback_query.message.reply_text
+    else:
+        send_method = update.message.reply_text
+    
+    pantalla = PANTALLAS["ayuda"]
+    
+    await send_method(
+        pantalla.texto,
+        reply_markup=pantalla.teclado,
         parse_mode='Markdown'
     )
 
@@ -313,77 +519,39 @@ async def iniciar_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     logger.info(f"Usuario {user.first_name} ({user.id}) inició una compra")
     
-    # Limpiar datos previos
-    context.user_data.clear()
-    
-    selection_text = """
-🛒 **COMPRAR - PASO 1/6**
-
-🎮 **¿Qué quieres comprar para Free Fire?**
-
-Selecciona el tipo de producto:
-    """
-    
-    keyboard = []
-    for key, producto in PRODUCTOS.items():
-        keyboard.append([InlineKeyboardButton(
-            producto['nombre'],
-            callback_data=f"producto_{key}"
-        )])
-    
-    keyboard.append([InlineKeyboardButton("❌ Cancelar", callback_data="cancelar_compra")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    pantalla = PANTALLAS["seleccion_producto"]
     
     await send_method(
-        selection_text,
-        reply_markup=reply_markup,
+        pantalla.texto,
+        reply_markup=pantalla.teclado,
         parse_mode='Markdown'
     )
     
-    return SELECCIONAR_PRODUCTO
+    # Empezar un checkout nuevo, descartando el anterior, solo si la
+    # respuesta llegó: la conversación entra de nuevo en el mismo paso
+    return context.user_data.iniciar()
 
 async def seleccionar_producto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Maneja la selección del producto"""
     query = update.callback_query
     await query.answer()
     
-    producto_key = query.data.replace("producto_", "")
+    producto = catalogo.actual.producto(query.data)
     
-    if producto_key in PRODUCTOS:
-        context.user_data['producto'] = producto_key
-        producto = PRODUCTOS[producto_key]
-        
-        logger.info(f"Usuario seleccionó producto: {producto['nombre']}")
-        
-        cantidad_text = f"""
-🛒 **COMPRAR - PASO 2/6**
-
-✅ **Seleccionado:** {producto['nombre']}
-📝 {producto['descripcion']}
-
-💰 **Selecciona la cantidad:**
-        """
+    if producto:
+        logger.info(f"Usuario seleccionó producto: {producto.nombre}")
         
-        keyboard = []
-        for cant_key, cant_data in producto['cantidades'].items():
-            keyboard.append([InlineKeyboardButton(
-                f"{cant_data['cantidad']} - ${cant_data['precio']} MXN",
-                callback_data=f"cantidad_{cant_key}"
-            )])
-        
-        keyboard.append([InlineKeyboardButton("⬅️ Cambiar Producto", callback_data="hacer_pedido")])
-        keyboard.append([InlineKeyboardButton("❌ Cancelar", callback_data="cancelar_compra")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        pantalla = PANTALLAS[producto.callback]
         
         await query.message.reply_text(
-            cantidad_text,
-            reply_markup=reply_markup,
+            pantalla.texto,
+            reply_markup=pantalla.teclado,
             parse_mode='Markdown'
         )
         
-        return SELECCIONAR_CANTIDAD
+        # El checkout avanza solo si la respuesta llegó: si falla, el
+        # usuario sigue en su paso y puede reintentar
+        return context.user_data.elegir_producto()
     
     return SELECCIONAR_PRODUCTO
 
@@ -392,20 +560,18 @@ async def seleccionar_cantidad(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    cantidad_key = query.data.replace("cantidad_", "")
-    context.user_data['cantidad_key'] = cantidad_key
-    
-    producto = PRODUCTOS[context.user_data['producto']]
-    cantidad_data = producto['cantidades'][cantidad_key]
+    sku = catalogo.actual.sku(query.data)
+    if not sku:
+        return SELECCIONAR_CANTIDAD
     
-    logger.info(f"Usuario seleccionó cantidad: {cantidad_data['cantidad']}")
+    logger.info(f"Usuario seleccionó cantidad: {sku.cantidad}")
     
     id_text = f"""
 🛒 **COMPRAR - PASO 3/6**
 
-✅ **Producto:** {producto['nombre']}
-✅ **Cantidad:** {cantidad_data['cantidad']}
-✅ **Precio:** ${cantidad_data['precio']} MXN
+✅ **Producto:** {sku.nombre}
+✅ **Cantidad:** {sku.cantidad}
+✅ **Precio:** ${sku.precio} MXN
 
 🆔 **Ingresa tu ID de Free Fire:**
 
@@ -426,7 +592,7 @@ async def seleccionar_cantidad(update: Update, context: ContextTypes.DEFAULT_TYP
         parse_mode='Markdown'
     )
     
-    return INGRESAR_ID
+    return context.user_data.elegir_sku(sku)
 
 async def ayuda_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Ayuda para encontrar ID de Free Fire"""
@@ -467,16 +633,15 @@ async def volver_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
     
-    # Obtener datos del contexto para mostrar el resumen
-    producto = PRODUCTOS[context.user_data['producto']]
-    cantidad_data = producto['cantidades'][context.user_data['cantidad_key']]
+    # Obtener datos del checkout para mostrar el resumen
+    sku = context.user_data.sku
     
     id_text = f"""
 🛒 **COMPRAR - PASO 3/6**
 
-✅ **Producto:** {producto['nombre']}
-✅ **Cantidad:** {cantidad_data['cantidad']}
-✅ **Precio:** ${cantidad_data['precio']} MXN
+✅ **Producto:** {sku.nombre}
+✅ **Cantidad:** {sku.cantidad}
+✅ **Precio:** ${sku.precio} MXN
 
 🆔 **Ahora ingresa tu ID de Free Fire:**
 
@@ -510,19 +675,17 @@ async def ingresar_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         )
         return INGRESAR_ID
     
-    context.user_data['id_juego'] = id_juego
     logger.info(f"Usuario ingresó ID: {id_juego}")
     
-    producto = PRODUCTOS[context.user_data['producto']]
-    cantidad_data = producto['cantidades'][context.user_data['cantidad_key']]
+    sku = context.user_data.sku
     
     nombre_text = f"""
 🛒 **COMPRAR - PASO 4/6**
 
-✅ **Producto:** {producto['nombre']}
-✅ **Cantidad:** {cantidad_data['cantidad']}
+✅ **Producto:** {sku.nombre}
+✅ **Cantidad:** {sku.cantidad}
 ✅ **ID Free Fire:** {id_juego}
-✅ **Precio:** ${cantidad_data['precio']} MXN
+✅ **Precio:** ${sku.precio} MXN
 
 👤 **Escribe tu nombre completo:**
     """
@@ -532,7 +695,7 @@ async def ingresar_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         parse_mode='Markdown'
     )
     
-    return INGRESAR_NOMBRE
+    return context.user_data.ingresar_id(id_juego)
 
 async def ingresar_nombre(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Maneja el ingreso del nombre"""
@@ -544,13 +707,12 @@ async def ingresar_nombre(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return INGRESAR_NOMBRE
     
-    context.user_data['nombre'] = nombre
     logger.info(f"Usuario ingresó nombre: {nombre}")
     
     contacto_text = f"""
 🛒 **COMPRAR - PASO 5/6**
 
-✅ **Nombre:** {nombre}
+✅ **Nombre:** {escape_markdown(nombre)}
 
 📱 **Ingresa tu contacto:**
 WhatsApp, Telegram, o cualquier forma de contactarte
@@ -563,7 +725,7 @@ WhatsApp, Telegram, o cualquier forma de contactarte
         parse_mode='Markdown'
     )
     
-    return INGRESAR_CONTACTO
+    return context.user_data.ingresar_nombre(nombre)
 
 async def ingresar_contacto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Maneja el ingreso del contacto"""
@@ -575,11 +737,9 @@ async def ingresar_contacto(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return INGRESAR_CONTACTO
     
-    context.user_data['contacto'] = contacto
-    
     # Preparar resumen
-    producto = PRODUCTOS[context.user_data['producto']]
-    cantidad_data = producto['cantidades'][context.user_data['cantidad_key']]
+    checkout = context.user_data
+    sku = checkout.sku
     
     confirmacion_text = f"""
 🛒 **CONFIRMAR COMPRA - PASO 6/6**
@@ -587,13 +747,13 @@ async def ingresar_contacto(update: Update, context: ContextTypes.DEFAULT_TYPE)
 **📋 RESUMEN DE TU PEDIDO:**
 
 🎮 **Juego:** Free Fire
-🛍️ **Producto:** {producto['nombre']}
-💎 **Cantidad:** {cantidad_data['cantidad']}
-🆔 **ID Free Fire:** {context.user_data['id_juego']}
-👤 **Nombre:** {context.user_data['nombre']}
-📱 **Contacto:** {contacto}
+🛍️ **Producto:** {sku.nombre}
+💎 **Cantidad:** {sku.cantidad}
+🆔 **ID Free Fire:** {checkout.id_juego}
+👤 **Nombre:** {escape_markdown(checkout.nombre)}
+📱 **Contacto:** {escape_markdown(contacto)}
 
-**💰 TOTAL A PAGAR: ${cantidad_data['precio']} MXN**
+**💰 TOTAL A PAGAR: ${sku.precio} MXN**
 
 ⚡ **Entrega inmediata tras confirmación de pago**
 
@@ -602,7 +762,7 @@ async def ingresar_contacto(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     keyboard = [
         [InlineKeyboardButton("✅ Confirmar Pedido", callback_data="confirmar_si")],
-        [InlineKeyboardButton("✏️ Modificar", callback_data="modificar_pedido")]
+        [InlineKeyboardButton("✏️ Modificar", callback_data="modificar_pedido")],
         [InlineKeyboardButton("❌ Cancelar", callback_data="cancelar_compra")]
     ]
     
@@ -614,7 +774,7 @@ async def ingresar_contacto(update: Update, context: ContextTypes.DEFAULT_TYPE)
         parse_mode='Markdown'
     )
     
-    return CONFIRMAR_PEDIDO
+    return context.user_data.ingresar_contacto(contacto)
 
 async def confirmar_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Confirma el pedido final"""
@@ -626,25 +786,33 @@ async def confirmar_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     
     # Preparar datos del pedido
     user = update.effective_user
-    producto = PRODUCTOS[context.user_data['producto']]
-    cantidad_data = producto['cantidades'][context.user_data['cantidad_key']]
+    checkout = context.user_data
+    sku = checkout.sku
     
     # Guardar en base de datos
     pedido_data = (
         user.id,
         user.username or "Sin username",
-        context.user_data['producto'],
-        cantidad_data['cantidad'],
-        context.user_data['id_juego'],
-        context.user_data['nombre'],
-        context.user_data['contacto'],
-        cantidad_data['precio'],
-        datetime.now()
+        sku.producto,
+        sku.cantidad,
+        checkout.id_juego,
+        checkout.nombre,
+        checkout.contacto,
+        sku.precio,
+        ahora_ms(),
+        checkout.clave
     )
     
-    pedido_id = db.guardar_pedido(pedido_data)
+    # Un doble toque o un update reenviado devuelve el pedido ya guardado: el
+    # callback ya está respondido y el cliente tiene su confirmación
+    pedido_id, nuevo = await db.guardar_pedido(pedido_data)
+    if not nuevo:
+        logger.info(f"Confirmación repetida del pedido #{pedido_id}")
+        checkout.reiniciar()
+        return ConversationHandler.END
     
-    logger.info(f"Pedido #{pedido_id} confirmado para {context.user_data['nombre']}")
+    pedidos_confirmados.sumar(sku.producto)
+    logger.info(f"Pedido #{pedido_id} confirmado para {checkout.nombre}")
     
     # Mensaje de confirmación para el cliente
     confirmacion_cliente = f"""
@@ -652,10 +820,10 @@ async def confirmar_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
 📄 **Número de pedido:** #{pedido_id}
 🎮 **Juego:** Free Fire
-🛍️ **Producto:** {producto['nombre']}
-💎 **Cantidad:** {cantidad_data['cantidad']}
-🆔 **ID:** {context.user_data['id_juego']}
-💰 **Total:** ${cantidad_data['precio']} MXN
+🛍️ **Producto:** {sku.nombre}
+💎 **Cantidad:** {sku.cantidad}
+🆔 **ID:** {checkout.id_juego}
+💰 **Total:** ${sku.precio} MXN
 
 **📋 PRÓXIMOS PASOS:**
 1️⃣ Te contactaremos para coordinar el pago
@@ -682,40 +850,11 @@ WhatsApp: +5355059350
         parse_mode='Markdown'
     )
     
-    # Notificar al grupo de administradores
-    try:
-        notificacion_admin = f"""
-🚨 **NUEVO PEDIDO - GAMEDIN**
-
-📄 **ID:** #{pedido_id}
-👤 **Cliente:** {context.user_data['nombre']} (@{user.username or 'Sin username'})
-📱 **Contacto:** {context.user_data['contacto']}
-📞 **Telegram ID:** {user.id}
-
-**🎮 PEDIDO:**
-🛍️ {producto['nombre']}
-💎 Cantidad: {cantidad_data['cantidad']}
-🆔 ID Free Fire: {context.user_data['id_juego']}
-
-**💰 PAGO:**
-Total: ${cantidad_data['precio']} MXN
-
-⏰ {datetime.now().strftime('%d/%m/%Y %H:%M')}
-
-🔥 **PROCESAR Y CONTACTAR AL CLIENTE**
-        """
-        
-        await context.bot.send_message(
-            chat_id=GRUPO_PEDIDOS_ID,
-            text=notificacion_admin,
-            parse_mode='Markdown'
-        )
-        logger.info(f"Notificación enviada al grupo para pedido #{pedido_id}")
-    except Exception as e:
-        logger.error(f"Error enviando notificación al grupo: {e}")
+    # Notificar al grupo de administradores (en segundo plano, con prioridad baja)
+    notificar_pedido(context.bot, (pedido_id,) + pedido_data[:9])
     
-    # Limpiar datos del usuario
-    context.user_data.clear()
+    # Terminar el checkout
+    checkout.reiniciar()
     
     return ConversationHandler.END
 
@@ -724,51 +863,24 @@ async def modificar_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     query = update.callback_query
     await query.answer()
     
-    # Limpiar datos del pedido actual pero mantener usuario
-    if 'producto' in context.user_data:
-        del context.user_data['producto']
-    if 'cantidad_key' in context.user_data:
-        del context.user_data['cantidad_key']
-    if 'id_juego' in context.user_data:
-        del context.user_data['id_juego']
-    
     logger.info("Usuario decidió modificar su pedido")
     
-    selection_text = """
-🛒 **COMPRAR - PASO 1/6**
-
-🎮 **¿Qué quieres comprar para Free Fire?**
-
-Selecciona el tipo de producto:
-    """
-    
-    keyboard = []
-    for key, producto in PRODUCTOS.items():
-        keyboard.append([InlineKeyboardButton(
-            producto['nombre'],
-            callback_data=f"producto_{key}"
-        )])
-    
-    keyboard.append([InlineKeyboardButton("❌ Cancelar", callback_data="cancelar_compra")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    pantalla = PANTALLAS["seleccion_producto"]
     
     await query.message.reply_text(
-        selection_text,
-        reply_markup=reply_markup,
+        pantalla.texto,
+        reply_markup=pantalla.teclado,
         parse_mode='Markdown'
     )
     
-    return SELECCIONAR_PRODUCTO
+    # Limpiar datos del pedido actual pero mantener usuario
+    return context.user_data.modificar()
 
 async def cancelar_compra(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancela la compra actual"""
     query = update.callback_query
     await query.answer()
     
-    context.user_data.clear()
-    logger.info("Compra cancelada por el usuario")
-    
     await query.message.reply_text(
         "❌ Compra cancelada.\n\n¿Qué deseas hacer ahora?",
         reply_markup=InlineKeyboardMarkup([
@@ -777,6 +889,11 @@ async def cancelar_compra(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         ])
     )
     
+    checkout = context.user_data
+    checkouts_abandonados.sumar(NOMBRES_PASO.get(checkout.paso, str(checkout.paso)), "cancelado")
+    checkout.reiniciar()
+    logger.info("Compra cancelada por el usuario")
+    
     return ConversationHandler.END
 
 async def menu_principal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -784,33 +901,11 @@ async def menu_principal(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     query = update.callback_query
     await query.answer()
     
-    welcome_text = """
-🎮 **¡Bienvenido a GAMEDIN!** 🎮
-
-Tu tienda de confianza para Free Fire
-
-**🔥 ¿Qué puedes comprar aquí?**
-• 💎 Diamantes Free Fire
-• 🪙 Monedas Free Fire  
-• 🎫 Pases de Batalla
-
-**⚡ Entrega inmediata • Precios competitivos**
-
-¡Elige una opción para comenzar!
-    """
-    
-    keyboard = [
-        [InlineKeyboardButton("🛒 Comprar Ahora", callback_data="hacer_pedido")],
-        [InlineKeyboardButton("📋 Ver Productos", callback_data="ver_productos")],
-        [InlineKeyboardButton("📞 Contacto", callback_data="contacto")],
-        [InlineKeyboardButton("❓ Ayuda", callback_data="ayuda")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    pantalla = PANTALLAS["menu_principal"]
     
     await query.message.reply_text(
-        welcome_text,
-        reply_markup=reply_markup,
+        pantalla.texto,
+        reply_markup=pantalla.teclado,
         parse_mode='Markdown'
     )
 
@@ -818,27 +913,303 @@ Tu tienda de confianza para Free Fire
 # COMANDOS DE ADMINISTRADOR
 # =====================================================
 
+# Paginación de /admin_pedidos. Los filtros viajan en el callback_data de los
+# botones con claves de una letra, así cada botón funciona por sí solo.
+PEDIDOS_POR_PAGINA = 10
+CLAVES_FILTRO = {"estado": "e", "producto": "p", "user_id": "u", "username": "n", "desde": "d", "hasta": "h"}
+CAMPOS_FILTRO = {clave: campo for campo, clave in CLAVES_FILTRO.items()}
+
+USO_ADMIN_PEDIDOS = """
+❌ {error}
+
+**Uso:** /admin\\_pedidos [filtros]
+• estado=pendiente
+• producto=diamantes
+• cliente=123456789 o cliente=@usuario
+• desde=2024-01-01 hasta=2024-01-31
+"""
+
+def parsear_filtros_pedidos(args):
+    """Convierte los argumentos de /admin_pedidos en filtros de la base de datos"""
+    filtros = {}
+    for arg in args:
+        campo, _, valor = arg.partition("=")
+        campo = campo.lower()
+        if not valor or ":" in valor:
+            raise ValueError(f"Valor inválido en '{arg}'")
+        
+        if campo in ("estado", "producto"):
+            filtros[campo] = valor.lower()
+        elif campo == "cliente":
+            if valor.isdigit():
+                filtros["user_id"] = int(valor)
+            else:
+                filtros["username"] = valor.lstrip("@")
+        elif campo in ("desde", "hasta"):
+            fecha = datetime.strptime(valor, "%Y-%m-%d")
+            # 'hasta' incluye el día indicado
+            if campo == "hasta":
+                fecha += timedelta(days=1)
+            filtros[campo] = fecha.strftime("%Y-%m-%d")
+        else:
+            raise ValueError(f"Filtro desconocido: {campo}")
+    return filtros
+
+def describir_filtros_pedidos(filtros):
+    """Filtros tal como los escribió el administrador"""
+    descripcion = []
+    for campo, valor in filtros.items():
+        if campo == "hasta":
+            valor = (datetime.strptime(valor, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        elif campo == "user_id":
+            campo = "cliente"
+        elif campo == "username":
+            campo, valor = "cliente", f"@{valor}"
+        descripcion.append(f"{campo}={escape_markdown(str(valor))}")
+    return " · ".join(descripcion)
+
+def callback_pagina_pedidos(filtros, cursor, hacia_recientes):
+    """callback_data de un botón de página, o None si no cabe en 64 bytes"""
+    partes = ["adp", "r" if hacia_recientes else "a", str(cursor)]
+    # Las fechas van sin guiones para ahorrar bytes
+    partes += [f"{CLAVES_FILTRO[campo]}={str(valor).replace('-', '') if campo in ('desde', 'hasta') else valor}"
+               for campo, valor in filtros.items()]
+    data = ":".join(partes)
+    return data if len(data.encode()) <= 64 else None
+
+def leer_callback_pagina_pedidos(data):
+    """Inverso de callback_pagina_pedidos: (filtros, cursor, hacia_recientes)"""
+    _, direccion, cursor, *partes = data.split(":")
+    filtros = {}
+    for parte in partes:
+        clave, _, valor = parte.partition("=")
+        if clave == "u":
+            valor = int(valor)
+        elif clave in ("d", "h"):
+            valor = f"{valor[:4]}-{valor[4:6]}-{valor[6:]}"
+        filtros[CAMPOS_FILTRO[clave]] = valor
+    return filtros, int(cursor), direccion == "r"
+
+async def pagina_pedidos(filtros, cursor=None, hacia_recientes=False):
+    """Texto y teclado de una página de /admin_pedidos"""
+    pedidos, hay_mas = await db.obtener_pagina_pedidos(
+        filtros, cursor, hacia_recientes, PEDIDOS_POR_PAGINA
+    )
+    
+    if not pedidos:
+        texto = "No hay pedidos con esos filtros." if filtros else "No hay pedidos registrados."
+        return texto, None
+    
+    texto_pedidos = "📊 **PEDIDOS**\n"
+    if filtros:
+        texto_pedidos += f"🔎 {describir_filtros_pedidos(filtros)}\n"
+    texto_pedidos += "\n"
+    
+    # Las fechas son enteros: se pasan a hora local todas de una vez
+    fechas = fechas_locales(pedido[9] for pedido in pedidos)
+    for pedido, fecha in zip(pedidos, fechas):
+        texto_pedidos += f"**#{pedido[0]}** - {escape_markdown(pedido[6])} - ${pedido[8]} MXN - {pedido[10]}\n"
+        texto_pedidos += f"🎮 {pedido[4]} - {pedido[3]}\n"
+        texto_pedidos += f"📅 {fecha.strftime('%d/%m/%Y %H:%M')}\n\n"
+    
+    # Hay pedidos más recientes si se llegó desde ellos o si la consulta hacia
+    # ellos dijo que quedan; lo mismo para los más antiguos
+    hay_recientes = hay_mas if hacia_recientes else cursor is not None
+    hay_antiguos = True if hacia_recientes else hay_mas
+    
+    botones = []
+    if hay_recientes:
+        data = callback_pagina_pedidos(filtros, pedidos[0][0], True)
+        if data:
+            botones.append(InlineKeyboardButton("⬅️ Más recientes", callback_data=data))
+    if hay_antiguos:
+        data = callback_pagina_pedidos(filtros, pedidos[-1][0], False)
+        if data:
+            botones.append(InlineKeyboardButton("Más antiguos ➡️", callback_data=data))
+    
+    return texto_pedidos, InlineKeyboardMarkup([botones]) if botones else None
+
 async def admin_pedidos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Comando para ver pedidos recientes (solo admin)"""
+    """Comando para ver pedidos, paginados y con filtros (solo admin)"""
     if str(update.effective_user.id) != ADMIN_ID:
         await update.message.reply_text("❌ No tienes permisos para este comando.")
         return
     
-    pedidos = db.obtener_pedidos(10)
-    
-    if not pedidos:
-        await update.message.reply_text("No hay pedidos registrados.")
+    try:
+        filtros = parsear_filtros_pedidos(context.args)
+    except ValueError as e:
+        await update.message.reply_text(USO_ADMIN_PEDIDOS.format(error=escape_markdown(str(e))), parse_mode='Markdown')
         return
     
-    texto_pedidos = "📊 **ÚLTIMOS 10 PEDIDOS**\n\n"
-    
-    for pedido in pedidos:
-        fecha = datetime.strptime(pedido[9], '%Y-%m-%d %H:%M:%S.%f')
-        texto_pedidos += f"**#{pedido[0]}** - {pedido[6]} - ${pedido[8]} MXN\n"
-        texto_pedidos += f"🎮 {pedido[4]} - {pedido[3]}\n"
-        texto_pedidos += f"📅 {fecha.strftime('%d/%m/%Y %H:%M')}\n\n"
+    texto, teclado = await pagina_pedidos(filtros)
+    await update.message.reply_text(texto, reply_markup=teclado, parse_mode='Markdown')
+
+async def admin_pedidos_pagina(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Botones de página de /admin_pedidos (solo admin)"""
+    query = update.callback_query
+    if str(query.from_user.id) != ADMIN_ID:
+        await query.answer("❌ No tienes permisos.")
+        return
+    await query.answer()
     
-    await update.message.reply_text(texto_pedidos, parse_mode='Markdown')
+    filtros, cursor, hacia_recientes = leer_callback_pagina_pedidos(query.data)
+    texto, teclado = await pagina_pedidos(filtros, cursor, hacia_recientes)
+    await query.edit_message_text(texto, reply_markup=teclado, parse_mode='Markdown')
+
+# Estado de los pedidos. Los botones llevan "est:<id>:<esperado>:<nuevo>" en la
+# notificación del grupo y "estc:..." en /admin_cola; "est:<id>" solo
+# refresca el estado mostrado.
+BOTONES_ESTADO = {"pagado": "💰 Pagado", "entregado": "📦 Entregado", "cancelado": "❌ Cancelar"}
+ICONOS_ESTADO = {"pendiente": "⏳", "pagado": "💰", "entregado": "✅", "cancelado": "❌"}
+# Estados con algo por hacer: los que tienen cola
+ESTADOS_COLA = [estado for estado, siguientes in TRANSICIONES_ESTADO.items() if siguientes]
+MAX_CONTEO_COLA = 1000
+
+USO_ADMIN_COLA = """
+❌ {error}
+
+**Uso:** /admin\\_cola [{estados}]
+"""
+
+def es_operador(user_id, chat_id):
+    """El administrador o cualquier miembro del grupo de pedidos"""
+    return str(user_id) == ADMIN_ID or str(chat_id) == GRUPO_PEDIDOS_ID
+
+def teclado_estado_pedido(pedido_id, estado, operador=None):
+    """Teclado de la notificación de un pedido: su estado y los cambios posibles"""
+    if estado is None:
+        etiqueta = "❔ Pedido inexistente"
+    else:
+        etiqueta = f"{ICONOS_ESTADO.get(estado, '❔')} {estado.capitalize()}"
+    if operador:
+        etiqueta += f" · {operador}"
+
+    filas = [[InlineKeyboardButton(etiqueta, callback_data=f"est:{pedido_id}")]]
+    acciones = [
+        InlineKeyboardButton(BOTONES_ESTADO[nuevo], callback_data=f"est:{pedido_id}:{estado}:{nuevo}")
+        for nuevo in TRANSICIONES_ESTADO.get(estado, ())
+    ]
+    if acciones:
+        filas.append(acciones)
+    return InlineKeyboardMarkup(filas)
+
+async def pagina_cola(estado, cursor=None):
+    """Texto y teclado de una página de /admin_cola, del pedido más antiguo al más reciente"""
+    pedidos, hay_mas, total = await db.obtener_cola_pedidos(
+        estado, cursor, PEDIDOS_POR_PAGINA, MAX_CONTEO_COLA
+    )
+
+    if not pedidos:
+        return f"✅ No hay pedidos en estado {estado}.", None
+
+    total_texto = f"{total}+" if total >= MAX_CONTEO_COLA else str(total)
+    texto_cola = f"📥 **COLA: {estado.upper()}** ({total_texto})\n\n"
+    botones = []
+    fechas = fechas_locales(pedido[9] for pedido in pedidos)
+    for pedido, fecha in zip(pedidos, fechas):
+        texto_cola += f"**#{pedido[0]}** - {escape_markdown(pedido[6])} - ${pedido[8]} MXN\n"
+        texto_cola += f"🎮 {pedido[4]} - {pedido[3]} · 📅 {fecha.strftime('%d/%m %H:%M')}\n\n"
+        botones.append([
+            InlineKeyboardButton(f"{BOTONES_ESTADO[nuevo]} #{pedido[0]}", callback_data=f"estc:{pedido[0]}:{estado}:{nuevo}")
+            for nuevo in TRANSICIONES_ESTADO[estado]
+        ])
+
+    navegacion = []
+    if cursor is not None:
+        navegacion.append(InlineKeyboardButton("⏮️ Inicio", callback_data=f"cola:{estado}"))
+    if hay_mas:
+        navegacion.append(InlineKeyboardButton("Siguientes ➡️", callback_data=f"cola:{estado}:{pedidos[-1][0]}"))
+    if navegacion:
+        botones.append(navegacion)
+
+    return texto_cola, InlineKeyboardMarkup(botones)
+
+async def admin_cola(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Cola de pedidos por atender, los más antiguos primero (admin y grupo de pedidos)"""
+    if not es_operador(update.effective_user.id, update.effective_chat.id):
+        await update.message.reply_text("❌ No tienes permisos para este comando.")
+        return
+
+    estado = context.args[0].lower() if context.args else "pendiente"
+    if estado not in ESTADOS_COLA:
+        error = escape_markdown(f"Estado sin cola: {estado}")
+        await update.message.reply_text(
+            USO_ADMIN_COLA.format(error=error, estados="|".join(ESTADOS_COLA)), parse_mode='Markdown'
+        )
+        return
+
+    texto, teclado = await pagina_cola(estado)
+    await update.message.reply_text(texto, reply_markup=teclado, parse_mode='Markdown')
+
+async def mensaje_inaccesible(query):
+    """Responde al botón de un mensaje que Telegram ya no entrega; True si es el caso.
+
+    Sin el mensaje no hay chat con el que comprobar permisos ni teclado que
+    editar.
+    """
+    if query.message is not None:
+        return False
+    await query.answer("⚠️ Este mensaje ya no está disponible, usa /admin_cola.", show_alert=True)
+    return True
+
+async def admin_cola_pagina(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Botones de página de /admin_cola"""
+    query = update.callback_query
+    if await mensaje_inaccesible(query):
+        return
+    if not es_operador(query.from_user.id, query.message.chat.id):
+        await query.answer("❌ No tienes permisos.")
+        return
+    await query.answer()
+
+    _, estado, *cursor = query.data.split(":")
+    texto, teclado = await pagina_cola(estado, int(cursor[0]) if cursor else None)
+    await query.edit_message_text(texto, reply_markup=teclado, parse_mode='Markdown')
+
+async def cambiar_estado_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Botones de estado de la notificación y de /admin_cola"""
+    query = update.callback_query
+    if await mensaje_inaccesible(query):
+        return
+    if not es_operador(query.from_user.id, query.message.chat.id):
+        await query.answer("❌ No tienes permisos.")
+        return
+
+    origen, pedido_id, *cambio = query.data.split(":")
+    pedido_id = int(pedido_id)
+    operador = f"@{query.from_user.username}" if query.from_user.username else query.from_user.first_name
+
+    if cambio:
+        esperado, nuevo = cambio
+        # Compare-and-set: si otro operador se adelantó, no se pisa su cambio
+        try:
+            cambiado, estado = await db.cambiar_estado_pedido(pedido_id, esperado, nuevo)
+        except ValueError:
+            await query.answer("❌ Cambio de estado no permitido.", show_alert=True)
+            return
+        if cambiado:
+            logger.info(f"Pedido #{pedido_id}: {esperado} → {nuevo} por {operador}")
+            await query.answer(f"✅ Pedido #{pedido_id}: {nuevo}")
+        elif estado is None:
+            await query.answer(f"⚠️ El pedido #{pedido_id} no existe", show_alert=True)
+        else:
+            await query.answer(f"⚠️ El pedido #{pedido_id} ya está {estado}", show_alert=True)
+    else:
+        cambiado, estado = False, await db.obtener_estado_pedido(pedido_id)
+        await query.answer(f"Pedido #{pedido_id}: {estado or 'no existe'}")
+
+    if origen == "est":
+        teclado = teclado_estado_pedido(pedido_id, estado, operador if cambiado else None)
+    else:
+        # En la cola el pedido ya no está en el estado listado: se quitan sus botones
+        filas = [
+            fila for fila in query.message.reply_markup.inline_keyboard
+            if not fila[0].callback_data.startswith(f"estc:{pedido_id}:")
+        ]
+        teclado = InlineKeyboardMarkup(filas)
+
+    if teclado != query.message.reply_markup:
+        await query.edit_message_reply_markup(reply_markup=teclado)
 
 async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Estadísticas básicas (solo admin)"""
@@ -846,48 +1217,291 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await update.message.reply_text("❌ No tienes permisos para este comando.")
         return
     
-    conn = sqlite3.connect(db.db_name)
-    cursor = conn.cursor()
-    
-    # Total de pedidos
-    cursor.execute("SELECT COUNT(*) FROM pedidos")
-    total_pedidos = cursor.fetchone()[0]
-    
-    # Total de ventas
-    cursor.execute("SELECT SUM(precio) FROM pedidos")
-    total_ventas = cursor.fetchone()[0] or 0
-    
-    # Producto más vendido
-    cursor.execute("SELECT producto, COUNT(*) as cantidad FROM pedidos GROUP BY producto ORDER BY cantidad DESC LIMIT 1")
-    producto_popular = cursor.fetchone()
-    
-    conn.close()
+    total_pedidos, total_ventas, producto_popular = await db.obtener_estadisticas()
     
     stats_text = f"""
 📊 **ESTADÍSTICAS GAMEDIN**
 
 📦 **Total pedidos:** {total_pedidos}
 💰 **Total ventas:** ${total_ventas} MXN
-🎮 **Producto más vendido:** {PRODUCTOS[producto_popular[0]]['nombre'] if producto_popular else 'N/A'} ({producto_popular[1] if producto_popular else 0} unidades)
+🎮 **Producto más vendido:** {catalogo.actual.nombre_producto(producto_popular[0]) if producto_popular else 'N/A'} ({producto_popular[1] if producto_popular else 0} unidades)
+🛒 **Checkouts en curso:** {expirador.vivos} ({expirador.expirados} expirados)
 
 📅 **Última actualización:** {datetime.now().strftime('%d/%m/%Y %H:%M')}
     """
     
     await update.message.reply_text(stats_text, parse_mode='Markdown')
 
+USO_ADMIN_VENTAS = """
+❌ {error}
+
+**Uso:** /admin\\_ventas [vista]
+• hoy - ventas de hoy por producto
+• semana - últimos 7 días
+• horas [2024-01-31] - ventas por hora de un día (hoy por defecto)
+"""
+
+def sumar_ventas(filas, clave):
+    """Agrupa filas (franja, producto, pedidos, ingresos, unidades) por `clave(fila)`"""
+    totales = {}
+    for fila in filas:
+        pedidos, ingresos, unidades = totales.get(clave(fila), (0, 0, 0))
+        totales[clave(fila)] = (pedidos + fila[2], ingresos + fila[3], unidades + fila[4])
+    return totales
+
+def texto_ventas_por_producto(filas):
+    """Líneas con los totales por producto y el total general"""
+    por_producto = sumar_ventas(filas, lambda fila: fila[1])
+    pedidos = sum(valores[0] for valores in por_producto.values())
+    ingresos = sum(valores[1] for valores in por_producto.values())
+
+    texto = f"📦 **Pedidos:** {pedidos}\n💰 **Ingresos:** ${ingresos:,} MXN\n"
+    if por_producto:
+        texto += "\n**Por producto:**\n"
+    for producto, (pedidos, ingresos, unidades) in sorted(por_producto.items(), key=lambda item: -item[1][1]):
+        texto += f"• {catalogo.actual.nombre_producto(producto)}: {pedidos} pedidos · {unidades:,} uds · ${ingresos:,}\n"
+    return texto
+
+async def admin_ventas(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Ventas de hoy, de la última semana o por hora (solo admin)"""
+    if str(update.effective_user.id) != ADMIN_ID:
+        await update.message.reply_text("❌ No tienes permisos para este comando.")
+        return
+
+    vista = context.args[0].lower() if context.args else "hoy"
+    hoy = datetime.now().date()
+
+    try:
+        if vista == "hoy":
+            filas = await db.obtener_ventas_por_dia(hoy.isoformat(), (hoy + timedelta(days=1)).isoformat())
+            texto = f"📅 **VENTAS DE HOY** ({hoy.strftime('%d/%m/%Y')})\n\n" + texto_ventas_por_producto(filas)
+
+        elif vista == "semana":
+            desde = hoy - timedelta(days=6)
+            filas = await db.obtener_ventas_por_dia(desde.isoformat(), (hoy + timedelta(days=1)).isoformat())
+            por_dia = sumar_ventas(filas, lambda fila: fila[0])
+            texto = f"📅 **ÚLTIMOS 7 DÍAS** ({desde.strftime('%d/%m')} – {hoy.strftime('%d/%m')})\n\n"
+            for numero in range(7):
+                dia = desde + timedelta(days=numero)
+                pedidos, ingresos, _ = por_dia.get(dia.isoformat(), (0, 0, 0))
+                texto += f"• {dia.strftime('%d/%m')}: {pedidos} pedidos · ${ingresos:,}\n"
+            texto += "\n" + texto_ventas_por_producto(filas)
+
+        elif vista == "horas":
+            dia = datetime.strptime(context.args[1], "%Y-%m-%d").date() if len(context.args) > 1 else hoy
+            filas = await db.obtener_ventas_por_hora(dia.isoformat(), (dia + timedelta(days=1)).isoformat())
+            por_hora = sumar_ventas(filas, lambda fila: fila[0])
+            texto = f"🕒 **VENTAS POR HORA** ({dia.strftime('%d/%m/%Y')})\n\n"
+            for hora, (pedidos, ingresos, _) in sorted(por_hora.items()):
+                texto += f"• {hora[11:13]}h: {pedidos} pedidos · ${ingresos:,}\n"
+            if not por_hora:
+                texto += "Sin pedidos ese día.\n"
+            texto += "\n" + texto_ventas_por_producto(filas)
+
+        else:
+            raise ValueError(f"Vista desconocida: {vista}")
+    except ValueError as e:
+        await update.message.reply_text(USO_ADMIN_VENTAS.format(error=escape_markdown(str(e))), parse_mode='Markdown')
+        return
+
+    await update.message.reply_text(texto, parse_mode='Markdown')
+
+async def admin_reconstruir_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Recalcula las estadísticas desde los pedidos y verifica que coincidan (solo admin)"""
+    if str(update.effective_user.id) != ADMIN_ID:
+        await update.message.reply_text("❌ No tienes permisos para este comando.")
+        return
+    
+    diferencias = await db.reconstruir_agregados()
+    # Ventas por hora y por día: un día por transacción, sin frenar los pedidos
+    dias_distintos = await db.reconstruir_ventas_por_tiempo()
+    
+    if not diferencias and not dias_distintos:
+        await update.message.reply_text("✅ Estadísticas reconstruidas. Todo coincidía.")
+        return
+    
+    texto = f"⚠️ **Estadísticas reconstruidas con {len(diferencias)} diferencias:**\n\n"
+    for producto, (pedidos_antes, ventas_antes), (pedidos_ahora, ventas_ahora) in diferencias:
+        texto += f"• {producto}: {pedidos_antes} → {pedidos_ahora} pedidos, ${ventas_antes} → ${ventas_ahora} MXN\n"
+    if dias_distintos:
+        muestra = ", ".join(dias_distintos[:10]) + (" …" if len(dias_distintos) > 10 else "")
+        texto += f"\n📅 **Ventas por hora corregidas en {len(dias_distintos)} días:** {muestra}\n"
+    
+    await update.message.reply_text(texto, parse_mode='Markdown')
+
+# Límite de Telegram para los documentos que sube un bot
+MAX_DOCUMENTO_BOT = 50 * 1024 * 1024
+
+USO_ADMIN_EXPORTAR = """
+❌ {error}
+
+**Uso:** /admin\\_exportar [csv|jsonl] [filtros | incremental]
+• desde=2024-01-01 hasta=2024-01-31
+• estado=, producto= y cliente= como en /admin\\_pedidos
+• incremental: solo los pedidos posteriores a la última exportación incremental
+"""
+
+def parsear_exportacion(args):
+    """Convierte los argumentos de /admin_exportar en (formato, filtros, incremental)"""
+    formato, incremental, resto = "csv", False, []
+    for arg in args:
+        if arg.lower() in FORMATOS_EXPORTACION:
+            formato = arg.lower()
+        elif arg.lower() == "incremental":
+            incremental = True
+        else:
+            resto.append(arg)
+
+    filtros = parsear_filtros_pedidos(resto)
+    # Con filtros, los pedidos que no los cumplen quedarían por detrás del
+    # último id exportado y la siguiente incremental se los saltaría
+    if incremental and filtros:
+        raise ValueError("La exportación incremental no admite filtros")
+    return formato, filtros, incremental
+
+async def admin_exportar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Envía los pedidos como CSV o JSONL comprimido (solo admin)"""
+    if str(update.effective_user.id) != ADMIN_ID:
+        await update.message.reply_text("❌ No tienes permisos para este comando.")
+        return
+
+    try:
+        formato, filtros, incremental = parsear_exportacion(context.args)
+    except ValueError as e:
+        await update.message.reply_text(USO_ADMIN_EXPORTAR.format(error=escape_markdown(str(e))), parse_mode='Markdown')
+        return
+
+    desde_id = await db.ultimo_id_exportado() if incremental else 0
+
+    # Se escribe en disco por lotes: la memoria no crece con el número de pedidos
+    descriptor, ruta = tempfile.mkstemp(prefix="gamedin-pedidos-", suffix=f".{formato}.gz")
+    os.close(descriptor)
+    try:
+        filas, ultimo_id = await db.exportar_pedidos(escritor_gzip(ruta, formato), filtros, desde_id)
+
+        if not filas:
+            texto = "No hay pedidos nuevos desde la última exportación." if incremental else "No hay pedidos con esos filtros."
+            await update.message.reply_text(texto)
+            return
+
+        tamano = os.path.getsize(ruta)
+        if tamano > MAX_DOCUMENTO_BOT:
+            await update.message.reply_text(
+                f"❌ La exportación ocupa {tamano / 1024 / 1024:.1f} MB y Telegram admite hasta 50 MB. "
+                "Acota el rango con desde= y hasta=."
+            )
+            return
+
+        nombre = f"pedidos_{datetime.now().strftime('%Y%m%d_%H%M')}.{formato}.gz"
+        descripcion = f"📦 {filas} pedidos"
+        if incremental:
+            descripcion += f" (#{desde_id + 1} – #{ultimo_id})"
+        elif filtros:
+            descripcion += f"\n🔎 {describir_filtros_pedidos(filtros)}"
+
+        with open(ruta, "rb") as documento:
+            await update.message.reply_document(
+                document=documento, filename=nombre, caption=descripcion,
+                parse_mode='Markdown', write_timeout=120
+            )
+
+        # Solo avanza una vez entregado el archivo: si el envío falla, la
+        # siguiente incremental vuelve a incluir estos pedidos
+        if incremental:
+            await db.registrar_exportacion(formato, filas, ultimo_id)
+        logger.info(f"Exportados {filas} pedidos en {formato} ({tamano} bytes)")
+    finally:
+        os.remove(ruta)
+
+USO_ADMIN_PROFILE = f"""
+**Uso:** /admin\\_profile <segundos>
+• Entre 1 y {PERFIL_MAX_SEG} segundos
+• Devuelve las pilas colapsadas para flamegraph.pl o speedscope.app
+"""
+
+# Un solo perfil a la vez: dos muestreos simultáneos se medirían entre sí
+perfil_en_curso = asyncio.Lock()
+
+async def admin_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Perfila el proceso durante unos segundos y envía las pilas colapsadas (solo admin)"""
+    if str(update.effective_user.id) != ADMIN_ID:
+        await update.message.reply_text("❌ No tienes permisos para este comando.")
+        return
+
+    segundos = context.args[0] if len(context.args) == 1 else ""
+    if not segundos.isdigit() or not 1 <= int(segundos) <= PERFIL_MAX_SEG:
+        await update.message.reply_text(USO_ADMIN_PROFILE, parse_mode='Markdown')
+        return
+    segundos = int(segundos)
+
+    if perfil_en_curso.locked():
+        await update.message.reply_text("⏳ Ya hay un perfil en curso, espera a que termine.")
+        return
+
+    async with perfil_en_curso:
+        await update.message.reply_text(f"⏱️ Perfilando durante {segundos}s...")
+        # El muestreo corre en otro hilo: el event loop sigue atendiendo
+        # updates y queda retratado en el perfil
+        pilas = await asyncio.to_thread(perfilar, segundos, PERFIL_HZ)
+
+    muestras = sum(pilas.values())
+    nombre = f"perfil_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+    await update.message.reply_document(
+        document=pilas_colapsadas(pilas).encode("utf-8"),
+        filename=nombre,
+        caption=f"🔥 {muestras} muestras de {len(pilas)} pilas distintas en {segundos}s",
+        write_timeout=120
+    )
+    logger.info(f"Perfil de {segundos}s enviado: {muestras} muestras")
+
 # =====================================================
 # FUNCIÓN PRINCIPAL
 # =====================================================
 
-def main() -> None:
-    """Función principal"""
-    # Crear la aplicación
-    application = Application.builder().token(BOT_TOKEN).build()
+async def iniciar_recursos(application: Application) -> None:
+    """Arranca las tareas en segundo plano del bot"""
+    catalogo.iniciar()
+    expirador.iniciar(application)
+    await servidor_metricas.iniciar()
+    trazador.iniciar()
+    await notificar_pendientes(application.bot)
+
+async def detener_recursos(application: Application) -> None:
+    """Envía lo pendiente mientras el planificador de envíos sigue activo"""
+    resumen_pedidos.vaciar()
+    await expirador.detener()
+
+async def cerrar_recursos(application: Application) -> None:
+    """Libera los recursos al detener el bot"""
+    await servidor_metricas.detener()
+    trazador.detener()
+    await catalogo.detener()
+    await db.cerrar()
+
+def crear_aplicacion() -> Application:
+    """Construye la aplicación con todos los handlers registrados"""
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(BOT_API_URL)
+        .concurrent_updates(ProcesadorPorUsuario(UPDATES_CONCURRENTES, shards=SHARDS_POR_USUARIO, metricas=metricas, trazador=trazador))
+        .rate_limiter(planificador)
+        .persistence(persistencia)
+        .context_types(ContextTypes(user_data=Checkout))
+        .post_init(iniciar_recursos)
+        .post_stop(detener_recursos)
+        .post_shutdown(cerrar_recursos)
+        .build()
+    )
     
     # Handler para el flujo de compras
     conv_handler = ConversationHandler(
+        # Con allow_reentry estos botones funcionan desde cualquier paso y la
+        # conversación se mueve con el checkout: nunca queda en un paso cuyo
+        # checkout ya se reinició
         entry_points=[
             CallbackQueryHandler(iniciar_pedido, pattern="^hacer_pedido$"),
+            CallbackQueryHandler(modificar_pedido, pattern="^modificar_pedido$"),
             CommandHandler("comprar", iniciar_pedido)
         ],
         states={
@@ -904,16 +1518,30 @@ def main() -> None:
         fallbacks=[
             CallbackQueryHandler(cancelar_compra, pattern="^cancelar_compra$"),
             CommandHandler("start", start)
-        ]
+        ],
+        allow_reentry=True,
+        name="compra",
+        persistent=True
     )
     
     # Agregar handlers
+    if FLOOD_POR_SEG > 0:
+        # Antes que cualquier otro grupo: un update descartado no llega a ninguno
+        application.add_handler(TypeHandler(Update, limitador.filtrar), group=-1)
     application.add_handler(conv_handler)
+    # Después de la conversación: renueva o cierra el plazo del checkout
+    expirador.vigilar(conv_handler)
+    application.add_handler(TypeHandler(Update, expirador.registrar), group=1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("productos", mostrar_productos))
     application.add_handler(CommandHandler("ayuda", ayuda))
     application.add_handler(CommandHandler("admin_pedidos", admin_pedidos))
     application.add_handler(CommandHandler("admin_stats", admin_stats))
+    application.add_handler(CommandHandler("admin_ventas", admin_ventas))
+    application.add_handler(CommandHandler("admin_reconstruir_stats", admin_reconstruir_stats))
+    application.add_handler(CommandHandler("admin_exportar", admin_exportar))
+    application.add_handler(CommandHandler("admin_cola", admin_cola))
+    application.add_handler(CommandHandler("admin_profile", admin_profile))
     
     # Callback query handlers
     application.add_handler(CallbackQueryHandler(mostrar_productos, pattern="^ver_productos$"))
@@ -921,14 +1549,37 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(ayuda, pattern="^ayuda$"))
     application.add_handler(CallbackQueryHandler(ayuda_id, pattern="^ayuda_id$"))
     application.add_handler(CallbackQueryHandler(menu_principal, pattern="^menu_principal$"))
-    application.add_handler(CallbackQueryHandler(iniciar_pedido, pattern="^hacer_pedido$"))
-    application.add_handler(CallbackQueryHandler(modificar_pedido, pattern="^modificar_pedido$"))
+    application.add_handler(CallbackQueryHandler(admin_pedidos_pagina, pattern="^adp:"))
+    application.add_handler(CallbackQueryHandler(admin_cola_pagina, pattern="^cola:"))
+    application.add_handler(CallbackQueryHandler(cambiar_estado_pedido, pattern="^estc?:"))
+    
+    # Con todo registrado: cada handler mide su latencia y sus errores
+    medir_handlers(application, metricas, NOMBRES_PASO)
+    
+    return application
+
+def main() -> None:
+    """Función principal"""
+    application = crear_aplicacion()
     
     # Iniciar el bot
     print("🎮 Bot GAMEDIN iniciando...")
     print("✅ Presiona Ctrl+C para detener")
     
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if MODO_BOT == "webhook":
+        print(f"🌐 Modo webhook en {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            # Telegram envía este token en cada petición y el servidor
+            # rechaza con 403 las que no lo traen
+            secret_token=WEBHOOK_SECRET or secrets.token_urlsafe(32),
+            allowed_updates=ACTUALIZACIONES_PERMITIDAS
+        )
+    else:
+        application.run_polling(allowed_updates=ACTUALIZACIONES_PERMITIDAS)
 
 if __name__ == '__main__':
     main()
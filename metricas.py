@@ -0,0 +1,254 @@
+# metricas.py - Contadores, histogramas y endpoint HTTP en formato de texto de Prometheus
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+
+from trazas import tramo
+
+logger = logging.getLogger(__name__)
+
+# Límites en segundos de los histogramas de latencia
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+# =====================================================
+# MÉTRICAS
+# =====================================================
+class _Familia:
+    """Métrica con etiquetas: una serie por combinación de valores"""
+
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}
+
+    def _selector(self, valores, extra=""):
+        pares = [f'{etiqueta}="{_escapar(valor)}"' for etiqueta, valor in zip(self.etiquetas, valores)]
+        if extra:
+            pares.append(extra)
+        return "{" + ",".join(pares) + "}" if pares else ""
+
+    def lineas(self):
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        yield from self._muestras()
+
+class Contador(_Familia):
+    """Valor que solo crece: pedidos, errores, abandonos"""
+
+    tipo = "counter"
+
+    def sumar(self, *valores, cantidad=1):
+        self._series[valores] = self._series.get(valores, 0) + cantidad
+
+    def _muestras(self):
+        for valores, total in self._series.items():
+            yield f"{self.nombre}{self._selector(valores)} {_numero(total)}"
+
+class Histograma(_Familia):
+    """Distribución de duraciones en cubos fijos.
+
+    Cada observación suma en un solo cubo y los acumulados que pide el
+    formato de Prometheus se calculan al exponer, así observar cuesta una
+    búsqueda binaria y tres sumas.
+    """
+
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, segundos, *valores):
+        serie = self._series.get(valores)
+        if serie is None:
+            # [cubos..., +Inf, suma, cantidad]
+            serie = self._series[valores] = [0] * (len(self.limites) + 1) + [0.0, 0]
+        serie[bisect_left(self.limites, segundos)] += 1
+        serie[-2] += segundos
+        serie[-1] += 1
+
+    def _muestras(self):
+        for valores, serie in self._series.items():
+            acumulado = 0
+            for limite, cantidad in zip(self.limites + ("+Inf",), serie):
+                acumulado += cantidad
+                le = limite if limite == "+Inf" else _numero(float(limite))
+                selector = self._selector(valores, f'le="{le}"')
+                yield f"{self.nombre}_bucket{selector} {acumulado}"
+            yield f"{self.nombre}_sum{self._selector(valores)} {_numero(serie[-2])}"
+            yield f"{self.nombre}_count{self._selector(valores)} {serie[-1]}"
+
+class Funcion(_Familia):
+    """Valor leído al exponer: tamaños de colas, checkouts vivos"""
+
+    def __init__(self, nombre, ayuda, funcion, tipo="gauge"):
+        super().__init__(nombre, ayuda)
+        self.funcion = funcion
+        self.tipo = tipo
+
+    def _muestras(self):
+        yield f"{self.nombre} {_numero(self.funcion())}"
+
+class Metricas:
+    """Registro de las métricas del bot.
+
+    Todas se actualizan desde el event loop, así no necesitan locks. Pedir
+    dos veces el mismo nombre devuelve la misma métrica: varios componentes
+    pueden compartir una familia.
+    """
+
+    def __init__(self):
+        self._familias = {}
+
+    def _registrar(self, clase, nombre, *args, **kwargs):
+        familia = self._familias.get(nombre)
+        if familia is None:
+            familia = self._familias[nombre] = clase(nombre, *args, **kwargs)
+        elif not isinstance(familia, clase):
+            raise ValueError(f"La métrica {nombre} ya existe con otro tipo")
+        return familia
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador, nombre, ayuda, etiquetas)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        return self._registrar(Histograma, nombre, ayuda, etiquetas, limites)
+
+    def funcion(self, nombre, ayuda, funcion, tipo="gauge"):
+        return self._registrar(Funcion, nombre, ayuda, funcion, tipo)
+
+    def exponer(self):
+        """Texto de todas las métricas en el formato de Prometheus 0.0.4"""
+        lineas = []
+        for familia in self._familias.values():
+            try:
+                lineas.extend(familia.lineas())
+            except Exception as e:
+                logger.error(f"Error leyendo la métrica {familia.nombre}: {e}")
+        return "\n".join(lineas) + "\n"
+
+# =====================================================
+# LATENCIA DE HANDLERS
+# =====================================================
+def _medir(callback, latencia, errores, handler, estado):
+    @functools.wraps(callback)
+    async def medido(update, context):
+        inicio = time.perf_counter()
+        try:
+            with tramo("handler", handler=handler, estado=estado):
+                return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            errores.sumar(handler, estado)
+            raise
+        finally:
+            latencia.observar(time.perf_counter() - inicio, handler, estado)
+    return medido
+
+def medir_handlers(application, metricas, nombres_estado=None):
+    """Envuelve los callbacks de todos los handlers registrados.
+
+    Cada handler se mide con su nombre y el estado de la conversación en el
+    que está registrado: 'entrada' y 'salida' para entry points y fallbacks,
+    y '-' fuera de una conversación. En los updates muestreados abre además
+    un tramo de traza. Se llama después de registrar todo.
+    """
+    nombres_estado = nombres_estado or {}
+    latencia = metricas.histograma(
+        "gamedin_handler_segundos", "Duración de cada handler", ("handler", "estado")
+    )
+    errores = metricas.contador(
+        "gamedin_handler_errores_total", "Excepciones no controladas en handlers", ("handler", "estado")
+    )
+
+    def envolver(handler, estado):
+        nombre = getattr(handler.callback, "__name__", type(handler).__name__)
+        handler.callback = _medir(handler.callback, latencia, errores, nombre, estado)
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if not isinstance(handler, ConversationHandler):
+                envolver(handler, "-")
+                continue
+            for interno in handler.entry_points:
+                envolver(interno, "entrada")
+            for estado, internos in handler.states.items():
+                for interno in internos:
+                    envolver(interno, nombres_estado.get(estado, str(estado)))
+            for interno in handler.fallbacks:
+                envolver(interno, "salida")
+
+# =====================================================
+# ENDPOINT HTTP
+# =====================================================
+class ServidorMetricas:
+    """Sirve GET /metrics en el mismo event loop que el bot.
+
+    Un servidor HTTP mínimo sobre asyncio: lee la línea de petición y las
+    cabeceras, responde y cierra la conexión. Con `puerto` 0 no se abre.
+    """
+
+    def __init__(self, metricas, host="0.0.0.0", puerto=0, ruta="/metrics", timeout=5):
+        self.metricas = metricas
+        self.host = host
+        self.puerto = puerto
+        self.ruta = ruta
+        self.timeout = timeout
+        self._servidor = None
+
+    async def iniciar(self):
+        if self.puerto and self._servidor is None:
+            self._servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+            logger.info(f"Métricas en http://{self.host}:{self.puerto}{self.ruta}")
+
+    async def detener(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+            self._servidor = None
+
+    async def _atender(self, reader, writer):
+        try:
+            peticion = await asyncio.wait_for(reader.readline(), self.timeout)
+            # Cabeceras: se leen y se descartan
+            while (await asyncio.wait_for(reader.readline(), self.timeout)).strip():
+                pass
+
+            partes = peticion.decode("latin-1").split()
+            if len(partes) < 2:
+                estado, cuerpo = "400 Bad Request", "Petición inválida\n"
+            elif partes[0] not in ("GET", "HEAD"):
+                estado, cuerpo = "405 Method Not Allowed", "Solo GET\n"
+            elif partes[1].split("?")[0] != self.ruta:
+                estado, cuerpo = "404 Not Found", "No encontrado\n"
+            else:
+                estado, cuerpo = "200 OK", self.metricas.exponer()
+
+            datos = cuerpo.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {estado}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(datos)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1")
+            )
+            if partes[:1] != ["HEAD"]:
+                writer.write(datos)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
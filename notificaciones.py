@@ -0,0 +1,135 @@
+# notificaciones.py - Resumen agrupado de pedidos nuevos para el grupo de administradores
+import asyncio
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Límite de Telegram para el texto de un mensaje (en unidades UTF-16)
+MAX_CARACTERES_TELEGRAM = 4096
+
+# El resumen no lleva botones: los estados se cambian desde la cola
+PIE_RESUMEN = "\n👉 Cambia el estado de cada pedido con /admin\\_cola"
+
+def longitud_telegram(texto):
+    """Longitud como la cuenta Telegram: los emojis ocupan dos unidades"""
+    return len(texto.encode("utf-16-le")) // 2
+
+def _recortar(texto, maximo):
+    texto = texto if len(texto) <= maximo else texto[:maximo - 1] + "…"
+    while longitud_telegram(texto) > maximo:
+        texto = texto[:-2] + "…"
+    return texto
+
+# =====================================================
+# RESUMEN DE PEDIDOS
+# =====================================================
+class ResumenPedidos:
+    """Agrupa los pedidos confirmados dentro de una ventana en un solo mensaje.
+
+    El primer pedido abre la ventana; al cerrarse se envía una línea compacta
+    por pedido, el total de la ventana y el acumulado del día. Si el texto supera `max_caracteres` o
+    `max_pedidos` líneas se divide en varias partes, cada una con el
+    acumulado hasta ese punto.
+
+    El resumen no lleva botones de estado por pedido (50 pedidos serían más
+    botones de los que admite un mensaje): su pie remite a /admin_cola, que
+    es desde donde se cambian los estados en este modo.
+
+    `enviar(bot, texto, descripcion, pedidos)` recibe cada mensaje ya armado
+    y los pedido_id que incluye, para marcarlos como notificados al entregarlo.
+    """
+
+    def __init__(self, enviar, ventana=30, max_pedidos=50, max_caracteres=MAX_CARACTERES_TELEGRAM):
+        self._enviar = enviar
+        self.ventana = ventana
+        self.max_pedidos = max(1, max_pedidos)
+        # El margen deja sitio para la cabecera y el pie de cada parte
+        self.max_caracteres = max(500, min(max_caracteres, MAX_CARACTERES_TELEGRAM))
+        self._pedidos = []
+        self._bot = None
+        self._inicio = None
+        self._temporizador = None
+        # Acumulado del día: (fecha, pedidos, monto)
+        self._acumulado = (None, 0, 0)
+
+    def agregar(self, bot, linea, monto, pedido_id=None):
+        """Añade un pedido al resumen en curso"""
+        self._bot = bot
+        if not self._pedidos:
+            self._inicio = datetime.now()
+            self._temporizador = asyncio.get_running_loop().call_later(self.ventana, self.vaciar)
+        self._pedidos.append((linea, monto, pedido_id))
+
+    def vaciar(self):
+        """Envía ya el resumen pendiente, si lo hay"""
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+
+        pedidos, self._pedidos = self._pedidos, []
+        if not pedidos:
+            return
+
+        fin = datetime.now()
+        fecha, acumulado_pedidos, acumulado_monto = self._acumulado
+        if fecha != fin.date():
+            acumulado_pedidos, acumulado_monto = 0, 0
+
+        partes = self.construir_mensajes(pedidos, self._inicio, fin, acumulado_pedidos, acumulado_monto)
+        self._acumulado = (
+            fin.date(),
+            acumulado_pedidos + len(pedidos),
+            acumulado_monto + sum(monto for _, monto, _ in pedidos)
+        )
+        logger.info(f"Resumen de {len(pedidos)} pedidos en {len(partes)} mensajes")
+        for numero, (texto, pedido_ids) in enumerate(partes, 1):
+            self._enviar(
+                self._bot, texto, f"Resumen de {len(pedidos)} pedidos (parte {numero}/{len(partes)})", pedido_ids
+            )
+
+    def construir_mensajes(self, pedidos, inicio, fin, acumulado_pedidos=0, acumulado_monto=0):
+        """Arma los mensajes del resumen respetando el tamaño máximo.
+
+        `pedidos` son ternas (linea, monto, pedido_id). Devuelve pares (texto,
+        pedido_ids) con los pedidos de cada parte; el pie de cada parte lleva
+        el acumulado del día hasta su último pedido.
+        """
+        total_pedidos = len(pedidos)
+        total_monto = sum(monto for _, monto, _ in pedidos)
+        cabecera = (
+            f"🚨 **RESUMEN DE PEDIDOS - GAMEDIN**{{parte}}\n"
+            f"🕒 {inicio.strftime('%H:%M')} – {fin.strftime('%H:%M')} · "
+            f"{total_pedidos} pedidos · ${total_monto:,} MXN\n\n"
+        )
+        # Espacio reservado para " (parte 99/99)" y el pie con el acumulado
+        reservado = longitud_telegram(cabecera) + 20 + longitud_telegram(PIE_RESUMEN) + 60
+        maximo_linea = self.max_caracteres - reservado
+
+        bloques = []
+        actual, ids, largo = [], [], 0
+        for linea, monto, pedido_id in pedidos:
+            linea = _recortar(linea, maximo_linea)
+            largo_linea = longitud_telegram(linea) + 1
+            if actual and (largo + largo_linea > maximo_linea or len(actual) >= self.max_pedidos):
+                bloques.append((actual, ids, acumulado_pedidos, acumulado_monto))
+                actual, ids, largo = [], [], 0
+            actual.append(linea)
+            if pedido_id is not None:
+                ids.append(pedido_id)
+            largo += largo_linea
+            acumulado_pedidos += 1
+            acumulado_monto += monto
+        bloques.append((actual, ids, acumulado_pedidos, acumulado_monto))
+
+        mensajes = []
+        for numero, (lineas, ids, acumulado_pedidos, acumulado_monto) in enumerate(bloques, 1):
+            parte = f" (parte {numero}/{len(bloques)})" if len(bloques) > 1 else ""
+            mensajes.append((
+                cabecera.format(parte=parte)
+                + "\n".join(lineas)
+                + f"\n\n💰 **Acumulado hoy:** {acumulado_pedidos} pedidos · ${acumulado_monto:,} MXN"
+                + PIE_RESUMEN,
+                ids
+            ))
+        return mensajes
@@ -0,0 +1,57 @@
+# perfilador.py - Perfilador estadístico con salida en pilas colapsadas (flamegraph)
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+def _marco(codigo):
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+def perfilar(segundos, hz=100):
+    """Muestrea las pilas de todos los hilos durante `segundos`.
+
+    Cada `1/hz` segundos se lee la pila de cada hilo con
+    sys._current_frames(); no hace falta instrumentar nada y el coste es
+    proporcional a la frecuencia, no a lo que haga el bot. Bloquea el hilo
+    que lo llama: desde el event loop se usa con asyncio.to_thread.
+    Devuelve un Counter de pilas 'hilo;marco;...;marco' → muestras.
+    """
+    propio = threading.get_ident()
+    periodo = 1 / hz
+    nombres = {}
+    pilas = Counter()
+    # Las funciones se repiten en cada muestra: se formatean una vez
+    marcos = {}
+
+    fin = time.perf_counter() + segundos
+    siguiente = time.perf_counter()
+    while siguiente < fin:
+        for hilo_id, frame in sys._current_frames().items():
+            if hilo_id == propio:
+                continue
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                texto = marcos.get(codigo)
+                if texto is None:
+                    texto = marcos[codigo] = _marco(codigo)
+                pila.append(texto)
+                frame = frame.f_back
+            if hilo_id not in nombres:
+                nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+            pila.append(nombres.get(hilo_id, str(hilo_id)))
+            pilas[";".join(reversed(pila))] += 1
+
+        siguiente += periodo
+        espera = siguiente - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        else:
+            # Si una muestra se retrasó no se intenta recuperar el ritmo
+            siguiente = time.perf_counter()
+    return pilas
+
+def pilas_colapsadas(pilas):
+    """Texto 'pila muestras' por línea, el formato de flamegraph.pl y speedscope"""
+    return "".join(f"{pila} {muestras}\n" for pila, muestras in pilas.most_common())
@@ -0,0 +1,200 @@
+# persistencia.py - Persistencia en SQLite de user_data y conversaciones con escritura diferida
+import asyncio
+import json
+import logging
+import pickle
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# PERSISTENCIA
+# =====================================================
+class PersistenciaSQLite(BasePersistence):
+    """Guarda user_data y los estados de los ConversationHandler en SQLite.
+
+    La Application ya sabe qué usuarios cambiaron y cada `update_interval`
+    segundos entrega sus datos. Aquí solo se anotan en memoria (el último
+    valor de cada clave gana) y se escriben en un único commit en el hilo
+    escritor de la base de datos, así ningún handler espera al disco. Lo
+    que llega mientras se escribe un lote sale en el siguiente.
+
+    Una sesión ilegible o con formato anterior se descarta junto con sus
+    estados de conversación: la Application pide los user_data antes que
+    las conversaciones, así ningún usuario vuelve a un paso sin su checkout.
+
+    chat_data, bot_data y callback_data no se usan en el bot y no se guardan.
+    """
+
+    def __init__(self, db, update_interval=5, tipo_user_data=dict):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db = db
+        self.tipo_user_data = tipo_user_data
+
+        # Cambios pendientes de escribir
+        self._sesiones = {}
+        self._conversaciones = {}
+        self._vaciado = None
+        self._escritura = None
+        # Usuarios cuya sesión guardada se descartó al arrancar
+        self._descartados = set()
+
+    # -------------------------------------------------
+    # Escritura diferida
+    # -------------------------------------------------
+    def _programar_vaciado(self):
+        # La Application entrega todos los cambios de una pasada en la misma
+        # vuelta del event loop: con call_soon salen juntos en un solo commit
+        if self._vaciado is None and self._escritura is None:
+            self._vaciado = asyncio.get_running_loop().call_soon(self._despachar)
+
+    def _despachar(self):
+        self._vaciado = None
+        if not self._sesiones and not self._conversaciones:
+            return
+        self._escritura = asyncio.ensure_future(self._escribir_pendientes())
+        self._escritura.add_done_callback(self._fin_escritura)
+
+    def _fin_escritura(self, tarea):
+        self._escritura = None
+        # Si el lote falló se reintenta con el próximo cambio, no en bucle
+        if tarea.result() and (self._sesiones or self._conversaciones):
+            self._programar_vaciado()
+
+    async def _escribir_pendientes(self):
+        sesiones, self._sesiones = self._sesiones, {}
+        conversaciones, self._conversaciones = self._conversaciones, {}
+
+        guardar = [
+            (user_id, pickle.dumps(datos, pickle.HIGHEST_PROTOCOL))
+            for user_id, datos in sesiones.items() if datos
+        ]
+        # Un user_data vacío equivale a no tener sesión
+        borrar = [user_id for user_id, datos in sesiones.items() if not datos]
+        guardar_conversaciones = [
+            (nombre, clave, estado) for (nombre, clave), estado in conversaciones.items() if estado is not None
+        ]
+        borrar_conversaciones = [
+            (nombre, clave) for (nombre, clave), estado in conversaciones.items() if estado is None
+        ]
+
+        try:
+            await self.db.guardar_sesiones(guardar, borrar, guardar_conversaciones, borrar_conversaciones)
+        except Exception as e:
+            logger.error(f"Error guardando {len(sesiones)} sesiones y {len(conversaciones)} conversaciones: {e}")
+            # Se reintentan con el próximo lote salvo que ya haya un valor más nuevo
+            for user_id, datos in sesiones.items():
+                self._sesiones.setdefault(user_id, datos)
+            for clave, estado in conversaciones.items():
+                self._conversaciones.setdefault(clave, estado)
+            return False
+        return True
+
+    async def flush(self):
+        """Escribe todo lo pendiente; la Application lo llama al detenerse"""
+        if self._vaciado is not None:
+            self._vaciado.cancel()
+            self._vaciado = None
+        if self._escritura is not None:
+            await asyncio.shield(self._escritura)
+        if self._sesiones or self._conversaciones:
+            self._despachar()
+            if not await asyncio.shield(self._escritura):
+                logger.error("Sesiones sin guardar al detener el bot")
+                return
+        logger.info("Sesiones guardadas en la base de datos")
+
+    # -------------------------------------------------
+    # user_data
+    # -------------------------------------------------
+    async def get_user_data(self):
+        user_data = {}
+        for user_id, datos in await self.db.cargar_sesiones():
+            try:
+                datos = pickle.loads(datos)
+            except Exception as e:
+                logger.warning(f"Sesión del usuario {user_id} ilegible, se descarta: {e}")
+                self._descartar(user_id)
+                continue
+            if not isinstance(datos, self.tipo_user_data):
+                logger.warning(f"Sesión del usuario {user_id} con formato anterior, se descarta")
+                self._descartar(user_id)
+                continue
+            user_data[user_id] = datos
+        logger.info(f"{len(user_data)} sesiones de usuario restauradas")
+        return user_data
+
+    def _descartar(self, user_id):
+        """Borra la sesión guardada; sus conversaciones se borran al leerlas"""
+        self._descartados.add(user_id)
+        self._sesiones[user_id] = None
+        self._programar_vaciado()
+
+    async def update_user_data(self, user_id, data):
+        self._sesiones[user_id] = data
+        self._programar_vaciado()
+
+    async def drop_user_data(self, user_id):
+        self._sesiones[user_id] = None
+        self._programar_vaciado()
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    # -------------------------------------------------
+    # Conversaciones
+    # -------------------------------------------------
+    async def get_conversations(self, name):
+        conversaciones = {}
+        descartadas = 0
+        for clave, estado in await self.db.cargar_conversaciones(name):
+            clave_tupla = tuple(json.loads(clave))
+            # El usuario es el último elemento de la clave (chat, usuario)
+            if clave_tupla and clave_tupla[-1] in self._descartados:
+                self._conversaciones[(name, clave)] = None
+                descartadas += 1
+                continue
+            conversaciones[clave_tupla] = estado
+
+        if descartadas:
+            logger.warning(f"{descartadas} conversaciones de {name} sin sesión válida, se descartan")
+            self._programar_vaciado()
+        return conversaciones
+
+    async def update_conversation(self, name, key, new_state):
+        self._conversaciones[(name, json.dumps(key))] = new_state
+        self._programar_vaciado()
+
+    # -------------------------------------------------
+    # Datos que el bot no usa
+    # -------------------------------------------------
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
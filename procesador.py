@@ -0,0 +1,102 @@
+# procesador.py - Procesamiento concurrente de updates con orden por usuario
+import asyncio
+import logging
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metricas import Metricas
+from trazas import Trazador
+
+logger = logging.getLogger(__name__)
+
+SIN_LIMITE = 2 ** 31 - 1
+
+# =====================================================
+# PROCESADOR DE UPDATES
+# =====================================================
+class ProcesadorPorUsuario(BaseUpdateProcessor):
+    """Procesa updates de distintos usuarios en paralelo.
+
+    Los updates de un mismo usuario pasan por el mismo lock (elegido por
+    user_id entre un número fijo de shards) y se atienden en orden de
+    llegada, así las transiciones del ConversationHandler nunca se invierten.
+    La memoria usada no crece con el número de usuarios.
+
+    En `metricas` se registra cuánto espera cada update su turno y cuánto
+    tarda en procesarse una vez lo tiene. Los updates que `trazador`
+    muestrea abren aquí su traza, desde la llegada hasta el final.
+    """
+
+    def __init__(self, max_concurrent_updates, shards=256, metricas=None, trazador=None):
+        # El semáforo de la clase base se toma antes del lock del usuario: los
+        # updates que esperan su turno ocuparían cupos de trabajo. Por eso la
+        # base no limita y el límite real se aplica después del lock.
+        super().__init__(SIN_LIMITE)
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates debe ser mayor que 0")
+        self.limite = max_concurrent_updates
+        self._trabajando = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = tuple(asyncio.Lock() for _ in range(max(1, shards)))
+        self.trazador = trazador or Trazador()
+
+        metricas = metricas or Metricas()
+        self._espera = metricas.histograma(
+            "gamedin_update_espera_segundos", "Espera de cada update por su usuario y un cupo libre"
+        )
+        self._duracion = metricas.histograma(
+            "gamedin_update_segundos", "Duración del procesamiento de cada update"
+        )
+
+    @staticmethod
+    def _clave(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    def bloqueo(self, clave):
+        """Lock que serializa los updates del usuario `clave`"""
+        return self._locks[clave % len(self._locks)]
+
+    async def _procesar(self, coroutine, llegada):
+        inicio = time.perf_counter()
+        self._espera.observar(inicio - llegada)
+        try:
+            await coroutine
+        finally:
+            self._duracion.observar(time.perf_counter() - inicio)
+
+    @staticmethod
+    def _tipo(update):
+        if isinstance(update, Update):
+            if update.callback_query:
+                return "callback"
+            if update.message:
+                return "mensaje"
+        return type(update).__name__
+
+    async def do_process_update(self, update, coroutine):
+        llegada = time.perf_counter()
+        clave = self._clave(update)
+        with self.trazador.traza("update", usuario=clave, tipo=self._tipo(update)):
+            if clave is None:
+                async with self._trabajando:
+                    await self._procesar(coroutine, llegada)
+                return
+
+            async with self.bloqueo(clave):
+                async with self._trabajando:
+                    await self._procesar(coroutine, llegada)
+
+    async def initialize(self):
+        logger.info(
+            f"Procesando hasta {self.limite} updates en paralelo "
+            f"({len(self._locks)} shards por usuario)"
+        )
+
+    async def shutdown(self):
+        pass
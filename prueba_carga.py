@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de carga del flujo de compra contra la Bot API falsa.
+
+Lleva N clientes sintéticos por la conversación completa (producto →
+cantidad → ID → nombre → contacto → confirmar) y mide, para cada paso, el
+tiempo desde que Telegram entrega el update hasta que recibe la respuesta
+del bot. Al terminar informa el rendimiento, los percentiles por paso y los
+pedidos que quedaron guardados en la base de datos. No necesita red: sirve
+en CI y termina con código 1 si algún flujo o pedido se perdió.
+
+La Bot API falsa y los clientes corren en el mismo proceso y event loop
+que el bot y le quitan CPU: las cifras son una cota inferior de lo que
+aguanta el bot solo. Sirven para comparar cambios entre sí.
+
+Uso:
+    python prueba_carga.py --usuarios 500 --concurrencia 100
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from fake_bot_api import FakeBotAPI, arrancar_updater, percentil
+
+# Sin estos valores el planificador aplicaría los límites reales de
+# Telegram y la prueba mediría solo sus esperas; el límite global de
+# updates descartaría parte de la carga. El límite por usuario se mantiene:
+# un cliente sintético no pasa de su ráfaga. Se respetan si ya vienen en el
+# entorno.
+ENTORNO_CARGA = {
+    "ENVIOS_GLOBAL_POR_SEG": "1000000",
+    "ENVIOS_CHAT_POR_SEG": "1000000",
+    "ENVIOS_GRUPO_POR_MIN": "1000000000",
+    "FLOOD_GLOBAL_POR_SEG": "1000000",
+}
+
+# Pasos del flujo, con el nombre del handler que atiende cada uno
+PASOS = (
+    "iniciar_pedido", "seleccionar_producto", "seleccionar_cantidad",
+    "ingresar_id", "ingresar_nombre", "ingresar_contacto", "confirmar_pedido",
+)
+
+# =====================================================
+# CLIENTES SINTÉTICOS
+# =====================================================
+def _updates_cliente(api, user_id, sku):
+    """Fábricas de los updates de un cliente, en el orden de PASOS"""
+    return (
+        lambda: api.callback(user_id, "hacer_pedido"),
+        lambda: api.callback(user_id, f"producto_{sku.producto}"),
+        lambda: api.callback(user_id, sku.callback),
+        lambda: api.mensaje(user_id, str(10_000_000 + user_id)),
+        lambda: api.mensaje(user_id, f"Cliente {user_id}"),
+        lambda: api.mensaje(user_id, f"+52 55 {user_id:08d}"),
+        lambda: api.callback(user_id, "confirmar_si"),
+    )
+
+async def _cliente(api, user_id, sku, latencias, fallos, timeout):
+    """Recorre el flujo completo; devuelve True si el pedido se confirmó"""
+    for paso, crear_update in zip(PASOS, _updates_cliente(api, user_id, sku)):
+        respuesta = api.esperar_respuesta(user_id)
+        inicio = time.perf_counter()
+        await api.enviar_update(crear_update())
+        try:
+            mensaje = await asyncio.wait_for(respuesta, timeout)
+        except asyncio.TimeoutError:
+            fallos[paso] = fallos.get(paso, 0) + 1
+            return False
+        latencias[paso].append((time.perf_counter() - inicio) * 1000)
+
+    if "PEDIDO CONFIRMADO" not in mensaje.get("text", ""):
+        fallos["confirmar_pedido"] = fallos.get("confirmar_pedido", 0) + 1
+        return False
+    return True
+
+# =====================================================
+# PRUEBA DE CARGA
+# =====================================================
+async def prueba_carga(usuarios, concurrencia, modo="polling", puerto_api=8081,
+                       puerto_webhook=8444, timeout=30, semilla=1, logs=False):
+    """Ejecuta la prueba y devuelve True si todos los pedidos se guardaron"""
+    api = FakeBotAPI(port=puerto_api)
+    await api.iniciar()
+
+    # La configuración se lee al importar main, así que se fija antes. La
+    # base de datos es siempre una nueva: nunca se toca la del bot.
+    ruta_db = os.path.join(tempfile.mkdtemp(prefix="gamedin-carga-"), "carga.db")
+    os.environ["BOT_API_URL"] = api.base_url
+    os.environ["DB_NAME"] = ruta_db
+    for variable, valor in ENTORNO_CARGA.items():
+        os.environ.setdefault(variable, valor)
+    if not logs:
+        # Una línea por pedido taparía el informe; configurado antes, el
+        # basicConfig de main no cambia nada
+        logging.basicConfig(level=logging.WARNING)
+    import main
+
+    azar = random.Random(semilla)
+    skus = [sku for producto in main.catalogo.actual.productos.values() for sku in producto.skus]
+    latencias = {paso: [] for paso in PASOS}
+    fallos = {}
+    cupos = asyncio.Semaphore(concurrencia)
+
+    async def cliente(user_id, sku):
+        async with cupos:
+            return await _cliente(api, user_id, sku, latencias, fallos, timeout)
+
+    application = main.crear_aplicacion()
+    async with application:
+        # start() no llama a post_init: los recursos se arrancan a mano
+        await main.iniciar_recursos(application)
+        await arrancar_updater(application, modo, puerto_webhook)
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(
+            cliente(100_000 + i, azar.choice(skus)) for i in range(usuarios)
+        ))
+        duracion = time.perf_counter() - inicio
+
+        await application.updater.stop()
+        await application.stop()
+        await main.detener_recursos(application)
+    await main.cerrar_recursos(application)
+    await api.detener()
+
+    # Se cuenta con una conexión nueva una vez cerrado el bot: lo que haya
+    # aquí sobrevivió a la parada
+    conexion = sqlite3.connect(ruta_db)
+    try:
+        guardados = conexion.execute("SELECT COUNT(*) FROM pedidos").fetchone()[0]
+    finally:
+        conexion.close()
+
+    completos = sum(resultados)
+    print(f"modo={modo} usuarios={usuarios} concurrencia={concurrencia}")
+    print(
+        f"flujos completos: {completos}/{usuarios} en {duracion:.2f}s · "
+        f"{completos / duracion:.1f} pedidos/s · "
+        f"{sum(map(len, latencias.values())) / duracion:.1f} updates/s"
+    )
+    print(f"{'paso':22} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'máx':>8}  (ms)")
+    for paso in PASOS:
+        valores = latencias[paso]
+        if not valores:
+            print(f"{paso:22} {0:>6}")
+            continue
+        print(
+            f"{paso:22} {len(valores):>6} {percentil(valores, 50):>8.2f} {percentil(valores, 95):>8.2f} "
+            f"{percentil(valores, 99):>8.2f} {max(valores):>8.2f}"
+        )
+    if fallos:
+        print("fallos por paso: " + ", ".join(f"{paso}={n}" for paso, n in fallos.items()))
+    print(f"pedidos guardados: {guardados} (confirmados: {completos})")
+
+    return completos == usuarios and guardados == completos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prueba de carga del flujo de compra sin conexión")
+    parser.add_argument("--usuarios", type=int, default=200, help="clientes sintéticos")
+    parser.add_argument("--concurrencia", type=int, default=0, help="clientes a la vez (0 = todos)")
+    parser.add_argument("--modo", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--port", type=int, default=8081, help="puerto de la Bot API falsa")
+    parser.add_argument("--timeout", type=float, default=30, help="segundos de espera por respuesta")
+    parser.add_argument("--semilla", type=int, default=1, help="semilla para elegir productos")
+    parser.add_argument("--logs", action="store_true", help="mostrar el log INFO del bot")
+    args = parser.parse_args()
+
+    correcto = asyncio.run(prueba_carga(
+        args.usuarios,
+        args.concurrencia or args.usuarios,
+        modo=args.modo,
+        puerto_api=args.port,
+        timeout=args.timeout,
+        semilla=args.semilla,
+        logs=args.logs
+    ))
+    sys.exit(0 if correcto else 1)
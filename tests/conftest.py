@@ -0,0 +1,67 @@
+# conftest.py - Entorno común de las pruebas
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# main lee la configuración al importarse: se fija antes de cualquier
+# prueba. La base de datos es siempre nueva y la Bot API es la falsa de
+# fake_bot_api en PUERTO_API_PRUEBAS; nada sale a la red.
+PUERTO_API_PRUEBAS = 8181
+os.environ.update({
+    "BOT_API_URL": f"http://127.0.0.1:{PUERTO_API_PRUEBAS}/bot",
+    "DB_NAME": os.path.join(tempfile.mkdtemp(prefix="gamedin-pruebas-"), "pruebas.db"),
+    "CATALOGO_PATH": os.path.join(RAIZ, "productos.json"),
+    "ENVIOS_GLOBAL_POR_SEG": "100000",
+    "ENVIOS_CHAT_POR_SEG": "1000",
+    "ENVIOS_GRUPO_POR_MIN": "1000000",
+    "FLOOD_RAFAGA": "1000",
+    "FLOOD_GLOBAL_POR_SEG": "1000000",
+    "METRICAS_PUERTO": "0",
+    "TRAZAS_MUESTREO": "0",
+})
+
+@pytest.fixture(scope="session")
+def bucle():
+    """Event loop de toda la sesión: los objetos de main se atan al primero que los usa"""
+    bucle = asyncio.new_event_loop()
+    yield bucle
+    bucle.close()
+
+@pytest.fixture(scope="session")
+def bot(bucle):
+    """Bot completo recibiendo por polling los updates de la Bot API falsa.
+
+    Devuelve un registro con `api`, `main` y `application`. Cada prueba usa
+    sus propios user_id: el límite de updates es por usuario.
+    """
+    from fake_bot_api import FakeBotAPI, arrancar_updater
+    import main
+
+    api = FakeBotAPI(port=PUERTO_API_PRUEBAS)
+    application = main.crear_aplicacion()
+
+    async def arrancar():
+        await api.iniciar()
+        await application.initialize()
+        # start() no llama a post_init: los recursos se arrancan a mano
+        await main.iniciar_recursos(application)
+        await arrancar_updater(application, "polling")
+
+    async def detener():
+        await application.updater.stop()
+        await application.stop()
+        await main.detener_recursos(application)
+        await application.shutdown()
+        await main.cerrar_recursos(application)
+        await api.detener()
+
+    bucle.run_until_complete(arrancar())
+    yield SimpleNamespace(api=api, main=main, application=application)
+    bucle.run_until_complete(detener())
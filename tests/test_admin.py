@@ -0,0 +1,26 @@
+# test_admin.py - Botones de administración sobre mensajes que ya no están
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+@pytest.mark.parametrize("handler, data", [
+    ("cambiar_estado_pedido", "est:1:pendiente:pagado"),
+    ("admin_cola_pagina", "cola:pendiente"),
+])
+def test_boton_sin_mensaje_solo_responde(handler, data):
+    """Sin query.message no se comprueba el chat ni se edita nada: solo se responde"""
+    import main
+
+    respuestas = []
+
+    async def answer(*args, **kwargs):
+        respuestas.append((args, kwargs))
+
+    usuario = SimpleNamespace(id=int(main.ADMIN_ID), first_name="Admin", username="admin")
+    consulta = SimpleNamespace(data=data, answer=answer, message=None, from_user=usuario)
+
+    asyncio.run(getattr(main, handler)(SimpleNamespace(callback_query=consulta), None))
+
+    assert len(respuestas) == 1
+    assert respuestas[0][1] == {"show_alert": True}
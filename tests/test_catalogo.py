@@ -0,0 +1,50 @@
+# test_catalogo.py - Validación y recarga en caliente del catálogo
+import json
+import os
+
+import pytest
+
+from catalogo import CatalogoRecargable
+
+PRODUCTO = {
+    "nombre": "Diamantes",
+    "descripcion": "Diamantes de Free Fire",
+    "cantidades": {"100": {"cantidad": "100", "precio": 50}},
+}
+
+def _escribir(ruta, datos, mtime):
+    ruta.write_text(json.dumps(datos), encoding="utf-8")
+    # Un mtime distinto en cada escritura, aunque caigan en el mismo tick
+    os.utime(ruta, ns=(mtime, mtime))
+
+@pytest.mark.parametrize("datos", [
+    [PRODUCTO],
+    {"diamantes": [PRODUCTO]},
+    {"diamantes": dict(PRODUCTO, cantidades=[{"cantidad": "100", "precio": 50}])},
+    {"diamantes": dict(PRODUCTO, cantidades={"100": {"cantidad": "100", "precio": None}})},
+    {"d" * 60: PRODUCTO},
+    {"diamantes": dict(PRODUCTO, cantidades={"1" * 50: {"cantidad": "100", "precio": 50}})},
+], ids=["lista", "producto_lista", "cantidades_lista", "precio_nulo", "clave_larga", "sku_largo"])
+def test_catalogo_invalido_conserva_el_anterior(tmp_path, datos):
+    ruta = tmp_path / "productos.json"
+    _escribir(ruta, {"diamantes": PRODUCTO}, 1_000_000_000)
+    catalogo = CatalogoRecargable(str(ruta))
+    anterior = catalogo.actual
+
+    _escribir(ruta, datos, 2_000_000_000)
+
+    assert catalogo.recargar_si_cambio() is False
+    assert catalogo.actual is anterior
+
+def test_ruta_por_defecto_no_depende_del_directorio(tmp_path, monkeypatch):
+    import importlib
+    import config
+
+    monkeypatch.delenv("CATALOGO_PATH", raising=False)
+    monkeypatch.chdir(tmp_path)
+    try:
+        recargado = importlib.reload(config)
+        assert CatalogoRecargable(recargado.CATALOGO_PATH).actual.productos
+    finally:
+        monkeypatch.undo()
+        importlib.reload(config)
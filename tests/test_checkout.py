@@ -0,0 +1,82 @@
+# test_checkout.py - Transiciones del checkout y reintentos tras un envío fallido
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+from checkout import Checkout, CONFIRMAR_PEDIDO, INGRESAR_CONTACTO, INGRESAR_NOMBRE, SELECCIONAR_PRODUCTO
+
+def _checkout_en_nombre():
+    import main
+
+    checkout = Checkout()
+    checkout.iniciar()
+    checkout.elegir_producto()
+    checkout.elegir_sku(next(iter(main.catalogo.actual.productos.values())).skus[0])
+    checkout.ingresar_id("12345678")
+    return checkout
+
+def _mensaje(texto, respuestas):
+    async def reply_text(texto_respuesta, **kwargs):
+        resultado = respuestas.pop(0)
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+    return SimpleNamespace(text=texto, reply_text=reply_text)
+
+def _update(texto, respuestas):
+    return SimpleNamespace(message=_mensaje(texto, respuestas))
+
+def _pulsacion(data, respuestas):
+    async def answer(*args, **kwargs):
+        pass
+    usuario = SimpleNamespace(id=1, first_name="Ana")
+    consulta = SimpleNamespace(data=data, answer=answer, message=_mensaje("...", respuestas), from_user=usuario)
+    return SimpleNamespace(callback_query=consulta)
+
+def test_transicion_invalida():
+    checkout = Checkout()
+    with pytest.raises(ValueError):
+        checkout.ingresar_nombre("Ana")
+    assert checkout.iniciar() == SELECCIONAR_PRODUCTO
+
+def test_repetir_paso_sobrescribe():
+    checkout = _checkout_en_nombre()
+    assert checkout.ingresar_nombre("Ana") == INGRESAR_CONTACTO
+    assert checkout.ingresar_nombre("Ana María") == INGRESAR_CONTACTO
+    assert checkout.nombre == "Ana María"
+
+def test_respuesta_fallida_no_avanza_el_checkout():
+    """Si Telegram rechaza la respuesta, el usuario puede reintentar el paso"""
+    import main
+
+    checkout = _checkout_en_nombre()
+    context = SimpleNamespace(user_data=checkout)
+    respuestas = [BadRequest("Can't parse entities"), None]
+
+    with pytest.raises(BadRequest):
+        asyncio.run(main.ingresar_nombre(_update("Juan_Perez", respuestas), context))
+    assert checkout.paso == INGRESAR_NOMBRE
+
+    paso = asyncio.run(main.ingresar_nombre(_update("Juan_Perez", respuestas), context))
+    assert paso == INGRESAR_CONTACTO
+    assert checkout.nombre == "Juan_Perez"
+
+@pytest.mark.parametrize("handler, data", [("iniciar_pedido", "hacer_pedido"), ("modificar_pedido", "modificar_pedido")])
+def test_reinicio_fallido_conserva_la_compra(handler, data):
+    """Volver a elegir producto desde el resumen no toca el checkout si la respuesta falla"""
+    import main
+
+    checkout = _checkout_en_nombre()
+    checkout.ingresar_nombre("Ana")
+    checkout.ingresar_contacto("+52 55 1234 5678")
+    sku, clave = checkout.sku, checkout.clave
+    context = SimpleNamespace(user_data=checkout)
+
+    with pytest.raises(BadRequest):
+        asyncio.run(getattr(main, handler)(_pulsacion(data, [BadRequest("Message to reply not found")]), context))
+    assert (checkout.paso, checkout.sku, checkout.clave) == (CONFIRMAR_PEDIDO, sku, clave)
+
+    assert asyncio.run(getattr(main, handler)(_pulsacion(data, [None]), context)) == SELECCIONAR_PRODUCTO
+    assert checkout.sku is None
@@ -0,0 +1,245 @@
+# test_database.py - Hilos de la base de datos frente al event loop
+import asyncio
+import threading
+import time
+
+import pytest
+
+from database import ahora_ms
+
+# Cota holgada: la respuesta real tarda milisegundos, la escritura bloqueada
+# dura hasta que la prueba la suelta
+LIMITE_SEG = 1.0
+
+def test_escritura_lenta_no_retrasa_start(bot, bucle):
+    api, main = bot.api, bot.main
+    user_id = 7101
+    liberar = threading.Event()
+
+    async def probar():
+        # Un fsync eterno: el hilo escritor queda ocupado hasta liberar
+        main.db._escritor.submit(liberar.wait, 30)
+        pedido = asyncio.ensure_future(main.db.guardar_pedido(
+            (user_id, "cliente", "diamantes", "100", "12345678", "Cliente", "+52 55 0", 50, ahora_ms(), None)
+        ))
+        try:
+            inicio = time.perf_counter()
+            respuesta = api.esperar_respuesta(user_id)
+            await api.enviar_update(api.mensaje(user_id, "/start"))
+            bienvenida = await asyncio.wait_for(respuesta, LIMITE_SEG)
+            latencia_start = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            await asyncio.wait_for(main.db.obtener_pedidos(1), LIMITE_SEG)
+            latencia_lectura = time.perf_counter() - inicio
+
+            assert not pedido.done()
+        finally:
+            liberar.set()
+        pedido_id, nuevo = await asyncio.wait_for(pedido, 5)
+        return bienvenida, latencia_start, latencia_lectura, pedido_id, nuevo
+
+    bienvenida, latencia_start, latencia_lectura, pedido_id, nuevo = bucle.run_until_complete(probar())
+
+    assert "Hola" in bienvenida["text"]
+    assert latencia_start < LIMITE_SEG
+    assert latencia_lectura < LIMITE_SEG
+    assert nuevo and pedido_id > 0
+
+def _base_original(ruta, pedidos):
+    """Base con el esquema de la versión original del bot, sin migraciones"""
+    import sqlite3
+
+    conn = sqlite3.connect(ruta)
+    conn.execute('''
+        CREATE TABLE pedidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            producto TEXT,
+            cantidad TEXT,
+            id_juego TEXT,
+            nombre_cliente TEXT,
+            contacto_cliente TEXT,
+            precio INTEGER,
+            fecha DATETIME,
+            estado TEXT DEFAULT 'pendiente'
+        )
+    ''')
+    conn.executemany(
+        "INSERT INTO pedidos (user_id, username, producto, cantidad, id_juego, nombre_cliente, "
+        "contacto_cliente, precio, fecha) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", pedidos
+    )
+    conn.commit()
+    conn.close()
+
+def test_migraciones_actualizan_base_sin_indices(tmp_path):
+    """Una base creada por la versión original del bot se actualiza en su sitio"""
+    import sqlite3
+    from database import DatabaseManager, MIGRACIONES, a_epoch_ms
+
+    ruta = str(tmp_path / "original.db")
+    # Las fechas eran el texto que sqlite3 guarda para un datetime local
+    pedidos = [
+        (1, "ana", "diamantes", "100", "12345678", "Ana", "+52 1", 50, "2024-03-01 10:15:00.000000"),
+        (2, "luis", "diamantes", "1,080", "23456789", "Luis", "+52 2", 400, "2024-03-01 18:40:12.345678"),
+        (3, "eva", "pase", "Pase Élite", "34567890", "Eva", "+52 3", 200, "2024-03-02 09:00:00.000000"),
+    ]
+    _base_original(ruta, pedidos)
+
+    async def abrir_y_cerrar():
+        await DatabaseManager(ruta).cerrar()
+
+    asyncio.run(abrir_y_cerrar())
+    # Abrirla otra vez no vuelve a aplicar nada
+    asyncio.run(abrir_y_cerrar())
+
+    conn = sqlite3.connect(ruta)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == MIGRACIONES[-1][0]
+
+        indices = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {
+            "idx_pedidos_fecha", "idx_pedidos_estado_fecha", "idx_pedidos_producto_fecha",
+            "idx_pedidos_user_id_fecha", "idx_pedidos_username_fecha", "idx_pedidos_clave_idempotencia",
+        } <= indices
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM pedidos ORDER BY fecha DESC LIMIT 10").fetchall()
+        assert "idx_pedidos_fecha" in plan[0][3]
+
+        filas = conn.execute(
+            "SELECT user_id, username, producto, cantidad, id_juego, nombre_cliente, contacto_cliente, "
+            "precio, fecha, estado FROM pedidos ORDER BY id"
+        ).fetchall()
+        assert filas == [pedido[:8] + (a_epoch_ms(pedido[8]), "pendiente") for pedido in pedidos]
+
+        assert sorted(conn.execute("SELECT * FROM ventas_por_producto")) == [("diamantes", 2, 450), ("pase", 1, 200)]
+        assert conn.execute("SELECT SUM(unidades) FROM ventas_por_dia").fetchone()[0] == 100 + 1080 + 1
+    finally:
+        conn.close()
+
+def test_migracion_de_fechas_falla_con_fechas_ilegibles(tmp_path):
+    """Una fecha ilegible detiene la migración sin dejar la columna a medias"""
+    import sqlite3
+    from database import DatabaseManager
+
+    ruta = str(tmp_path / "ilegible.db")
+    _base_original(ruta, [
+        (1, "ana", "diamantes", "100", "12345678", "Ana", "+52 1", 50, "2024-03-01 10:15:00.000000"),
+        (2, "luis", "diamantes", "100", "23456789", "Luis", "+52 2", 50, "ayer por la tarde"),
+        (3, "eva", "pase", "Pase Élite", "34567890", "Eva", "+52 3", 200, "01/03/2024"),
+    ])
+
+    with pytest.raises(ValueError, match="2 pedidos con fecha ilegible.*#2, #3"):
+        DatabaseManager(ruta)
+
+    conn = sqlite3.connect(ruta)
+    try:
+        # Las migraciones anteriores quedan; la de fechas no tocó ninguna fila
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 7
+        assert conn.execute("SELECT DISTINCT typeof(fecha) FROM pedidos").fetchall() == [("text",)]
+    finally:
+        conn.close()
+
+def test_pedido_solo_se_confirma_sin_esperar_lote(tmp_path):
+    """Sin nada escribiéndose un pedido va directo; los que llegan mientras tanto se agrupan"""
+    from database import DatabaseManager
+
+    def pedido(i):
+        return (7300 + i, "cliente", "diamantes", "100", "12345678", "Cliente", "+52 55 0", 50, ahora_ms(), None)
+
+    async def guardar():
+        db = DatabaseManager(str(tmp_path / "lotes.db"))
+        lotes = []
+        guardar_lote = db._guardar_lote
+        db._guardar_lote = lambda lote: lotes.append(len(lote)) or guardar_lote(lote)
+        try:
+            solo = await db.guardar_pedido(pedido(0))
+            rafaga = await asyncio.gather(*(db.guardar_pedido(pedido(i)) for i in range(1, 51)))
+            return solo, rafaga, lotes, db._lotes_en_curso
+        finally:
+            await db.cerrar()
+
+    solo, rafaga, lotes, en_curso = asyncio.run(guardar())
+
+    assert solo == (1, True)
+    assert sorted(pedido_id for pedido_id, _ in rafaga) == list(range(2, 52))
+    # El primero de la ráfaga sale solo y el resto en un único commit detrás
+    assert lotes == [1, 1, 49]
+    assert not en_curso
+
+def test_pedido_repetido_devuelve_el_original(tmp_path):
+    """Una clave repetida se resuelve en memoria, en el índice único y tras reiniciar"""
+    from database import DatabaseManager
+
+    ruta = str(tmp_path / "idempotencia.db")
+    pedido = (7400, "cliente", "diamantes", "100", "12345678", "Cliente", "+52 55 0", 50, ahora_ms(), 123456)
+    # La clave es única por usuario: otro cliente con la misma es otro pedido
+    de_otro = (7401,) + pedido[1:]
+
+    async def guardar():
+        db = DatabaseManager(ruta)
+        lotes = []
+        guardar_lote = db._guardar_lote
+        db._guardar_lote = lambda lote: lotes.append(len(lote)) or guardar_lote(lote)
+        try:
+            primero = await db.guardar_pedido(pedido)
+            memoria = await db.guardar_pedido(pedido)
+            escrituras_memoria = len(lotes)
+            # Clave olvidada en memoria: la detiene el índice único
+            db._claves.clear()
+            indice = await db.guardar_pedido(pedido)
+            otro = await db.guardar_pedido(de_otro)
+        finally:
+            await db.cerrar()
+
+        # Un proceso nuevo sobre el mismo archivo no recuerda nada en memoria
+        db = DatabaseManager(ruta)
+        try:
+            reinicio = await db.guardar_pedido(pedido)
+            ventas = await db.obtener_estadisticas()
+        finally:
+            await db.cerrar()
+        return primero, memoria, escrituras_memoria, indice, otro, reinicio, ventas
+
+    primero, memoria, escrituras_memoria, indice, otro, reinicio, ventas = asyncio.run(guardar())
+
+    assert primero == (1, True)
+    assert memoria == (1, False)
+    assert escrituras_memoria == 1
+    assert indice == (1, False)
+    assert otro[0] != 1 and otro[1]
+    assert reinicio == (1, False)
+    # Las repeticiones no suman ventas
+    assert ventas[0] == 2
+
+def test_pedidos_sin_notificar_sobreviven_al_reinicio(tmp_path):
+    """Un pedido cuyo aviso al grupo no se marcó sigue pendiente al reabrir la base"""
+    from database import DatabaseManager
+
+    ruta = str(tmp_path / "notificados.db")
+
+    def pedido(i):
+        return (7500 + i, "cliente", "diamantes", "100", "12345678", "Cliente", "+52 55 0", 50, ahora_ms(), None)
+
+    async def guardar():
+        db = DatabaseManager(ruta)
+        try:
+            for i in range(3):
+                await db.guardar_pedido(pedido(i))
+            await db.marcar_notificados([2])
+        finally:
+            await db.cerrar()
+
+        db = DatabaseManager(ruta)
+        try:
+            pendientes = await db.obtener_pedidos_sin_notificar()
+            await db.marcar_notificados([pedido_id for pedido_id, *_ in pendientes])
+            return pendientes, await db.obtener_pedidos_sin_notificar()
+        finally:
+            await db.cerrar()
+
+    pendientes, despues = asyncio.run(guardar())
+
+    assert [fila[0] for fila in pendientes] == [1, 3]
+    assert pendientes[0][1:9] == pedido(0)[:8]
+    assert despues == []
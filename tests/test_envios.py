@@ -0,0 +1,106 @@
+# test_envios.py - Planificador de envíos frente a los límites de Telegram
+import asyncio
+
+from telegram.ext import ExtBot
+
+from envios import Cubeta, CubetasRecientes, PlanificadorEnvios, PRIORIDAD_ADMIN, PRIORIDAD_CLIENTE
+from fake_bot_api import FakeBotAPI
+
+PUERTO_API_LIMITADA = 8182
+CHAT_INUNDADO = 7201
+
+def test_cubetas_recientes_descartan_la_mas_inactiva():
+    creadas = []
+    cubetas = CubetasRecientes(lambda clave: creadas.append(clave) or Cubeta(1, 3), maximo=2)
+
+    primera = cubetas.obtener(1)
+    cubetas.obtener(2)
+    assert cubetas.obtener(1) is primera
+    cubetas.obtener(3)
+
+    # La 2 era la menos usada: se descartó y vuelve a crearse llena
+    assert len(cubetas) == 2
+    assert cubetas.obtener(1) is primera
+    cubetas.obtener(2)
+    assert creadas == [1, 2, 3, 2]
+
+def test_inundacion_sin_429_y_clientes_primero():
+    """Una inundación de un chat y del límite global no provoca ningún 429
+    y las respuestas a clientes adelantan al tráfico masivo en cola"""
+    # La Bot API falsa rechaza por encima de estos límites; el planificador
+    # va por debajo, con ráfagas de 3 por chat y de un segundo en global
+    api = FakeBotAPI(port=PUERTO_API_LIMITADA, global_por_seg=120, chat_por_seg=20)
+    planificador = PlanificadorEnvios(global_por_seg=50, chat_por_seg=10, max_reintentos=0)
+    bot = ExtBot("1:prueba", base_url=api.base_url, rate_limiter=planificador)
+
+    async def enviar(chat_id, texto, prioridad):
+        await bot.send_message(chat_id, texto, rate_limit_args={"prioridad": prioridad})
+
+    async def inundar():
+        await api.iniciar()
+        try:
+            async with bot:
+                masivos = [enviar(CHAT_INUNDADO, f"masivo {i}", PRIORIDAD_ADMIN) for i in range(30)]
+                masivos += [enviar(8000 + i, "masivo", PRIORIDAD_ADMIN) for i in range(150)]
+                masivos = [asyncio.ensure_future(envio) for envio in masivos]
+                await asyncio.sleep(0.5)
+
+                marca = len(api.enviados)
+                clientes = [enviar(CHAT_INUNDADO, f"cliente {i}", PRIORIDAD_CLIENTE) for i in range(5)]
+                clientes += [enviar(9000 + i, "cliente", PRIORIDAD_CLIENTE) for i in range(20)]
+                await asyncio.wait_for(asyncio.gather(*clientes, *masivos), 10)
+                return marca
+        finally:
+            await api.detener()
+
+    marca = asyncio.run(inundar())
+
+    assert api.rechazados == []
+    assert len(api.enviados) == 30 + 150 + 5 + 20
+
+    # Tras la marca aún quedaba tráfico masivo en cola y las respuestas a
+    # clientes salen antes; como mucho se cuela un envío que ya tenía turno
+    despues = [params for _, params in api.enviados[marca:]]
+    del_chat = [params["text"] for params in despues if int(params["chat_id"]) == CHAT_INUNDADO]
+    assert len(del_chat) - 5 > 10
+    assert {f"cliente {i}" for i in range(5)} <= set(del_chat[:6])
+
+    globales = [params["text"] for params in despues if int(params["chat_id"]) != CHAT_INUNDADO]
+    assert globales.count("masivo") > 20
+    assert globales[:25].count("cliente") == 20
+
+def test_envios_solo_se_reintentan_si_no_salieron():
+    """Un sendMessage que pudo llegar a Telegram no se repite; uno que no conectó sí"""
+    import httpx
+    from telegram.error import NetworkError, TimedOut
+
+    def fallo(error, causa):
+        try:
+            raise error from causa
+        except NetworkError as e:
+            return e
+
+    def llamar(endpoint, error):
+        planificador = PlanificadorEnvios(max_reintentos=1)
+        intentos = []
+
+        async def callback():
+            intentos.append(endpoint)
+            if len(intentos) == 1:
+                raise error
+            return True
+
+        async def probar():
+            try:
+                return await planificador.process_request(callback, (), {}, endpoint, {}, None)
+            except NetworkError:
+                return False
+
+        return asyncio.run(probar()), len(intentos)
+
+    lectura_agotada = fallo(TimedOut(), httpx.ReadTimeout("lectura"))
+    sin_conectar = fallo(NetworkError("httpx.ConnectError"), httpx.ConnectError("rechazada"))
+
+    assert llamar("sendMessage", lectura_agotada) == (False, 1)
+    assert llamar("sendMessage", sin_conectar) == (True, 2)
+    assert llamar("editMessageText", lectura_agotada) == (True, 2)
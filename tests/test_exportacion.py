@@ -0,0 +1,32 @@
+# test_exportacion.py - Formato de los pedidos exportados
+import csv
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+from exportacion import escritor_gzip
+
+COLUMNAS = ["id", "user_id", "producto", "precio", "fecha", "estado"]
+FECHA_MS = 1_717_247_100_123
+
+@pytest.mark.parametrize("formato", ["csv", "jsonl"])
+def test_fecha_se_exporta_en_iso_8601(tmp_path, formato):
+    ruta = str(tmp_path / f"pedidos.{formato}.gz")
+    filas = [(1, 10, "diamantes", 50, FECHA_MS, "pendiente"), (2, 11, "pase", 200, None, "pagado")]
+
+    assert escritor_gzip(ruta, formato)(COLUMNAS, iter(filas)) == (2, 2)
+
+    with gzip.open(ruta, "rt", encoding="utf-8", newline="") as archivo:
+        if formato == "csv":
+            exportadas = list(csv.DictReader(archivo))
+        else:
+            exportadas = [json.loads(linea) for linea in archivo]
+
+    fecha = datetime.fromisoformat(exportadas[0]["fecha"])
+    # Hora local con su desfase: el instante es exactamente el guardado
+    assert fecha.utcoffset() is not None
+    assert round(fecha.timestamp() * 1000) == FECHA_MS
+    assert exportadas[0]["fecha"] == fecha.isoformat(timespec="milliseconds")
+    assert exportadas[1]["fecha"] in ("", None)
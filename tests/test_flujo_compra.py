@@ -0,0 +1,122 @@
+# test_flujo_compra.py - Flujo de compra completo contra la Bot API falsa
+import asyncio
+
+async def _responder(api, user_id, update, chat_id=None):
+    """Entrega un update y espera el sendMessage que provoca en `chat_id`"""
+    respuesta = api.esperar_respuesta(chat_id or user_id)
+    await api.enviar_update(update)
+    return await asyncio.wait_for(respuesta, 5)
+
+def test_datos_del_cliente_se_escapan_en_markdown(bot, bucle):
+    api, main = bot.api, bot.main
+    user_id = 7001
+    sku = next(iter(main.catalogo.actual.productos.values())).skus[0]
+
+    async def comprar():
+        for update in (
+            api.callback(user_id, "hacer_pedido"),
+            api.callback(user_id, f"producto_{sku.producto}"),
+            api.callback(user_id, sku.callback),
+            api.mensaje(user_id, "12345678"),
+        ):
+            await _responder(api, user_id, update)
+        paso_5 = await _responder(api, user_id, api.mensaje(user_id, "Juan_Perez"))
+        resumen = await _responder(api, user_id, api.mensaje(user_id, "@juan_perez"))
+
+        notificacion = api.esperar_respuesta(int(main.GRUPO_PEDIDOS_ID))
+        await _responder(api, user_id, api.callback(user_id, "confirmar_si"))
+        return paso_5, resumen, await asyncio.wait_for(notificacion, 5)
+
+    paso_5, resumen, notificacion = bucle.run_until_complete(comprar())
+
+    assert "Juan\\_Perez" in paso_5["text"]
+    assert "Juan\\_Perez" in resumen["text"] and "@juan\\_perez" in resumen["text"]
+    assert "Juan\\_Perez" in notificacion["text"] and "@juan\\_perez" in notificacion["text"]
+    # La notificación lleva los botones de estado
+    assert "reply_markup" in notificacion
+
+def test_nueva_compra_desde_la_confirmacion(bot, bucle):
+    """"Nueva compra" en el último paso vuelve a empezar también la conversación"""
+    api, main = bot.api, bot.main
+    user_id = 7002
+    sku = next(iter(main.catalogo.actual.productos.values())).skus[0]
+
+    def hasta_confirmacion():
+        return [
+            api.callback(user_id, f"producto_{sku.producto}"),
+            api.callback(user_id, sku.callback),
+            api.mensaje(user_id, "12345678"),
+            api.mensaje(user_id, "Ana"),
+            api.mensaje(user_id, "+52 55 1234 5678"),
+        ]
+
+    async def comprar():
+        for update in [api.callback(user_id, "hacer_pedido")] + hasta_confirmacion():
+            await _responder(api, user_id, update)
+
+        # Empezar de nuevo desde el resumen y completar otra compra
+        reinicio = await _responder(api, user_id, api.callback(user_id, "hacer_pedido"))
+        for update in hasta_confirmacion():
+            await _responder(api, user_id, update)
+        return reinicio, await _responder(api, user_id, api.callback(user_id, "confirmar_si"))
+
+    reinicio, confirmacion = bucle.run_until_complete(comprar())
+
+    assert reinicio["text"] == main.PANTALLAS["seleccion_producto"].texto
+    assert "PEDIDO CONFIRMADO" in confirmacion["text"]
+    assert not bot.application.user_data[user_id]
+
+def test_confirmacion_repetida_solo_responde_el_callback(bot, bucle):
+    """Confirmar un pedido ya guardado no repite mensajes; su aviso pendiente sale al reiniciar"""
+    api, main = bot.api, bot.main
+    user_id = 7003
+    grupo = int(main.GRUPO_PEDIDOS_ID)
+    sku = next(iter(main.catalogo.actual.productos.values())).skus[0]
+
+    async def comprar():
+        for update in (
+            api.callback(user_id, "hacer_pedido"),
+            api.callback(user_id, f"producto_{sku.producto}"),
+            api.callback(user_id, sku.callback),
+            api.mensaje(user_id, "12345678"),
+            api.mensaje(user_id, "Ana"),
+            api.mensaje(user_id, "+52 55 1234 5678"),
+        ):
+            await _responder(api, user_id, update)
+
+        # El proceso anterior guardó el pedido y cayó antes de responder y
+        # de avisar al grupo
+        clave = bot.application.user_data[user_id].clave
+        pedido_id, _ = await main.db.guardar_pedido((
+            user_id, f"cliente{user_id}", sku.producto, sku.cantidad, "12345678",
+            "Ana", "+52 55 1234 5678", sku.precio, main.ahora_ms(), clave
+        ))
+
+        marca = len(api.enviados)
+        await api.enviar_update(api.callback(user_id, "confirmar_si"))
+        # Los updates de un usuario se atienden en orden: cuando llega la
+        # respuesta a /start la confirmación ya terminó
+        await _responder(api, user_id, api.mensaje(user_id, "/start"))
+        respuestas = [
+            (metodo, params.get("text"))
+            for metodo, params in api.enviados[marca:]
+            if metodo == "answercallbackquery" or int(params.get("chat_id", 0)) in (user_id, grupo)
+        ]
+
+        # Al arrancar se reenvían los avisos que nunca se marcaron
+        avisos = []
+        while not any(f"#{pedido_id}" in aviso["text"] for aviso in avisos):
+            aviso = api.esperar_respuesta(grupo)
+            if not avisos:
+                await main.notificar_pendientes(bot.application.bot)
+            avisos.append(await asyncio.wait_for(aviso, 5))
+        while any(fila[0] == pedido_id for fila in await main.db.obtener_pedidos_sin_notificar()):
+            await asyncio.sleep(0.01)
+        return respuestas, avisos[-1]
+
+    respuestas, aviso = bucle.run_until_complete(comprar())
+
+    assert [metodo for metodo, _ in respuestas] == ["answercallbackquery", "sendmessage"]
+    assert "PEDIDO CONFIRMADO" not in respuestas[1][1]
+    assert not bot.application.user_data[user_id]
+    assert "reply_markup" in aviso
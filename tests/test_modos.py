@@ -0,0 +1,73 @@
+# test_modos.py - Recepción de updates por polling y por webhook
+import asyncio
+import json
+
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+from fake_bot_api import SECRETO_WEBHOOK, iniciar_recepcion
+
+PUERTO_WEBHOOK = 8183
+URL_WEBHOOK = f"http://127.0.0.1:{PUERTO_WEBHOOK}/webhook"
+
+async def _ida_y_vuelta(api, user_id):
+    respuesta = api.esperar_respuesta(user_id)
+    await api.enviar_update(api.mensaje(user_id, "/start"))
+    return await asyncio.wait_for(respuesta, 5)
+
+async def _con_webhook(updater, prueba):
+    """Cambia el bot de la sesión a webhook mientras dura `prueba`"""
+    await updater.stop()
+    await iniciar_recepcion(updater, "webhook", PUERTO_WEBHOOK)
+    try:
+        return await prueba()
+    finally:
+        await updater.stop()
+        # start_polling borra el webhook de la Bot API falsa
+        await iniciar_recepcion(updater, "polling")
+
+def test_mismo_update_por_polling_y_por_webhook(bot, bucle):
+    api, updater = bot.api, bot.application.updater
+
+    async def probar():
+        por_polling = await _ida_y_vuelta(api, 7601)
+
+        async def por_webhook():
+            assert api.webhook_url == URL_WEBHOOK
+            return await _ida_y_vuelta(api, 7602)
+
+        return por_polling, await _con_webhook(updater, por_webhook)
+
+    por_polling, por_webhook = bucle.run_until_complete(probar())
+
+    assert "Hola" in por_polling["text"]
+    assert por_webhook["text"] == por_polling["text"].replace("Cliente7601", "Cliente7602")
+    assert api.webhook_url is None
+
+def test_webhook_rechaza_secreto_ausente_o_incorrecto(bot, bucle):
+    api, updater = bot.api, bot.application.updater
+    user_id = 7603
+
+    async def publicar(secreto):
+        headers = {"Content-Type": "application/json"}
+        if secreto is not None:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = secreto
+        cuerpo = api.mensaje(user_id, "/start")
+        peticion = HTTPRequest(URL_WEBHOOK, method="POST", headers=headers, body=json.dumps(cuerpo))
+        return (await AsyncHTTPClient().fetch(peticion, raise_error=False)).code
+
+    async def probar():
+        marca = len(api.enviados)
+        rechazos = [await publicar(None), await publicar("otro-secreto")]
+        # Con el secreto correcto el mismo update sí se atiende
+        respuesta = api.esperar_respuesta(user_id)
+        aceptado = await publicar(SECRETO_WEBHOOK)
+        await asyncio.wait_for(respuesta, 5)
+        a_usuario = [params for _, params in api.enviados[marca:] if int(params.get("chat_id", 0)) == user_id]
+        return rechazos, aceptado, a_usuario
+
+    rechazos, aceptado, a_usuario = bucle.run_until_complete(_con_webhook(updater, probar))
+
+    assert rechazos == [403, 403]
+    assert aceptado == 200
+    # Solo el update con el secreto correcto llegó a los handlers
+    assert len(a_usuario) == 1
@@ -0,0 +1,39 @@
+# test_persistencia.py - Restauración de sesiones y conversaciones guardadas
+import asyncio
+import json
+import pickle
+
+from checkout import Checkout, INGRESAR_ID
+from database import DatabaseManager
+from persistencia import PersistenciaSQLite
+
+def test_sesion_anterior_se_descarta_con_su_conversacion(tmp_path):
+    async def probar():
+        db = DatabaseManager(str(tmp_path / "sesiones.db"))
+        try:
+            vigente = Checkout()
+            vigente.iniciar()
+            await db.guardar_sesiones(
+                [
+                    (1, pickle.dumps({"producto": "diamantes", "id_juego": "12345678"})),
+                    (2, pickle.dumps(vigente)),
+                ],
+                [],
+                [("compra", json.dumps([1, 1]), INGRESAR_ID), ("compra", json.dumps([2, 2]), 0)],
+                []
+            )
+
+            persistencia = PersistenciaSQLite(db, tipo_user_data=Checkout)
+            user_data = await persistencia.get_user_data()
+            conversaciones = await persistencia.get_conversations("compra")
+            assert list(user_data) == [2]
+            assert conversaciones == {(2, 2): 0}
+
+            # Lo descartado también se borra de la base de datos
+            await persistencia.flush()
+            assert [user_id for user_id, _ in await db.cargar_sesiones()] == [2]
+            assert [clave for clave, _ in await db.cargar_conversaciones("compra")] == [json.dumps([2, 2])]
+        finally:
+            await db.cerrar()
+
+    asyncio.run(probar())
@@ -0,0 +1,82 @@
+# test_procesador.py - Updates concurrentes con orden por usuario
+import asyncio
+import random
+import time
+
+from telegram import Update
+
+from fake_bot_api import FakeBotAPI
+from procesador import ProcesadorPorUsuario
+
+USUARIOS = 40
+UPDATES_POR_USUARIO = 10
+DURACION_SEG = 0.002
+
+def _inundar(limite):
+    """Pasa updates intercalados de USUARIOS por el procesador.
+
+    Cada handler simula una transición de estado leer-esperar-escribir: si
+    dos updates del mismo usuario se solapan, uno de los dos se pierde.
+    """
+    api = FakeBotAPI()
+    procesador = ProcesadorPorUsuario(limite, shards=16)
+    azar = random.Random(9)
+    estados = {}
+    orden = {}
+    activos = set()
+    solapados = []
+    trabajando = 0
+    maximo = 0
+
+    async def handler(user_id, numero):
+        nonlocal trabajando, maximo
+        if user_id in activos:
+            solapados.append(user_id)
+        activos.add(user_id)
+        trabajando += 1
+        maximo = max(maximo, trabajando)
+
+        estado = estados.get(user_id, 0)
+        orden.setdefault(user_id, []).append(numero)
+        await asyncio.sleep(DURACION_SEG * azar.random())
+        estados[user_id] = estado + 1
+
+        trabajando -= 1
+        activos.discard(user_id)
+
+    # Llegadas intercaladas al azar: cada usuario conserva su orden, pero sus
+    # updates suelen llegar seguidos, como un doble toque
+    pendientes = {user_id: 0 for user_id in range(1, USUARIOS + 1)}
+    llegadas = []
+    while pendientes:
+        user_id = azar.choice(list(pendientes))
+        llegadas.append((user_id, pendientes[user_id]))
+        pendientes[user_id] += 1
+        if pendientes[user_id] == UPDATES_POR_USUARIO:
+            del pendientes[user_id]
+
+    async def procesar():
+        updates = []
+        for user_id, numero in llegadas:
+            update = Update.de_json(api.mensaje(user_id, f"paso {numero}"), None)
+            updates.append(procesador.process_update(update, handler(user_id, numero)))
+        inicio = time.perf_counter()
+        await asyncio.gather(*updates)
+        return time.perf_counter() - inicio
+
+    duracion = asyncio.run(procesar())
+    return duracion, estados, orden, solapados, maximo
+
+def test_updates_de_cada_usuario_en_orden_y_usuarios_en_paralelo():
+    duracion_serie, *_ = _inundar(1)
+    duracion, estados, orden, solapados, maximo = _inundar(16)
+
+    # Ningún update de un usuario se solapó con otro suyo ni se perdió
+    assert solapados == []
+    assert estados == {user_id: UPDATES_POR_USUARIO for user_id in range(1, USUARIOS + 1)}
+    # Y cada usuario vio sus updates en el orden de llegada
+    assert all(numeros == list(range(UPDATES_POR_USUARIO)) for numeros in orden.values())
+
+    # Entre usuarios sí hay paralelismo, sin pasar del límite
+    assert 1 < maximo <= 16
+    assert duracion < duracion_serie / 3
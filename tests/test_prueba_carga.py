@@ -0,0 +1,28 @@
+# test_prueba_carga.py - La prueba de carga completa, en pequeño
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PUERTO_API_CARGA = 8184
+
+# Corre en otro proceso: prueba_carga importa main con su propia
+# configuración y el main de esta sesión ya está atado a otra
+PROGRAMA = f"""
+import asyncio, sys
+from prueba_carga import prueba_carga
+sys.exit(0 if asyncio.run(prueba_carga(20, 20, puerto_api={PUERTO_API_CARGA}, timeout=10)) else 1)
+"""
+
+def test_prueba_carga_guarda_todos_los_pedidos(tmp_path):
+    # Desde otro directorio y sin CATALOGO_PATH: nada depende del cwd
+    entorno = {variable: valor for variable, valor in os.environ.items() if variable != "CATALOGO_PATH"}
+    entorno["PYTHONPATH"] = RAIZ
+    resultado = subprocess.run(
+        [sys.executable, "-c", PROGRAMA], cwd=tmp_path, env=entorno,
+        capture_output=True, text=True, timeout=120
+    )
+
+    assert resultado.returncode == 0, resultado.stdout + resultado.stderr
+    assert "flujos completos: 20/20" in resultado.stdout
+    assert "pedidos guardados: 20 (confirmados: 20)" in resultado.stdout
@@ -0,0 +1,132 @@
+# trazas.py - Trazas muestreadas por update escritas en un archivo rotativo
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# (traza, id del tramo abierto) del update en curso; None si no se muestrea
+_tramo_actual = ContextVar("tramo_actual", default=None)
+
+class _Traza:
+    __slots__ = ("id", "salida", "siguiente")
+
+    def __init__(self, salida):
+        self.id = os.urandom(8).hex()
+        self.salida = salida
+        self.siguiente = 0
+
+    def nuevo_tramo(self):
+        self.siguiente += 1
+        return self.siguiente
+
+class tramo:
+    """Mide un paso dentro de la traza del update en curso.
+
+    Fuera de un update muestreado no hace nada: el coste es leer una
+    ContextVar. Las tareas creadas dentro del tramo heredan la traza, así
+    un envío en segundo plano queda colgado del handler que lo encoló.
+    """
+
+    __slots__ = ("nombre", "atributos", "traza", "padre", "id", "token", "inicio", "reloj")
+
+    def __init__(self, nombre, **atributos):
+        self.nombre = nombre
+        self.atributos = atributos
+        self.traza = None
+
+    def __enter__(self):
+        actual = _tramo_actual.get()
+        if actual is None:
+            return self
+        self.traza, self.padre = actual
+        self.id = self.traza.nuevo_tramo()
+        self.token = _tramo_actual.set((self.traza, self.id))
+        self.inicio = time.time()
+        self.reloj = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traceback):
+        if self.traza is None:
+            return False
+        duracion = time.perf_counter() - self.reloj
+        _tramo_actual.reset(self.token)
+        error = tipo.__name__ if tipo is not None else None
+        self.traza.salida(self.traza.id, self.id, self.padre, self.nombre, self.inicio, duracion, error, self.atributos)
+        return False
+
+# =====================================================
+# TRAZADOR
+# =====================================================
+class Trazador:
+    """Decide qué updates se trazan y escribe sus tramos.
+
+    Con probabilidad `muestreo` un update abre una traza; cada tramo que
+    termina se escribe como una línea JSON en `ruta`, que rota al llegar a
+    `max_bytes` conservando `copias` archivos. El event loop solo encola la
+    línea: un hilo de logging hace la escritura. Con `muestreo` 0 no se
+    abre ningún archivo.
+    """
+
+    def __init__(self, ruta="trazas.jsonl", muestreo=0.0, max_bytes=10 * 1024 * 1024, copias=3):
+        self.ruta = ruta
+        self.muestreo = max(0.0, min(1.0, muestreo))
+        self.max_bytes = max_bytes
+        self.copias = copias
+        self._cola = queue.SimpleQueue()
+        self._oyente = None
+
+    def iniciar(self):
+        if self.muestreo <= 0 or self._oyente is not None:
+            return
+        archivo = logging.handlers.RotatingFileHandler(
+            self.ruta, maxBytes=self.max_bytes, backupCount=self.copias, encoding="utf-8", delay=True
+        )
+        archivo.setFormatter(logging.Formatter("%(message)s"))
+        self._oyente = logging.handlers.QueueListener(self._cola, archivo)
+        self._oyente.start()
+        logger.info(f"Trazando el {self.muestreo:.1%} de los updates en {self.ruta}")
+
+    def detener(self):
+        if self._oyente is not None:
+            self._oyente.stop()
+            for handler in self._oyente.handlers:
+                handler.close()
+            self._oyente = None
+
+    def _escribir(self, traza_id, tramo_id, padre, nombre, inicio, duracion, error, atributos):
+        linea = {
+            "traza": traza_id,
+            "tramo": tramo_id,
+            "padre": padre,
+            "nombre": nombre,
+            "inicio": round(inicio, 6),
+            "ms": round(duracion * 1000, 3),
+        }
+        if error is not None:
+            linea["error"] = error
+        if atributos:
+            linea.update(atributos)
+        # Directo a la cola del QueueListener: no pasa por los niveles ni los
+        # filtros del logging del bot
+        self._cola.put_nowait(logging.makeLogRecord({"msg": json.dumps(linea, ensure_ascii=False, default=str)}))
+
+    @contextmanager
+    def traza(self, nombre, **atributos):
+        """Abre la traza de un update si sale en el muestreo"""
+        if self._oyente is None or random.random() >= self.muestreo:
+            yield
+            return
+
+        token = _tramo_actual.set((_Traza(self._escribir), None))
+        try:
+            with tramo(nombre, **atributos):
+                yield
+        finally:
+            _tramo_actual.reset(token)